@@ -1,16 +1,18 @@
 import os
 import numpy as np
 import pandas as pd
-import matplotlib
-import matplotlib.pyplot as plt
-import streamlit as st
 
-import helpers as h
+import engine as e
+import cache as c
+import store as s
+import tables as t
+import persistence
+import tracing
 
-import utils as u
 from config.config import *
 
 class LCA:
+	@tracing.traced()
 	def __init__(self, df_vehicles, df_areas, df_income_groups, veh_names, area, year, income_group, custom_discount_rate=None):
 		self.df_vehicles = df_vehicles
 		self.df_areas = df_areas
@@ -42,74 +44,47 @@ class LCA:
 		self.lifetime_mileage = self.annual_mileage * self. lifetime
 		
 		self.lifetime = round(self.lifetime, 2)
-		self.lifetime_range = list(range(int(np.floor(self.lifetime))+1))
-		if int(self.lifetime) != self.lifetime: #if lifetime is an even number, we do not need to add another element to self.lifetime_range
-			self.lifetime_range += [self.lifetime]
+		self.lifetime_range = e.get_lifetime_range(self.lifetime)
 		# print(self.annual_mileage,self.lifetime,self.lifetime_mileage)
 		
 		# filename = "{0:s}_{1:s}_area={2:s}_{3:d}_cps={4:s}.png".format(str(df.loc[veh_name, "regulatory_class"]), category, area, year)
 		
-		self.times = ["pre-purchase", *self.lifetime_range, "post-use"]
-		self.columns = [
-							"time [yr]", "time (for plotting) [yr]", #only needed for calculations, the actual time is in the index
-							"mileage [mi]", "total mileage [mi]", 
-							"purchase costs [$]", "total purchase costs [$]", 
-							"incentives costs [$]", "total incentives costs [$]", 
-							"operations costs [$]", "total operations costs [$]", 
-							"insurance costs [$]", "total insurance costs [$]", 
-							"maintenance costs [$]", "total maintenance costs [$]", 
-							"costs [$]", "total costs [$]", 
-							"future costs [$]", "total future costs [$]", #everything but purchase costs
-							"present value purchase costs [$]", "total present value purchase costs [$]", 
-							"present value incentives costs [$]", "total present value incentives costs [$]", 
-							"present value operations costs [$]", "total present value operations costs [$]", 
-							"present value insurance costs [$]", "total present value insurance costs [$]", 
-							"present value maintenance costs [$]", "total present value maintenance costs [$]", 
-							"present value costs [$]", "total present value costs [$]", 
-							"present value future costs [$]", "total present value future costs [$]", 
-							"emissions [tCO$_2$-eq.]", "total emissions [tCO$_2$-eq.]"
-			]
+		self.times = e.get_times(self.lifetime)
+		self.columns = list(e.columns)
 		
 		#define subsets of the columns
-		self.non_total_columns = [col for col in self.columns if not "total" in col and "time" not in col]
-		self.total_columns = [col for col in self.columns if "total" in col]
-		self.non_total_undiscounted_cost_columns = [col for col in self.columns if "cost" in col and "total" not in col and "present value" not in col]
-		self.non_total_discounted_cost_columns = [col for col in self.columns if "cost" in col and "total" not in col and "present value" in col]
-		self.costs_columns = [col for col in self.columns if "costs" in col]
-		self.emissions_columns = [col for col in self.columns if "emissions" in col]
-		
-		#initialize results dataframe
-		df_results = pd.DataFrame(index=self.times, columns=self.columns)
-		df_results.index.name = "period [yr]"
-		
-		#set contributions in pre-purchase and post-use phase
-		df_results.loc["pre-purchase"] = 0
-		df_results.loc["post-use", self.non_total_columns] = 0
-		
-		#prepare time helper column
-		df_results["time [yr]"] = df_results.index
-		df_results.loc["pre-purchase", "time [yr]"] = 0
-		df_results.loc["post-use", "time [yr]"] = df_results.iloc[-2].name
-		df_results["time (for plotting) [yr]"] = df_results.index
-		df_results.loc["pre-purchase", "time (for plotting) [yr]"] = -0.1*self.lifetime
-		df_results.loc["post-use", "time (for plotting) [yr]"] = 1.1*self.lifetime
-		
-		#fill in mileage column
-		df_results.loc[0, "mileage [mi]"] = 0
-		df_results.loc[self.lifetime_range[1:], "mileage [mi]"] = df_results["time [yr]"].diff() * self.annual_mileage
+		self.non_total_columns = list(e.non_total_columns)
+		self.total_columns = list(e.total_columns)
+		self.non_total_undiscounted_cost_columns = list(e.non_total_undiscounted_cost_columns)
+		self.non_total_discounted_cost_columns = list(e.non_total_discounted_cost_columns)
+		self.costs_columns = list(e.costs_columns)
+		self.emissions_columns = list(e.emissions_columns)
 		
+		self.inputs_hash = c.get_inputs_hash(self.df_vehicles, self.df_areas, self.df_income_groups)
 		self.results = dict()
-		self.results_fns = dict()
+		self.results_keys = dict()
 		for veh_name in self.veh_names:
-			self.results[veh_name] = df_results.copy()
-			self.results_fns[veh_name] = "veh_name={0:s}_".format(veh_name.replace("/","-")) + h.get_fn(area, year, income_group, custom_discount_rate) + ".csv" #results filenames
+			self.results[veh_name] = None
+			self.results_keys[veh_name] = c.get_key(self.inputs_hash, "individual vehicle", veh_name, area, year, income_group, custom_discount_rate) #results cache keys
 	
+	@tracing.traced()
 	def retrieve_results(self):
+		veh_names_to_run = []
 		for veh_name in self.veh_names:
-			if os.path.isfile("results/"+"individual vehicle names/"+self.results_fns[veh_name]) and self.custom_discount_rate is None: #never read results when discount rate is custom, instead run new (otherwise would have to store result files for all possible discount rates (0%, 1%, 2%, ..., 25%)
-				self.read_results(veh_name)
-			else:
-				self.run(veh_name)
+			self.results[veh_name] = c.results_cache.get(self.results_keys[veh_name], count_miss=False) #cached per exact (custom) discount rate, a miss is counted by the re-check below
+			if self.results[veh_name] is None:
+				veh_names_to_run.append(veh_name)
+		if len(veh_names_to_run) == 0:
+			return
+		with c.results_cache.computing(*[self.results_keys[veh_name] for veh_name in veh_names_to_run]): #other sessions requesting the same results wait for them instead of computing them again
+			for veh_name in veh_names_to_run:
+				self.results[veh_name] = c.results_cache.get(self.results_keys[veh_name]) #retrieved by another session in the meantime
+			veh_names_to_run = [veh_name for veh_name in veh_names_to_run if self.results[veh_name] is None]
+			if len(veh_names_to_run) > 0:
+				self.read_all(veh_names_to_run)
+				veh_names_to_run = [veh_name for veh_name in veh_names_to_run if self.results[veh_name] is None]
+			if len(veh_names_to_run) > 0:
+				self.run_all(veh_names_to_run)
 	
 	def mi2yr(self, miles):
 		return miles/self.annual_mileage
@@ -118,117 +93,68 @@ class LCA:
 		return years*self.annual_mileage
 	
 	def get_fuel_cost_per_mile(self, veh_name):
-		if self.df_vehicles.loc[veh_name, "powertrain_type"] == "ICEV":
-			fuel_cost_per_mile = self.df_areas.loc[self.area, "gas_price %d [$/gal]"%self.year] / self.df_vehicles.loc[veh_name, "real-world mpg [mi/gal]"]
-		elif self.df_vehicles.loc[veh_name, "powertrain_type"] == "EV":
-			fuel_cost_per_mile = (0.01*((1-p_DCFC)*self.df_areas.loc[self.area, "electricity_price %d [ct/kWh]"%(self.year-1)] + p_DCFC*self.df_areas.loc["DCFC", "electricity_price %d [ct/kWh]"%(self.year-1)]) * self.df_vehicles.loc[veh_name, "energy use [kWh/mi]"])
-		return fuel_cost_per_mile
+		return self.get_params([veh_name])["fuel cost per mile [$/mi]"][0]
 	
 	def get_monthly_insurance_cost(self, veh_name):
-		#area and model dependency to be added later
-		if self.df_vehicles.loc[veh_name, "powertrain_type"] == "ICEV":
-			monthly_insurance_cost = 149
-		elif self.df_vehicles.loc[veh_name, "powertrain_type"] == "EV":
-			monthly_insurance_cost = 157
-		return monthly_insurance_cost
+		return self.get_params([veh_name])["monthly insurance cost [$]"][0]
 	
 	def get_maintenance_cost_per_mile(self, veh_name):
-		#area and model dependency to be added later
-		if self.df_vehicles.loc[veh_name, "powertrain_type"] == "ICEV":
-			maintenance_cost_per_mile = 0.101
-		elif self.df_vehicles.loc[veh_name, "powertrain_type"] == "EV":
-			maintenance_cost_per_mile = 0.061
-		return maintenance_cost_per_mile
+		return self.get_params([veh_name])["maintenance cost per mile [$/mi]"][0]
 	
 	def get_emissions_per_mile(self, veh_name):
-		if self.df_vehicles.loc[veh_name, "powertrain_type"] == "ICEV":
-			emissions_per_mile = self.df_vehicles.loc[veh_name, "real-world CO2 emissions [g/mi]"]
-		elif self.df_vehicles.loc[veh_name, "powertrain_type"] == "EV":
-			emissions_per_mile = self.df_vehicles.loc[veh_name, "energy use [kWh/mi]"] * self.df_areas.loc[self.area, "electricity_emission_intensity 2021 [g/kWh]"] / eff_charging
-		return emissions_per_mile*1e-6 #g to t conversion
+		return self.get_params([veh_name])["emissions per mile [t/mi]"][0]
 	
-	def run(self, veh_name):
-		results_df = self.results[veh_name].copy()
-		
-		#purchase cost
-		results_df.loc[0, "purchase costs [$]"] = self.df_vehicles.loc[veh_name, "average transaction price [$]"]
-		
-		#incentives
-		if self.df_vehicles.loc[veh_name, "powertrain_type"] == "EV": #apply federal EV tax credit
-			# results_df.loc[1, "incentives costs [$]"] = -7500
-			results_df.loc[1, "incentives costs [$]"] = - self.df_income_groups.loc[self.income_group, "maximum benefit from federal $7,500 EV tax credit"]
-		
-		#calculate O&M costs
-		results_df["operations costs [$]"] = results_df["time [yr]"].diff() * self.annual_mileage * self.get_fuel_cost_per_mile(veh_name)
-		results_df["insurance costs [$]"] = results_df["time [yr]"].diff() * self.get_monthly_insurance_cost(veh_name)*12
-		results_df["maintenance costs [$]"] = results_df["time [yr]"].diff() * self.annual_mileage * self.get_maintenance_cost_per_mile(veh_name)
-		
-		#sum up costs
-		results_df["costs [$]"] = results_df[[	"purchase costs [$]", 
-												"incentives costs [$]",
-												"operations costs [$]",
-												"insurance costs [$]", 
-												"maintenance costs [$]"]].sum(axis=1)
-		results_df["future costs [$]"] = results_df[[	"incentives costs [$]",
-														"operations costs [$]",
-														"insurance costs [$]", 
-														"maintenance costs [$]"]].sum(axis=1)
-		
-		#discount costs
-		for col in self.non_total_undiscounted_cost_columns:
-			results_df["present value "+col] = results_df[col] / (1 + self.discount_rate)**results_df["time [yr]"]
-		
-		#calculate emissions
-		results_df["emissions [tCO$_2$-eq.]"] = results_df["time [yr]"].diff() * self.annual_mileage * self.get_emissions_per_mile(veh_name)
-		results_df.loc["pre-purchase", "emissions [tCO$_2$-eq.]"] = 0
-		results_df.loc[0, "emissions [tCO$_2$-eq.]"] = self.df_vehicles.loc[veh_name, "production CO2 footprint [g]"] * 1e-6
-		
-		#cumulative costs/emissions
-		for col in self.non_total_columns:
-			results_df["total "+col] = results_df[col].cumsum()
-		
-		#round costs and emissions
-		results_df = results_df.convert_dtypes()
-		results_df[self.costs_columns] = results_df[self.costs_columns].replace(pd.NA, np.nan).round(0)
-		results_df[self.emissions_columns] = results_df[self.emissions_columns].replace(pd.NA, np.nan).round(2)
-		
-		#write results_df into self.results[veh_name]
-		self.results[veh_name] = results_df.copy()
+	def get_params(self, veh_names):
+		""" Get the parameters of the given vehicles as needed by engine.run """
+		tables = t.get_tables(self.df_vehicles, self.df_areas, self.df_income_groups, self.inputs_hash) #compiled once per version of the input data
+		return e.get_params(self.df_vehicles, self.df_areas, self.df_income_groups, veh_names, self.area, self.year, self.income_group, self.custom_discount_rate, tables)
+	
+	@tracing.traced()
+	def run_all(self, veh_names):
+		""" Calculate the results of several vehicles at once in one batch of the vectorized engine """
+		results = e.run(self.get_params(veh_names))
+		is_EV = [self.df_vehicles.loc[veh_name, "powertrain_type"] == "EV" for veh_name in veh_names]
+		for i,veh_name in enumerate(veh_names):
+			self.results[veh_name] = e.get_results(results[i], self.lifetime, is_EV[i])
+			c.results_cache.put(self.results_keys[veh_name], self.results[veh_name], write=c.write_to_disk(self.custom_discount_rate))
 		
-		#save results
-		self.results[veh_name].to_csv("results/"+"individual vehicle names/"+self.results_fns[veh_name])
+		#save results (all vehicles in one file of the result store), according to the persistence policy
+		persistence.submit(s.write_vehicle_results, results.copy(), [self.results_keys[veh_name] for veh_name in veh_names], veh_names, is_EV, self.area, self.year, self.income_group, self.custom_discount_rate, self.lifetime)
+	
+	def run(self, veh_name):
+		self.run_all([veh_name])
+	
+	@tracing.traced()
+	def read_all(self, veh_names):
+		""" Read the results of several vehicles from the result store at once (results that are not stored remain None) """
+		stored = s.read_vehicle_results([self.results_keys[veh_name] for veh_name in veh_names], self.area, self.year)
+		for veh_name in veh_names:
+			if self.results_keys[veh_name] in stored:
+				self.results[veh_name] = stored[self.results_keys[veh_name]]
+				c.results_cache.put(self.results_keys[veh_name], self.results[veh_name], write=False)
 	
 	def read_results(self, veh_name):
-		self.results[veh_name] = pd.read_csv("results/"+"individual vehicle names/"+self.results_fns[veh_name], index_col="period [yr]")
+		self.read_all([veh_name])
 	
+	@tracing.traced()
 	def plot_results(self, y_quant, save_figure=False):
-		fig,ax = plt.subplots(figsize=(8,6))
+		from matplotlib.figure import Figure
+		from matplotlib.backends.backend_agg import FigureCanvasAgg
+		import utils as u
+		
+		#a figure of its own that is not registered with pyplot, whose global state is not thread-safe (and which would keep every figure open)
+		fig = Figure(figsize=(8,6))
+		FigureCanvasAgg(fig)
+		ax = fig.add_subplot()
 		
 		for veh_name in self.veh_names:
 			x = self.results[veh_name]["time (for plotting) [yr]"]
 			y = self.results[veh_name][y_quant]
-			x = x.to_numpy() #if this is not done, then plotting on the first run (without reading the results from an existing file fails due to some value/datatype error)
-			y = y.to_numpy()
 			u.plot(x, y, frame=[fig,ax], kind="plot", label=self.df_vehicles.loc[veh_name, "label"], color=self.df_vehicles.loc[veh_name, "color"], lw=self.df_vehicles.loc[veh_name, "lw"], marker_option=self.df_vehicles.loc[veh_name, "marker_option"], zorder=self.df_vehicles.loc[veh_name, "zorder"], ls="-", alpha=1.)
 		
 		#figure setup
-		textstr = "%s, %d"%(self.area, self.year)
-		if "costs" in y_quant:
-			textstr += "\ngas = {0:.2f} $/gal\nelectricity = {1:.1f} ct/kWh".format(self.df_areas.loc[self.area, "gas_price %d [$/gal]"%self.year], self.df_areas.loc[self.area, "electricity_price %d [ct/kWh]"%(self.year-1)])
-		if y_quant in ["costs [$]", "total costs [$]", "present value costs [$]", "total present value costs [$]"]:
-			ylabel = "Lifecycle costs [$]"
-			ylim   = (0, max(85000, 1.05*ax.get_ylim()[1]))
-			ylim   = (0.8*min([self.df_vehicles.loc[veh_name, "average transaction price [$]"] for veh_name in self.veh_names]), max(85000, 1.05*ax.get_ylim()[1]))
-			# ylim   = (40000,75000)
-		elif "emissions" in y_quant:
-			ylabel = "Lifecycle emissions [tCO$_2$-eq.]"
-			ylim   = (0, max(51, 1.02*ax.get_ylim()[1]))
-			# ylim   = (0,54)
-			textstr += "\nelectricity emission intensity = {0:.0f} g/kWh".format(self.df_areas.loc[self.area, "electricity_emission_intensity 2021 [g/kWh]"])
-		else:
-			ylabel = y_quant
-			ylim = None #ax.get_ylim()
-		
+		textstr = self.get_plot_textstr(y_quant)
+		ylim = self.get_plot_ylim(y_quant, ax.get_ylim()[1])
 		ylabel = y_quant
 
 		props = dict(boxstyle="round", facecolor="white", alpha=0.8)
@@ -248,9 +174,20 @@ class LCA:
 					)
 		if False: #len(self.veh_names)==4:
 			#specify order of items in legend
-			handles, labels = plt.gca().get_legend_handles_labels()
+			handles, labels = ax.get_legend_handles_labels()
 			order = [2,3,0,1]
 			ax.legend([handles[idx] for idx in order],[labels[idx] for idx in order], loc="upper left")
+		self.setup_plot_xaxis(ax)
+		
+		if save_figure:
+			u.save_figure(fig, "plots/"+"line plots/"+y_quant+"/"+self.get_plot_fn()+".png", dpi=300)
+		
+		return fig
+	
+	def setup_plot_xaxis(self, ax):
+		""" Set up the x-axis (or axes) of line plots, in years and/or miles (see xaxis in config/config.py) """
+		import matplotlib
+		
 		if xaxis == "years":
 			ax.set_xlabel("Years")
 			# ax.set_xticks(self.lifetime_range)
@@ -279,22 +216,47 @@ class LCA:
 			# if xtick_old < 0 or xtick_old > self.lifetime_mileage:
 			if xtick_old < 0 or xtick_old >= self.lifetime:
 				xticks[i].set_visible(False)
-		
-		if save_figure:
-			if len(self.veh_names) == 2:
-				if self.veh_names[0].replace("ICEV", "BEV") == self.veh_names[1]:
-					fn = self.veh_names[0].replace(" ICEV", "").replace("/","-")
-				elif self.veh_names[0]=="Toyota Corolla ICEV" and self.veh_names[1]=="Chevrolet Bolt BEV":
-					fn = "affordable sedan"
-			else:
-				fn = "some vehicles"
-			fn += "_" + h.get_fn(self.area, self.year, self.income_group, self.custom_discount_rate)
-			
-			u.save_figure(fig, "plots/"+"line plots/"+y_quant+"/"+fn+".png", dpi=300)
+	
+	def get_plot_textstr(self, y_quant):
+		""" Get the annotation of line plots of y_quant (scenario and relevant inputs) """
+		textstr = "%s, %d"%(self.area, self.year)
+		if "costs" in y_quant:
+			textstr += "\ngas = {0:.2f} $/gal\nelectricity = {1:.1f} ct/kWh".format(self.df_areas.loc[self.area, "gas_price %d [$/gal]"%self.year], self.df_areas.loc[self.area, "electricity_price %d [ct/kWh]"%(self.year-1)])
+		if "emissions" in y_quant:
+			textstr += "\nelectricity emission intensity = {0:.0f} g/kWh".format(self.df_areas.loc[self.area, "electricity_emission_intensity 2021 [g/kWh]"])
+		return textstr
+	
+	def get_plot_ylim(self, y_quant, ymax):
+		""" Get the y-axis limits of line plots of y_quant, given the upper limit ymax of the automatically scaled y-axis (None to keep the automatic limits) """
+		if y_quant in ["costs [$]", "total costs [$]", "present value costs [$]", "total present value costs [$]"]:
+			ylim   = (0, max(85000, 1.05*ymax))
+			ylim   = (0.8*min([self.df_vehicles.loc[veh_name, "average transaction price [$]"] for veh_name in self.veh_names]), max(85000, 1.05*ymax))
+			# ylim   = (40000,75000)
+		elif "emissions" in y_quant:
+			ylim   = (0, max(51, 1.02*ymax))
+			# ylim   = (0,54)
+		else:
+			ylim = None #ax.get_ylim()
+		return ylim
+	
+	def get_plot_fn(self):
+		""" Get the filename (without directory and extension) of line plots of the vehicles in this scenario """
+		if len(self.veh_names) == 2:
+			if self.veh_names[0].replace("ICEV", "BEV") == self.veh_names[1]:
+				fn = self.veh_names[0].replace(" ICEV", "").replace("/","-")
+			elif self.veh_names[0]=="Toyota Corolla ICEV" and self.veh_names[1]=="Chevrolet Bolt BEV":
+				fn = "affordable sedan"
+		else:
+			fn = "some vehicles"
+		import helpers as h
+		fn += "_" + h.get_fn(self.area, self.year, self.income_group, self.custom_discount_rate)
+		return fn
 	
 	def get_results(self, veh_name, show_non_total_columns=True, show_time_columns=False):
-		excl_cols = pd.Series(False, index=self.results[veh_name].columns) if show_time_columns else self.results[veh_name].columns.isin(["time [yr]", "time (for plotting) [yr]"]) #hack
+		""" Get the results of a vehicle as a DataFrame (for display) """
+		df_results = self.results[veh_name].to_dataframe()
+		excl_cols = pd.Series(False, index=df_results.columns) if show_time_columns else df_results.columns.isin(["time [yr]", "time (for plotting) [yr]"]) #hack
 		if show_non_total_columns:
-			return self.results[veh_name].loc[:, ~excl_cols]
+			return df_results.loc[:, ~excl_cols]
 		else:
-			return self.results[veh_name].loc[:, ~excl_cols][self.total_columns]
+			return df_results.loc[:, ~excl_cols][self.total_columns]
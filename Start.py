@@ -1,6 +1,9 @@
 import streamlit as st
 import pandas as pd
 
+import inputs
+import cache as c
+
 
 st.set_page_config(
 		page_title="Life Cycle Assessment of Different Vehicles",
@@ -13,14 +16,19 @@ st.set_page_config(
 
 @st.cache_data()
 def get_data():
-	df_vehicles      = pd.read_excel("data/vehicle_types.xlsx", index_col="name")
-	df_areas         = pd.read_excel("data/areas.xlsx", index_col="area")
-	df_income_groups = pd.read_excel("data/income_groups.xlsx", index_col="household income group")
+	df_vehicles,df_areas,df_income_groups = inputs.load_inputs() #from the precompiled snapshot if it is up to date, otherwise from the Excel workbooks
 	
 	return df_vehicles,df_areas,df_income_groups
 
 df_vehicles,df_areas,df_income_groups = get_data()
 
+@st.cache_resource(show_spinner="Preparing the results of all scenarios...")
+def get_results_cube(inputs_hash):
+	import helpers as h
+	return h.get_results_cube(df_vehicles, df_areas, df_income_groups) #shared by all sessions, the selections in the pages are slices of it (other areas are computed on demand)
+
+results_cube = get_results_cube(c.get_inputs_hash(df_vehicles, df_areas, df_income_groups))
+
 def main():
 	# application architecture
 	st.sidebar.title("Vehicle total costs of ownership tool 🚗🚙🚐")
@@ -0,0 +1,163 @@
+"""
+Command line batch runner: computes the results and generates the figures for
+all selected scenarios, spread over a pool of worker processes.
+
+The results of all scenarios are computed in one vectorized batch and written
+to the result store (see store.py). Figures are generated by tasks (one per
+output kind and scenario) that run in parallel. Every finished task is
+recorded in a manifest, so that an interrupted run continues where it
+stopped when started again (tasks depend on the input data, so all of them
+run again after it changed). Examples:
+
+	python batch.py
+	python batch.py --areas U.S. WA --years 2022 --discount-rates default 2% 15% --outputs waterfalls
+	python batch.py --veh-types Sedan Pickup --outputs "line plots" --processes 4
+"""
+
+import os
+import sys
+import time
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import cache as c
+import inputs
+
+from config.config import *
+
+
+output_kinds = ["results", "line plots", "waterfalls"]
+y_quants_default = ["total present value costs [$]"]
+plot_directories = ["plots/line plots/", "plots/waterfalls/one_either/", "plots/waterfalls/one_both/", "plots/waterfalls/all_either/"]
+manifest_fn_default = "plots/batch_manifest.txt"
+
+
+def get_parser():
+	parser = argparse.ArgumentParser(description="Compute results and generate figures for many scenarios in parallel.")
+	parser.add_argument("--areas", nargs="+", default=areas, help="areas (default: %(default)s)")
+	parser.add_argument("--years", nargs="+", type=int, default=years, help="years (default: %(default)s)")
+	parser.add_argument("--income-groups", nargs="+", default=income_groups, help="household income groups (default: all)")
+	parser.add_argument("--discount-rates", nargs="+", default=["default"], help='discount rates, "default" for the income group-specific ones, or e.g. "5%%" (default: %(default)s)')
+	parser.add_argument("--veh-types", nargs="+", default=list(veh_names_pairs_dict.keys()), help="vehicle types, see veh_names_pairs_dict (default: all)")
+	parser.add_argument("--outputs", nargs="+", default=output_kinds, choices=output_kinds, help="outputs to generate (default: all)")
+	parser.add_argument("--y-quants", nargs="+", default=y_quants_default, help="quantities to show in line plots (default: %(default)s)")
+	parser.add_argument("--formats", nargs="+", default=["png"], help="file formats of line plots, e.g. png svg (default: %(default)s)")
+	parser.add_argument("--processes", type=int, default=os.cpu_count(), help="number of worker processes (default: number of CPUs)")
+	parser.add_argument("--manifest", default=manifest_fn_default, help="file recording the finished tasks (default: %(default)s)")
+	parser.add_argument("--force", action="store_true", help="run all tasks, also the ones that finished before")
+	return parser
+
+def get_custom_discount_rate(discount_rate):
+	""" Convert a discount rate given on the command line ("default" or e.g. "5%") to a custom discount rate (None for the defaults) """
+	return None if discount_rate == "default" else float(discount_rate.rstrip("%"))/100
+
+def get_tasks(args):
+	""" Get all figure tasks (output kind, area, year, income group, custom discount rate) """
+	tasks = []
+	for kind in args.outputs:
+		if kind == "results":
+			continue
+		for area in args.areas:
+			for year in args.years:
+				for income_group in args.income_groups:
+					for discount_rate in args.discount_rates:
+						tasks.append((kind, area, year, income_group, get_custom_discount_rate(discount_rate)))
+	return tasks
+
+def get_task_key(inputs_hash, task, args):
+	return c.get_key(inputs_hash, "batch task", *task, args.veh_types, args.y_quants, args.formats)
+
+def read_manifest(manifest_fn):
+	if not os.path.isfile(manifest_fn):
+		return set()
+	with open(manifest_fn) as f:
+		return set(line.strip() for line in f)
+
+def init_worker():
+	import matplotlib
+	matplotlib.use("Agg") #no display in worker processes
+	import config.init
+	config.init.run()
+
+def run_task(task, veh_types, y_quants, formats):
+	""" Generate the figures of one task (in a worker process), returns the export counts of the waterfalls (see export.batch, None for other tasks) """
+	import helpers as h
+	import lineplots
+	from LCA import LCA
+
+	kind, area, year, income_group, custom_discount_rate = task
+	df_vehicles,df_areas,df_income_groups = inputs.get_inputs()
+	exported = None
+	if kind == "line plots":
+		for veh_type in veh_types:
+			lca = LCA(df_vehicles, df_areas, df_income_groups, veh_names_pairs_dict[veh_type], area, year, income_group, custom_discount_rate)
+			lca.retrieve_results()
+			lineplots.save_line_plots(lca, y_quants, formats) #reuses one figure per layout within the worker
+	elif kind == "waterfalls":
+		import export
+		with export.batch(n_workers=1) as exported: #render all figures of the task in one session of the renderer
+			for veh_type in veh_types:
+				for show_PV in [0,1]:
+					h.plot_waterfall_one_either(veh_type, area, year, income_group, custom_discount_rate, show_PV, save_figure=True)
+				h.plot_waterfall_one_both(veh_type, area, year, income_group, custom_discount_rate, save_figure=True)
+			for show_PV in [0,1]:
+				h.plot_waterfall_all_either(veh_types, area, year, income_group, custom_discount_rate, show_PV, save_figure=True)
+	return exported
+
+def format_task(task):
+	kind, area, year, income_group, custom_discount_rate = task
+	return "{0:s}: {1:s}, {2:d}, {3:s}, discount rate={4:s}".format(kind, area, year, income_group, "default" if custom_discount_rate is None else "{0:g}%".format(custom_discount_rate*100))
+
+def main(argv=None):
+	args = get_parser().parse_args(argv)
+	unknown_veh_types = [veh_type for veh_type in args.veh_types if veh_type not in veh_names_pairs_dict]
+	if len(unknown_veh_types) > 0:
+		print("unknown vehicle types: " + ", ".join(unknown_veh_types))
+		return 2
+	custom_discount_rates = [get_custom_discount_rate(discount_rate) for discount_rate in args.discount_rates]
+
+	t0 = time.time()
+	df_vehicles,df_areas,df_income_groups = inputs.load_inputs() #also (re)builds the input snapshot before the workers read it
+	inputs_hash = c.get_inputs_hash(df_vehicles, df_areas, df_income_groups)
+
+	#results of all scenarios in one batch
+	if "results" in args.outputs:
+		import store
+		store.build(df_vehicles, df_areas, df_income_groups, args.areas, args.years, args.income_groups, custom_discount_rates)
+		store.build_cube(df_vehicles, df_areas, df_income_groups) #all scenarios offered in the app, served to the pages
+		print("results: {0:d} scenarios written to the result store ({1:.1f} s)".format(len(args.areas)*len(args.years)*len(args.income_groups)*len(custom_discount_rates), time.time()-t0))
+
+	#figures, in parallel
+	tasks = get_tasks(args)
+	done = set() if args.force else read_manifest(args.manifest)
+	tasks_to_run = [task for task in tasks if get_task_key(inputs_hash, task, args) not in done]
+	if len(tasks) == 0:
+		return 0
+	print("figures: {0:d} tasks, {1:d} finished before, {2:d} to run on {3:d} processes".format(len(tasks), len(tasks)-len(tasks_to_run), len(tasks_to_run), args.processes))
+	for directory in plot_directories:
+		os.makedirs(directory, exist_ok=True)
+	os.makedirs(os.path.dirname(args.manifest) or ".", exist_ok=True)
+
+	n_failed = 0
+	with open(args.manifest, "a") as manifest, ProcessPoolExecutor(max_workers=args.processes, mp_context=multiprocessing.get_context("spawn"), initializer=init_worker) as executor:
+		futures = {executor.submit(run_task, task, args.veh_types, args.y_quants, args.formats): task for task in tasks_to_run}
+		for i,future in enumerate(as_completed(futures)):
+			task = futures[future]
+			try:
+				exported = future.result()
+			except Exception as exception:
+				n_failed += 1
+				print("[{0:d}/{1:d}] failed: {2:s} ({3:s})".format(i+1, len(tasks_to_run), format_task(task), repr(exception)))
+				continue
+			manifest.write(get_task_key(inputs_hash, task, args)+"\n") #written only by this process, so no locking needed
+			manifest.flush()
+			counts = "" if exported is None else ", exported {0:d} figures, {1:d} unchanged skipped".format(exported.n_rendered, exported.n_skipped)
+			print("[{0:d}/{1:d}] {2:s} ({3:.1f} s{4:s})".format(i+1, len(tasks_to_run), format_task(task), time.time()-t0, counts))
+
+	print("finished in {0:.1f} s".format(time.time()-t0) + ("" if n_failed == 0 else ", {0:d} tasks failed (run again to retry them)".format(n_failed)))
+	return 0 if n_failed == 0 else 1
+
+
+if __name__ == "__main__":
+	sys.exit(main())
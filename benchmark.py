@@ -0,0 +1,354 @@
+"""
+Benchmarks of the hot paths: LCA runs per vehicle, the differences of all
+vehicle types (helpers.run_LCA_for_all_veh_types), a full grid sweep, writing
+and reading the result store, the evaluation of a vehicle catalog (see
+catalog.py), line plots (LCA.plot_results), the waterfall plot builders, and
+the cold import of the core and startup of the app.
+
+The compute, I/O and plotting benchmarks use synthetic stand-ins for the
+input data (see get_synthetic_inputs), with the same vehicles, areas and
+income groups as the workbooks, and run in a temporary directory, so that
+they neither depend on nor change the data, results and plots of the
+repository. Each benchmark reports its median time, throughput and peak
+memory (allocated by one run as traced by tracemalloc, or the maximum
+resident set size of the fresh interpreters of the startup benchmarks),
+compared with the stored baseline (benchmark_baseline_fn in config/config.py,
+only meaningful on the machine it was recorded on).
+Examples:
+
+	python benchmark.py
+	python benchmark.py --only "grid sweep" plot_results --repeats 10
+	python benchmark.py --save-baseline
+"""
+
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import tempfile
+import subprocess
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from config.config import *
+
+
+scenario = ("U.S.", 2022, "$50-75k") #area, year, income group
+
+
+def get_synthetic_inputs(n_areas=8, seed=0):
+	"""
+	Get synthetic input data with all columns required by the model (see
+	inputs.schemas), for the vehicles of veh_names_pairs_dict, the areas of
+	config/config.py (and DCFC) and further areas up to n_areas, and the income
+	groups of config/config.py. The values are drawn from plausible ranges.
+
+	Returns
+	-------
+	df_vehicles, df_areas, df_income_groups : pandas.DataFrame
+	"""
+
+	rng = np.random.default_rng(seed)
+	veh_names = list(dict.fromkeys(veh_name for veh_names in veh_names_pairs_dict.values() for veh_name in veh_names))
+	is_EV = np.array([veh_name.endswith("BEV") for veh_name in veh_names])
+	mpg = rng.uniform(18, 40, len(veh_names))
+	df_vehicles = pd.DataFrame({
+				"powertrain_type": np.where(is_EV, "EV", "ICEV"),
+				"label": veh_names,
+				"average transaction price [$]": rng.uniform(25000, 70000, len(veh_names)).round(1),
+				"production CO2 footprint [g]": np.where(is_EV, rng.uniform(8e6, 14e6, len(veh_names)), rng.uniform(5e6, 7e6, len(veh_names))).round(),
+				"real-world mpg [mi/gal]": np.where(is_EV, np.nan, mpg),
+				"real-world CO2 emissions [g/mi]": np.where(is_EV, np.nan, 8887/mpg), #g of CO2 per gallon of gasoline
+				"energy use [kWh/mi]": np.where(is_EV, rng.uniform(0.25, 0.5, len(veh_names)), np.nan),
+				"color": np.where(is_EV, "forestgreen", "grey"),
+				"marker_option": "o",
+				"lw": 2,
+				"zorder": 2,
+		}, index=pd.Index(veh_names, name="name"))
+
+	area_names = list(dict.fromkeys(["DCFC", *areas]))
+	area_names += ["area %d"%i for i in range(1, n_areas-len(area_names)+1)]
+	df_areas = pd.DataFrame(index=pd.Index(area_names, name="area"))
+	for year in range(min(years)-1, max(years)+1):
+		df_areas["gas_price %d [$/gal]"%year] = rng.uniform(2.5, 5, len(area_names)).round(3)
+		df_areas["electricity_price %d [ct/kWh]"%year] = np.where(df_areas.index == "DCFC", 35, rng.uniform(8, 25, len(area_names)).round(2))
+	df_areas["electricity_emission_intensity 2021 [g/kWh]"] = rng.uniform(50, 900, len(area_names))
+
+	df_income_groups = pd.DataFrame({
+				"maximum benefit from federal $7,500 EV tax credit": np.minimum(7500, np.linspace(1000, 12000, len(income_groups))).round(2),
+				"discount rate": rng.uniform(0.03, 0.1, len(income_groups)).round(3),
+				"average annual mileage per vehicle (U.S.) [mi]": rng.integers(10000, 16000, len(income_groups)),
+				"average vehicle age [years]": rng.uniform(8, 14, len(income_groups)).round(2),
+				fleet_income_weights_column: rng.dirichlet(np.ones(len(income_groups))).round(3),
+		}, index=pd.Index(income_groups, name="household income group"))
+	return df_vehicles, df_areas, df_income_groups
+
+#benchmarks, each one prepares the inputs and returns (function to time, number of units processed by each call, unit)
+
+def benchmark_LCA_run(dfs, cube):
+	import cache as c
+	from LCA import LCA
+
+	veh_names = list(dict.fromkeys(veh_name for veh_names in veh_names_pairs_dict.values() for veh_name in veh_names))
+	def run():
+		c.results_cache.invalidate()
+		for veh_name in veh_names:
+			LCA(*dfs, [veh_name], *scenario).run(veh_name)
+	return run, len(veh_names), "vehicles"
+
+def benchmark_run_LCA_for_all_veh_types(dfs, cube):
+	import cache as c
+	import helpers as h
+
+	scenarios = [(area, year, scenario[2]) for area in areas for year in years]
+	def run():
+		c.results_cache.invalidate()
+		for area,year,income_group in scenarios:
+			h.run_LCA_for_all_veh_types(*dfs, area, year, income_group, None)
+	return run, len(scenarios), "scenarios"
+
+def benchmark_grid_sweep(dfs, cube):
+	import sweep
+
+	grid = sweep.get_app_grid(dfs[1], dfs[2])
+	return lambda: sweep.run_grid(*dfs, *grid), int(np.prod([len(values) for values in grid])), "scenarios"
+
+def get_store_batches(dfs):
+	""" Get the unrounded results of all vehicles in each scenario of the benchmarks, as written to the result store """
+	import cache as c
+	import engine as e
+
+	inputs_hash = c.get_inputs_hash(*dfs)
+	veh_names = list(dfs[0].index)
+	is_EV = list(dfs[0]["powertrain_type"] == "EV")
+	lifetime = round(dfs[2].loc[scenario[2], "average vehicle age [years]"], 2)
+	batches = []
+	for area in areas:
+		for year in years:
+			keys = [c.get_key(inputs_hash, "individual vehicle", veh_name, area, year, scenario[2], None) for veh_name in veh_names]
+			results = e.run(e.get_params(*dfs, veh_names, area, year, scenario[2]))
+			batches.append((results, keys, veh_names, is_EV, area, year, scenario[2], None, lifetime))
+	return batches
+
+def benchmark_store_write(dfs, cube):
+	import store as s
+
+	batches = get_store_batches(dfs)
+	def run():
+		for batch in batches:
+			s.write_vehicle_results(*batch)
+	return run, sum(len(batch[1]) for batch in batches), "vehicles"
+
+def benchmark_store_read(dfs, cube):
+	import store as s
+
+	batches = get_store_batches(dfs)
+	for batch in batches:
+		s.write_vehicle_results(*batch)
+	def run():
+		for batch in batches:
+			s.read_vehicle_results(batch[1], batch[4], batch[5])
+	return run, sum(len(batch[1]) for batch in batches), "vehicles"
+
+def benchmark_plot_results(dfs, cube):
+	from LCA import LCA
+
+	lcas = [LCA(*dfs, veh_names, *scenario) for veh_names in veh_names_pairs_dict.values()]
+	for lca in lcas:
+		lca.retrieve_results()
+	def run():
+		for lca in lcas:
+			fig = lca.plot_results("total present value costs [$]")
+			fig.canvas.draw() #layout and rendering
+	return run, len(lcas), "figures"
+
+def benchmark_catalog(dfs, cube):
+	import catalog
+
+	n_vehicles = 20000
+	rng = np.random.default_rng(0)
+	veh_names = [veh_name for veh_names_pair in veh_names_pairs_dict.values() for veh_name in veh_names_pair] #vehicles with all inputs (see catalog.required_inputs)
+	df_catalog = dfs[0].loc[rng.choice(veh_names, n_vehicles)][list(catalog_columns.values())].reset_index(drop=True)
+	df_catalog["average transaction price [$]"] *= rng.uniform(0.8, 1.2, n_vehicles)
+	df_catalog["name"] = ["vehicle %d"%i for i in range(n_vehicles)]
+	df_catalog.to_parquet("catalog.parquet")
+	return lambda: catalog.run_catalog(*dfs, "catalog.parquet", "catalog results.parquet", areas, years, [scenario[2]]), n_vehicles, "vehicles"
+
+def get_benchmark_waterfall(plot_type):
+	def benchmark_waterfall(dfs, cube):
+		import helpers as h
+
+		if plot_type == "all_either":
+			return lambda: h.plot_waterfall_all_either(list(veh_names_pairs_dict.keys()), *scenario, cube=cube), 1, "figures"
+		plot_waterfall = getattr(h, "plot_waterfall_"+plot_type)
+		return lambda: [plot_waterfall(veh_type, *scenario, cube=cube) for veh_type in veh_names_pairs_dict], len(veh_names_pairs_dict), "figures"
+	return benchmark_waterfall
+
+benchmarks = {
+			"LCA.run": benchmark_LCA_run,
+			"run_LCA_for_all_veh_types": benchmark_run_LCA_for_all_veh_types,
+			"grid sweep": benchmark_grid_sweep,
+			"result store write": benchmark_store_write,
+			"result store read": benchmark_store_read,
+			"catalog": benchmark_catalog,
+			"plot_results": benchmark_plot_results,
+			**{"plot_waterfall_"+plot_type: get_benchmark_waterfall(plot_type) for plot_type in plot_types_dict.values()},
+	}
+
+#benchmarks in fresh interpreters (in the repository, with the actual input data), the code prints the time and then the peak memory in kB
+startup_benchmarks = {
+			"import core": "import time; t=time.perf_counter(); import engine, cache, store, inputs, sweep, LCA, helpers; t=time.perf_counter()-t",
+			"Start startup": "import time; t=time.perf_counter(); from streamlit.testing.v1 import AppTest; AppTest.from_file('Start.py', default_timeout=600).run(); t=time.perf_counter()-t",
+	}
+
+def measure(function, n_repeats):
+	""" Get the median time of n_repeats calls (after one warm-up call), and the peak memory allocated by one call (in MB) """
+	function()
+	times = []
+	for i in range(n_repeats):
+		t = time.perf_counter()
+		function()
+		times.append(time.perf_counter()-t)
+	tracemalloc.start()
+	function()
+	peak_memory = tracemalloc.get_traced_memory()[1] / 1e6
+	tracemalloc.stop()
+	return float(np.median(times)), peak_memory
+
+def measure_startup(code, n_repeats):
+	""" Get the median time and the peak memory (in MB) of fresh interpreters running code """
+	code += "; import resource; print(t); print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)"
+	times, peak_memories = [], []
+	for i in range(n_repeats):
+		out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout.split()
+		times.append(float(out[-2]))
+		peak_memories.append(int(out[-1]) / 1e3)
+	return float(np.median(times)), float(np.median(peak_memories))
+
+def run_benchmarks(names, n_repeats):
+	""" Run the benchmarks, returns name -> measurements """
+	import matplotlib
+	matplotlib.use("Agg")
+	import config.init
+	config.init.run() #the style of the app, with paths relative to the repository
+	import inputs
+	import sweep
+
+	measurements = dict()
+	for name in names:
+		if name in startup_benchmarks:
+			t, peak_memory = measure_startup(startup_benchmarks[name], n_repeats)
+			measurements[name] = {"time [s]": t, "throughput": 1/t, "unit": "startups", "peak memory [MB]": peak_memory}
+			print("{0:s}: {1:.4f} s".format(name, t))
+
+	dfs = get_synthetic_inputs()
+	loaded_inputs = inputs.loaded_inputs
+	working_directory = os.getcwd()
+	with tempfile.TemporaryDirectory() as directory:
+		os.chdir(directory) #all results and plots are written here
+		inputs.loaded_inputs = dfs #served by inputs.get_inputs, e.g. to the waterfall plot builders
+		try:
+			cube = sweep.run_grid(*dfs, *sweep.get_app_grid(dfs[1], dfs[2]))
+			for name in names:
+				if name in benchmarks:
+					function, n_units, unit = benchmarks[name](dfs, cube)
+					t, peak_memory = measure(function, n_repeats)
+					measurements[name] = {"time [s]": t, "throughput": n_units/t, "unit": unit, "peak memory [MB]": peak_memory}
+					print("{0:s}: {1:.4f} s".format(name, t))
+		finally:
+			os.chdir(working_directory)
+			inputs.loaded_inputs = loaded_inputs
+	return measurements
+
+def get_environment():
+	import matplotlib
+	import plotly
+	return {
+				"machine": platform.machine(),
+				"processor": platform.processor(),
+				"CPUs": os.cpu_count(),
+				"python": platform.python_version(),
+				"numpy": np.__version__,
+				"pandas": pd.__version__,
+				"matplotlib": matplotlib.__version__,
+				"plotly": plotly.__version__,
+		}
+
+def compare(measurements, baseline, tolerance):
+	"""
+	Print the measurements next to the baseline.
+
+	Returns
+	-------
+	regressions : list of str
+		Benchmarks that are slower, or need more memory, than the baseline by
+		more than the tolerance (relative).
+	"""
+
+	rows = []
+	regressions = []
+	for name,measurement in measurements.items():
+		row = {
+					"benchmark": name,
+					"time [s]": measurement["time [s]"],
+					"throughput": "{0:.4g} {1:s}/s".format(measurement["throughput"], measurement["unit"]),
+					"peak memory [MB]": measurement["peak memory [MB]"],
+			}
+		if name in baseline:
+			row["time vs. baseline"] = measurement["time [s]"] / baseline[name]["time [s]"]
+			row["memory vs. baseline"] = measurement["peak memory [MB]"] / baseline[name]["peak memory [MB]"]
+			if row["time vs. baseline"] > 1+tolerance or row["memory vs. baseline"] > 1+tolerance:
+				row["status"] = "regression"
+				regressions.append(name)
+			elif row["time vs. baseline"] < 1/(1+tolerance):
+				row["status"] = "faster"
+			else:
+				row["status"] = "ok"
+		rows.append(row)
+	with pd.option_context("display.width", 200, "display.float_format", "{0:.4g}".format):
+		print(pd.DataFrame(rows).set_index("benchmark").fillna("").to_string())
+	return regressions
+
+def get_parser():
+	all_names = list(startup_benchmarks.keys()) + list(benchmarks.keys())
+	parser = argparse.ArgumentParser(description="Benchmark the hot paths and compare them with the stored baseline.")
+	parser.add_argument("--only", nargs="+", default=all_names, choices=all_names, metavar="BENCHMARK", help="benchmarks to run: %(choices)s (default: all)")
+	parser.add_argument("--repeats", type=int, default=benchmark_n_repeats, help="number of timed runs of each benchmark (default: %(default)s)")
+	parser.add_argument("--baseline", default=benchmark_baseline_fn, help="baseline file (default: %(default)s)")
+	parser.add_argument("--tolerance", type=float, default=benchmark_tolerance, help="relative slowdown or increase of the peak memory reported as a regression (default: %(default)s)")
+	parser.add_argument("--save-baseline", action="store_true", help="save the measurements as the new baseline (of the benchmarks that ran)")
+	return parser
+
+def main(argv=None):
+	args = get_parser().parse_args(argv)
+	if os.path.isfile(args.baseline):
+		with open(args.baseline) as f:
+			baseline = json.load(f)
+	else:
+		baseline = {"environment": None, "benchmarks": dict()}
+
+	measurements = run_benchmarks(args.only, args.repeats)
+	print()
+	environment = get_environment()
+	if baseline["environment"] is not None and baseline["environment"] != environment:
+		print("the baseline was recorded in another environment, differences may not be regressions: {0}\n".format(baseline["environment"]))
+	regressions = compare(measurements, baseline["benchmarks"], args.tolerance)
+
+	if args.save_baseline:
+		baseline = {"environment": environment, "benchmarks": dict(baseline["benchmarks"], **measurements)}
+		with open(args.baseline, "w") as f:
+			json.dump(baseline, f, indent="\t")
+		print("saved the baseline to " + args.baseline)
+		return 0
+	if len(regressions) > 0:
+		print("\nregressions (tolerance {0:g}%): {1:s}".format(args.tolerance*100, ", ".join(regressions)))
+		return 1
+	return 0
+
+
+if __name__ == "__main__":
+	sys.exit(main())
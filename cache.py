@@ -0,0 +1,217 @@
+"""
+Content-addressed cache of LCA results.
+
+Results are stored under a key that is a hash of everything they depend on:
+the contents of the input data (vehicle_types.xlsx, areas.xlsx,
+income_groups.xlsx), the model constants in config/config.py, the model
+version, and the scenario (vehicle(s), area, year, income group and exact
+discount rate). Changing any input therefore changes the key, so that stale
+results are never served. Results are kept in memory and on disk, both with
+a bounded size and least-recently-used (LRU) eviction.
+"""
+
+import os
+import hashlib
+import threading
+from contextlib import contextmanager
+from collections import OrderedDict
+
+import pandas as pd
+
+import persistence
+import tracing
+
+from config.config import *
+
+
+def get_config_hash():
+	""" Hash of all model constants from config/config.py that affect the results """
+	constants = (model_version, p_DCFC, eff_charging, sorted(monthly_insurance_costs.items()), sorted(maintenance_costs_per_mile.items()))
+	return hashlib.sha256(repr(constants).encode()).hexdigest()
+
+def get_df_hash(df):
+	""" Hash of the contents (index, columns and values) of a DataFrame """
+	h = hashlib.sha256()
+	h.update(repr((list(df.index), list(df.columns))).encode())
+	h.update(pd.util.hash_pandas_object(df, index=True).to_numpy().tobytes())
+	return h.hexdigest()
+
+def get_inputs_hash(df_vehicles, df_areas, df_income_groups):
+	""" Hash of the input data and the model constants """
+	h = hashlib.sha256()
+	for df in [df_vehicles, df_areas, df_income_groups]:
+		h.update(get_df_hash(df).encode())
+	h.update(get_config_hash().encode())
+	return h.hexdigest()
+
+def get_key(inputs_hash, kind, *scenario):
+	"""
+	Get the cache key of one result.
+
+	Parameters
+	----------
+	inputs_hash : str
+		Hash of the input data, see get_inputs_hash.
+	kind : str
+		Kind of result, e.g. "individual vehicle" or "cumulative differences".
+	*scenario
+		Everything else the result depends on, e.g. vehicle name, area, year,
+		income group and custom discount rate.
+	"""
+	scenario = [round(float(x), 10) if isinstance(x, float) else x for x in scenario] #custom discount rates, e.g. 0.07 and 7/100, map to the same key
+	return hashlib.sha256(repr((inputs_hash, kind, *scenario)).encode()).hexdigest()
+
+def write_to_disk(custom_discount_rate):
+	""" Whether to also keep a result on disk (results for custom discount rates only if cache_custom_discount_rates_on_disk is set) """
+	return custom_discount_rate is None or cache_custom_discount_rates_on_disk
+
+
+class ResultCache:
+	"""
+	Bounded LRU cache of results (e.g. DataFrames or engine.Results), kept in
+	memory and optionally on disk.
+
+	Parameters
+	----------
+	max_entries : int
+		Maximum number of results kept in memory.
+	directory : str or None
+		Directory to keep results on disk, None to only keep them in memory.
+	max_files : int
+		Maximum number of results kept on disk.
+	"""
+
+	def __init__(self, max_entries=cache_max_entries, directory=cache_directory, max_files=cache_max_files):
+		self.max_entries = max_entries
+		self.directory = directory
+		self.max_files = max_files
+		self.entries = OrderedDict()
+		self.lock = threading.Lock()
+		self.key_locks = dict() #key -> (lock, number of threads using it), see computing
+		self.hits = 0
+		self.misses = 0
+
+	def get_fn(self, key):
+		return os.path.join(self.directory, key+".pkl")
+
+	def get(self, key, count_miss=True):
+		""" Get a result (None if it is not cached), count_miss=False for a probe before the locked re-check (see computing) that counts the miss """
+		with self.lock:
+			if key in self.entries:
+				self.entries.move_to_end(key)
+				self.hits += 1
+				tracing.count("result cache hits (memory)")
+				return self.entries[key].copy()
+		if self.directory is not None and os.path.isfile(self.get_fn(key)):
+			try:
+				value = pd.read_pickle(self.get_fn(key))
+				os.utime(self.get_fn(key)) #mark as recently used
+			except (OSError, EOFError, ValueError): #e.g. deleted or partially written by another process
+				value = None
+			if value is not None:
+				self.put(key, value, write=False)
+				with self.lock:
+					self.hits += 1
+				if tracing.is_active():
+					tracing.count("result cache hits (disk)")
+					tracing.count("result cache bytes read", tracing.get_file_size(self.get_fn(key)))
+				return value.copy()
+		if count_miss:
+			with self.lock:
+				self.misses += 1
+			tracing.count("result cache misses")
+		return None
+
+	def put(self, key, value, write=True):
+		""" Add a result to the cache (and to disk if write is set, according to the persistence policy, see persistence.py) """
+		value = value.copy()
+		with self.lock:
+			self.entries[key] = value
+			self.entries.move_to_end(key)
+			while len(self.entries) > self.max_entries:
+				self.entries.popitem(last=False)
+		if write and self.directory is not None:
+			persistence.submit(self.write_file, key, value)
+
+	def write_file(self, key, value):
+		os.makedirs(self.directory, exist_ok=True)
+		tmp_fn = self.get_fn(key)+".%d.%d.tmp"%(os.getpid(), threading.get_ident())
+		pd.to_pickle(value, tmp_fn)
+		if tracing.is_active():
+			tracing.count("result cache bytes written", tracing.get_file_size(tmp_fn))
+		os.replace(tmp_fn, self.get_fn(key)) #atomic, readers never see a partially written file
+		self.evict_files()
+
+	def evict_files(self):
+		""" Remove the least recently used files if there are more than max_files on disk """
+		fns = [os.path.join(self.directory, fn) for fn in os.listdir(self.directory) if fn.endswith(".pkl")]
+		if len(fns) <= self.max_files:
+			return
+		fns_mtimes = []
+		for fn in fns:
+			try:
+				fns_mtimes.append((os.path.getmtime(fn), fn))
+			except OSError:
+				pass
+		for _,fn in sorted(fns_mtimes)[:len(fns_mtimes)-self.max_files]:
+			try:
+				os.remove(fn)
+			except OSError:
+				pass
+
+	@contextmanager
+	def computing(self, *keys):
+		"""
+		Hold the locks of the given keys while looking up and computing their
+		results, so that concurrent requests for the same results (e.g. from
+		several sessions) compute them only once, e.g.
+
+			value = results_cache.get(key, count_miss=False) #unlocked probe
+			if value is None:
+				with results_cache.computing(key):
+					value = results_cache.get(key) #counts the miss
+					if value is None:
+						value = compute()
+						results_cache.put(key, value)
+		"""
+		keys = sorted(set(keys)) #always locked in the same order, so that no two threads wait for each other
+		with self.lock:
+			for key in keys:
+				key_lock, n_users = self.key_locks.get(key, (threading.Lock(), 0))
+				self.key_locks[key] = (key_lock, n_users+1)
+			key_locks = [self.key_locks[key][0] for key in keys]
+		try:
+			for key_lock in key_locks:
+				key_lock.acquire()
+			try:
+				yield
+			finally:
+				for key_lock in reversed(key_locks):
+					key_lock.release()
+		finally:
+			with self.lock:
+				for key in keys:
+					key_lock, n_users = self.key_locks[key]
+					if n_users == 1:
+						del self.key_locks[key]
+					else:
+						self.key_locks[key] = (key_lock, n_users-1)
+
+	def invalidate(self, key=None):
+		""" Remove one result (or all results if key is None) from memory and disk """
+		with self.lock:
+			if key is None:
+				self.entries.clear()
+			else:
+				self.entries.pop(key, None)
+		if self.directory is None or not os.path.isdir(self.directory):
+			return
+		fns = [self.get_fn(key)] if key is not None else [os.path.join(self.directory, fn) for fn in os.listdir(self.directory) if fn.endswith(".pkl")]
+		for fn in fns:
+			try:
+				os.remove(fn)
+			except OSError:
+				pass
+
+
+results_cache = ResultCache()
@@ -0,0 +1,289 @@
+"""
+Batch evaluation of vehicle catalogs, e.g. tens of thousands of makes,
+models and trims that are not in vehicle_types.xlsx.
+
+A catalog is a CSV or Parquet file with one row per vehicle and the inputs
+of the vehicles (powertrain type, price, mpg or energy use, CO2 emissions
+and production footprint, see catalog_columns in config/config.py for the
+column names). It is read in chunks of rows, and the vehicle inputs of each
+chunk are combined with the inputs of all scenarios from the compiled
+parameter tables (see tables.py) and evaluated in one batch of the engine.
+The lifetime results of each chunk are appended to the output file (CSV or
+Parquet) before the next chunk is read, so the memory use depends on the
+chunk size and the number of scenarios, not on the size of the catalog. If
+the catalog names a vehicle of the input data to compare each vehicle with
+(catalog_reference_column), the differences to it are written as well.
+Examples:
+
+	python catalog.py catalog.csv results/catalog.parquet --areas U.S. WA --years 2022
+	python catalog.py catalog.parquet results/catalog.csv --income-groups '$50-75k' --discount-rates default 5% --chunk-size 5000
+"""
+
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+import pandas as pd
+
+import engine as e
+import tables as t
+import store as s
+import tracing
+
+from config.config import *
+
+
+#inputs (columns of vehicle_types.xlsx) that each catalog row of a powertrain type needs
+required_inputs = {
+				"ICEV": ["average transaction price [$]", "real-world mpg [mi/gal]", "real-world CO2 emissions [g/mi]", "production CO2 footprint [g]"],
+				"EV": ["average transaction price [$]", "energy use [kWh/mi]", "production CO2 footprint [g]"],
+	}
+
+def get_parser():
+	parser = argparse.ArgumentParser(description="Compute the lifetime results of all vehicles of a catalog (CSV or Parquet) in chunks.")
+	parser.add_argument("catalog_fn", help="catalog file (.csv or .parquet)")
+	parser.add_argument("output_fn", help="output file (.csv or .parquet), replaced when finished")
+	parser.add_argument("--areas", nargs="+", default=areas, help="areas (default: %(default)s)")
+	parser.add_argument("--years", nargs="+", type=int, default=years, help="years (default: %(default)s)")
+	parser.add_argument("--income-groups", nargs="+", default=income_groups, help="household income groups (default: all)")
+	parser.add_argument("--discount-rates", nargs="+", default=["default"], help='discount rates, "default" for the income group-specific ones, or e.g. "5%%" (default: %(default)s)')
+	parser.add_argument("--quantities", nargs="+", default=e.total_columns, help="lifetime results to write (default: all)")
+	parser.add_argument("--chunk-size", type=int, default=catalog_chunk_size, help="catalog rows per chunk (default: %(default)s)")
+	return parser
+
+def get_file_format(fn):
+	""" Get the file format ("csv" or "parquet") from the file extension """
+	extension = os.path.splitext(fn)[1].lower()
+	if extension not in [".csv", ".parquet"]:
+		raise ValueError("unsupported file format (use .csv or .parquet): " + fn)
+	return extension[1:]
+
+def read_catalog(catalog_fn, chunk_size=catalog_chunk_size):
+	""" Read a catalog in chunks of up to chunk_size rows (generator of DataFrames, without reading the whole file) """
+	if get_file_format(catalog_fn) == "csv":
+		for df_chunk in pd.read_csv(catalog_fn, chunksize=chunk_size):
+			yield df_chunk
+	else:
+		import pyarrow.parquet as pq
+
+		for batch in pq.ParquetFile(catalog_fn).iter_batches(batch_size=chunk_size):
+			yield batch.to_pandas()
+
+def get_catalog_vehicles(df_catalog, columns=catalog_columns):
+	"""
+	Get the inputs of the vehicles of a catalog chunk (see
+	tables.get_vehicle_tables), with the catalog columns given in columns
+	(column of vehicle_types.xlsx -> column of the catalog). Inputs that only
+	apply to the other powertrain type (e.g. the mpg of EVs) may be missing,
+	rows without the inputs of their powertrain type (see required_inputs)
+	are rejected, as the engine would leave their costs or emissions out of
+	the totals.
+	"""
+
+	missing_columns = [col for col in ["powertrain_type", "average transaction price [$]"] if columns[col] not in df_catalog.columns]
+	if len(missing_columns) > 0:
+		raise ValueError("missing catalog columns: " + ", ".join(columns[col] for col in missing_columns))
+	df_vehicles = pd.DataFrame({col: df_catalog[catalog_col] if catalog_col in df_catalog.columns else np.nan for col,catalog_col in columns.items()}, index=df_catalog.index)
+	unknown_powertrain_types = set(df_vehicles["powertrain_type"]) - set(monthly_insurance_costs)
+	if len(unknown_powertrain_types) > 0:
+		raise ValueError("unknown powertrain types in the catalog: " + ", ".join(map(str, unknown_powertrain_types)))
+	missing_inputs = []
+	for col in dict.fromkeys(col for cols in required_inputs.values() for col in cols):
+		is_required = df_vehicles["powertrain_type"].isin([powertrain_type for powertrain_type,cols in required_inputs.items() if col in cols])
+		missing_rows = df_vehicles.index[is_required & pd.to_numeric(df_vehicles[col], errors="coerce").isna()]
+		if len(missing_rows) > 0:
+			missing_inputs.append("{0:s} (rows {1:s})".format(columns[col], ", ".join(map(str, missing_rows))))
+	if len(missing_inputs) > 0:
+		raise ValueError("missing inputs in the catalog: " + "; ".join(missing_inputs))
+	return t.get_vehicle_tables(df_vehicles)
+
+def get_reference_totals(tables, reference_veh_names, areas, years, income_groups, custom_discount_rates, chunk_size=4096):
+	"""
+	Get the lifetime results of the reference vehicle (a vehicle of the input
+	data) of each catalog vehicle, NaN for vehicles without one. Returns an
+	array of shape (areas, years, income groups, discount rates, vehicles,
+	len(engine.total_columns)).
+	"""
+
+	has_reference = reference_veh_names.notna().to_numpy()
+	veh_names = list(dict.fromkeys(reference_veh_names[has_reference]))
+	unknown_veh_names = [veh_name for veh_name in veh_names if veh_name not in tables.veh_ids]
+	if len(unknown_veh_names) > 0:
+		raise ValueError("unknown reference vehicles: " + ", ".join(map(str, unknown_veh_names)))
+	if len(veh_names) == 0:
+		return np.full((len(areas), len(years), len(income_groups), len(custom_discount_rates), len(reference_veh_names), len(e.total_columns)), np.nan)
+	base_params = tables.get_base_params(veh_names, areas, years, income_groups, custom_discount_rates)
+	shape = base_params["lifetime [yr]"].shape
+	totals = e.run_totals(e.flatten_params(e.derive_params(base_params), shape), chunk_size).reshape(*shape, len(e.total_columns))
+	totals = np.concatenate([totals, np.full((*shape[:-1], 1, len(e.total_columns)), np.nan)], axis=-2) #last position for vehicles without reference
+	i_reference = np.array([veh_names.index(veh_name) if has_veh_reference else len(veh_names) for veh_name,has_veh_reference in zip(reference_veh_names, has_reference)], dtype=int)
+	return totals[...,i_reference,:]
+
+@tracing.traced()
+def score_chunk(tables, df_catalog, areas, years, income_groups, custom_discount_rates, quantities=e.total_columns, columns=catalog_columns, reference_column=catalog_reference_column, chunk_size=4096):
+	"""
+	Compute the lifetime results of the vehicles of a catalog chunk in all
+	combinations of the given scenario dimensions.
+
+	Parameters
+	----------
+	tables : tables.ParameterTables
+		Compiled parameter tables of the input data (see tables.get_tables).
+	df_catalog : pandas.DataFrame
+		Catalog rows, one per vehicle.
+	areas, years, income_groups, custom_discount_rates : list
+		Scenario dimensions, see sweep.run_grid.
+	quantities : list
+		Lifetime results to return (of engine.total_columns).
+	columns : dict
+		Column of vehicle_types.xlsx -> column of the catalog.
+	reference_column : str
+		Catalog column with the reference vehicle (of the input data) of each
+		vehicle, if the catalog has it, adds the differences to it.
+	chunk_size : int
+		Maximum number of vehicle/scenario combinations evaluated at once by
+		the engine.
+
+	Returns
+	-------
+	df_results : pandas.DataFrame
+		One row per vehicle and scenario, with the catalog columns that are
+		not inputs (e.g. make, model, trim), the scenario ("area", "year",
+		"income group", "discount rate") and the quantities (and their
+		differences to the reference vehicle, as "difference <quantity>").
+	"""
+
+	base_params = tables.get_vehicles_base_params(get_catalog_vehicles(df_catalog, columns), areas, years, income_groups, custom_discount_rates)
+	shape = base_params["lifetime [yr]"].shape
+	totals = e.run_totals(e.flatten_params(e.derive_params(base_params), shape), chunk_size).reshape(*shape, len(e.total_columns))
+	i_quant = [e.total_columns.index(quantity) for quantity in quantities]
+
+	#one row per vehicle and scenario, the vehicles vary fastest
+	i_area, i_year, i_income_group, i_discount_rate, i_veh = np.indices(shape).reshape(len(shape), -1)
+	id_columns = [col for col in df_catalog.columns if col not in columns.values()]
+	df_results = df_catalog[id_columns].iloc[i_veh].reset_index(drop=True)
+	df_results["area"] = np.asarray(areas, dtype=object)[i_area]
+	df_results["year"] = np.asarray(years)[i_year]
+	df_results["income group"] = np.asarray(income_groups, dtype=object)[i_income_group]
+	df_results["discount rate"] = np.asarray([s.get_discount_rate_label(custom_discount_rate) for custom_discount_rate in custom_discount_rates], dtype=object)[i_discount_rate]
+	values = e.round_results(totals, e.total_columns)[...,i_quant].reshape(-1, len(i_quant))
+	for i,quantity in enumerate(quantities):
+		df_results[quantity] = values[:,i]
+
+	if reference_column in df_catalog.columns:
+		reference_totals = get_reference_totals(tables, df_catalog[reference_column], areas, years, income_groups, custom_discount_rates, chunk_size)
+		differences = e.round_results(totals - reference_totals, e.total_columns)[...,i_quant].reshape(-1, len(i_quant))
+		for i,quantity in enumerate(quantities):
+			df_results["difference "+quantity] = differences[:,i]
+	return df_results
+
+class ResultWriter:
+	"""
+	Appends the results of each chunk to a CSV or Parquet file. The file is
+	written under a temporary name and moved into place by close, so that
+	readers never see a partially written file.
+	"""
+
+	def __init__(self, fn):
+		self.fn = fn
+		self.file_format = get_file_format(fn)
+		self.tmp_fn = fn+".%d.tmp"%os.getpid()
+		self.writer = None
+		self.n_rows = 0
+		os.makedirs(os.path.dirname(fn) or ".", exist_ok=True)
+
+	def write(self, df_results):
+		if self.file_format == "csv":
+			df_results.to_csv(self.tmp_fn, mode="a" if self.n_rows > 0 else "w", header=self.n_rows == 0, index=False)
+		else:
+			import pyarrow as pa
+			import pyarrow.parquet as pq
+
+			table = pa.Table.from_pandas(df_results, preserve_index=False)
+			if self.writer is None:
+				self.writer = pq.ParquetWriter(self.tmp_fn, table.schema)
+			self.writer.write_table(table.cast(self.writer.schema)) #the column types of all chunks follow the first one
+		self.n_rows += len(df_results)
+
+	def close(self):
+		""" Finish the file and move it into place """
+		if self.writer is not None:
+			self.writer.close()
+		if self.n_rows == 0 and self.file_format == "csv":
+			pd.DataFrame().to_csv(self.tmp_fn, index=False)
+		os.replace(self.tmp_fn, self.fn)
+
+	def abort(self):
+		""" Discard the partially written file """
+		if self.writer is not None:
+			self.writer.close()
+		if os.path.exists(self.tmp_fn):
+			os.remove(self.tmp_fn)
+
+def run_catalog(df_vehicles, df_areas, df_income_groups, catalog_fn, output_fn, areas=areas, years=years, income_groups=income_groups, custom_discount_rates=[None], quantities=e.total_columns, columns=catalog_columns, reference_column=catalog_reference_column, chunk_size=catalog_chunk_size, callback=None):
+	"""
+	Compute the lifetime results of all vehicles of a catalog in all
+	combinations of the given scenario dimensions, chunk by chunk, and write
+	them to output_fn (see score_chunk for the columns).
+
+	Parameters
+	----------
+	df_vehicles, df_areas, df_income_groups : pandas.DataFrame
+		Input data (see Start.get_data).
+	catalog_fn, output_fn : str
+		Catalog and output files (.csv or .parquet).
+	areas, years, income_groups, custom_discount_rates : list
+		Scenario dimensions, see sweep.run_grid.
+	quantities, columns, reference_column :
+		See score_chunk.
+	chunk_size : int
+		Catalog rows per chunk.
+	callback : function, optional
+		Called after each chunk with the number of catalog rows and the
+		number of result rows written so far.
+
+	Returns
+	-------
+	n_rows : int
+		Number of result rows written.
+	"""
+
+	tables = t.get_tables(df_vehicles, df_areas, df_income_groups)
+	writer = ResultWriter(output_fn)
+	n_vehicles = 0
+	try:
+		for df_catalog in read_catalog(catalog_fn, chunk_size):
+			writer.write(score_chunk(tables, df_catalog, areas, years, income_groups, custom_discount_rates, quantities, columns, reference_column))
+			n_vehicles += len(df_catalog)
+			if callback is not None:
+				callback(n_vehicles, writer.n_rows)
+	except BaseException:
+		writer.abort()
+		raise
+	writer.close()
+	return writer.n_rows
+
+def main(argv=None):
+	import batch
+	import inputs
+
+	args = get_parser().parse_args(argv)
+	unknown_quantities = [quantity for quantity in args.quantities if quantity not in e.total_columns]
+	if len(unknown_quantities) > 0:
+		print("unknown quantities: " + ", ".join(unknown_quantities))
+		return 2
+	custom_discount_rates = [batch.get_custom_discount_rate(discount_rate) for discount_rate in args.discount_rates]
+
+	t0 = time.time()
+	df_vehicles,df_areas,df_income_groups = inputs.load_inputs()
+	def callback(n_vehicles, n_rows):
+		print("{0:d} vehicles, {1:d} rows written ({2:.1f} s)".format(n_vehicles, n_rows, time.time()-t0))
+	n_rows = run_catalog(df_vehicles, df_areas, df_income_groups, args.catalog_fn, args.output_fn, args.areas, args.years, args.income_groups, custom_discount_rates, args.quantities, chunk_size=args.chunk_size, callback=callback)
+	print("finished in {0:.1f} s: {1:d} rows written to {2:s}".format(time.time()-t0, n_rows, args.output_fn))
+	return 0
+
+
+if __name__ == "__main__":
+	sys.exit(main())
@@ -0,0 +1,53 @@
+"""
+Check that the headless core (everything needed to compute results, e.g. in
+batch workers and command line tools) imports without the UI and plotting
+libraries, and within the import time budget import_time_budget set in
+config/config.py. Each measurement runs in a fresh interpreter.
+
+	python check_imports.py
+"""
+
+import sys
+import subprocess
+
+from config.config import import_time_budget
+
+
+core_modules = ["engine", "cache", "store", "inputs", "sweep", "LCA", "helpers"]
+ui_modules = ["streamlit", "matplotlib", "plotly", "Start", "utils"] #only to be imported when plotting or by the app
+
+
+def measure_import(modules, n_repeats=3):
+	"""
+	Import modules in fresh interpreters.
+
+	Returns
+	-------
+	import_time : float
+		Fastest of n_repeats import times (in seconds).
+	loaded_ui_modules : list of str
+		UI and plotting modules that were loaded as a side effect.
+	"""
+	code = "import sys,time; t=time.perf_counter(); import {0}; print(time.perf_counter()-t); print(','.join(m for m in {1!r} if m in sys.modules))".format(",".join(modules), ui_modules)
+	import_times = []
+	for i in range(n_repeats):
+		out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout.split("\n")
+		import_times.append(float(out[0]))
+	loaded_ui_modules = [m for m in out[1].split(",") if m != ""]
+	return min(import_times), loaded_ui_modules
+
+def main():
+	import_time, loaded_ui_modules = measure_import(core_modules)
+	print("import {0:s}: {1:.3f} s (budget {2:.3f} s)".format(", ".join(core_modules), import_time, import_time_budget))
+	ok = True
+	if import_time > import_time_budget:
+		print("over the import time budget")
+		ok = False
+	if len(loaded_ui_modules) > 0:
+		print("UI/plotting modules loaded at import: " + ", ".join(loaded_ui_modules))
+		ok = False
+	return 0 if ok else 1
+
+
+if __name__ == "__main__":
+	sys.exit(main())
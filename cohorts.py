@@ -0,0 +1,154 @@
+"""
+Multi-year cohort and fleet turnover simulation.
+
+Vehicles bought in each year of a horizon (purchase cohorts) stay in use
+according to a survival curve (Weibull, with the income group-specific
+lifetime as mean) instead of exactly for the lifetime, and the annual costs
+and emissions of all cohorts still in use add up to those of the fleet. The
+prices and grid intensities of each calendar year of use are the input data
+where available, extrapolated with annual escalation rates per area after
+the last year with data (see cohort_escalation_rates in config.config).
+
+The annual profiles of all cohorts, areas and vehicles are computed in one
+batch of the engine (see engine.get_cash_flows) and shifted onto the calendar
+years in one vectorized scatter-add, which is the discrete convolution of the
+purchases with the survival-weighted profiles. Example:
+
+	fleet, diff = cohorts.run_cohorts(df_vehicles, df_areas, df_income_groups, "$50-75k")
+	fleet.sel(area="WA", vehicle="Sedan BEV", quantity="emissions [tCO$_2$-eq.]").values #annual emissions of all Sedan BEVs in use
+"""
+
+import math
+
+import numpy as np
+
+import engine as e
+import tables as t
+from sweep import ScenarioCube, get_pairs_indices
+
+from config.config import *
+
+
+quantities = ["vehicles in use", "mileage [mi]", *e.cost_type_columns, "costs [$]", "emissions [tCO$_2$-eq.]"]
+
+
+def get_survival(age, lifetime, shape=cohort_survival_shape):
+	""" Get the share of vehicles still in use at an age (Weibull survival curve with the given shape, whose mean is lifetime) """
+	scale = lifetime / math.gamma(1 + 1/shape)
+	return np.exp(-(np.maximum(age, 0)/scale)**shape)
+
+def get_cohort_base_params(tables, veh_names, areas, purchase_years, income_group, custom_discount_rate=None, escalation_rates=cohort_escalation_rates, max_age=cohort_max_age):
+	"""
+	Get the underlying inputs (see engine.get_base_params) of all cohorts,
+	with the prices and grid intensities of their purchase years, as a dict of
+	arrays of shape (areas, cohorts, vehicles), and the trajectories of the
+	prices and grid intensities over the years of use (see
+	tables.ParameterTables.get_trajectories), as a dict of arrays of shape
+	(areas, cohorts, 1, years of use). Both are taken from the input data
+	where available and escalated after the last year with data.
+	"""
+
+	last_year = max(tables.year_ids)
+	data_years = [min(year, last_year) for year in purchase_years]
+	base_params = tables.get_base_params(veh_names, areas, data_years, [income_group], [custom_discount_rate])
+	base_params = {name: values[:,:,0,0,:] for name,values in base_params.items()}
+	rates = {name: escalation_rates.get(name, 0) for name in tables.area_years}
+	trajectories = {name: values[:,:,0,0] for name,values in tables.get_trajectories(areas, purchase_years, max_age, rates).items()}
+	for name,values in trajectories.items():
+		base_params[name] = np.broadcast_to(values[...,0], shape=base_params[name].shape) #purchase year
+	return base_params, trajectories
+
+def run_cohorts(df_vehicles, df_areas, df_income_groups, income_group, areas=areas, purchase_years=cohort_years, n_purchases=1, custom_discount_rate=None, veh_names_pairs_dict=veh_names_pairs_dict, escalation_rates=cohort_escalation_rates, survival_shape=cohort_survival_shape, max_age=cohort_max_age, in_life_trajectories=True):
+	"""
+	Simulate the fleet of the vehicles bought in each year of a horizon.
+
+	Parameters
+	----------
+	df_vehicles, df_areas, df_income_groups : pandas.DataFrame
+		Input data (see Start.get_data).
+	income_group : str
+		Income group of the buyers (sets the annual mileage, the mean lifetime
+		and the incentives).
+	areas : list
+		Areas to simulate.
+	purchase_years : list
+		Purchase year of each cohort (from the first year with data on).
+	n_purchases : float or array-like of shape (len(purchase_years),)
+		Number of vehicles (of each vehicle) bought in each purchase year, 1
+		for the fleet of one vehicle bought every year.
+	custom_discount_rate : float or None
+		Only affects the discount rate of the parameters, the fleet results
+		are nominal.
+	veh_names_pairs_dict : dict
+		Vehicle pairs (ICEV, EV) to simulate, one for each vehicle type.
+	escalation_rates : dict
+		Annual change of inputs (see engine.base_param_names) after the last
+		year with data, for all areas or per area (as a dict area -> rate).
+	survival_shape : float
+		Shape of the Weibull survival curve.
+	max_age : int
+		Age [yr] at which the last vehicles of a cohort are retired.
+	in_life_trajectories : bool
+		Whether the prices and grid intensities change over the life of the
+		vehicles (in each calendar year), instead of keeping those of the
+		purchase year.
+
+	Returns
+	-------
+	fleet : ScenarioCube
+		Annual results of the fleet of each vehicle, with dims "area",
+		"vehicle", "year" (calendar years of the horizon) and "quantity"
+		(see quantities, the costs are nominal).
+	diff : ScenarioCube
+		Differences (EV minus ICEV fleet) of each vehicle pair, with dims
+		"area", "vehicle type", "year", "quantity".
+	"""
+
+	veh_names, i_ICEV, i_EV = get_pairs_indices(veh_names_pairs_dict)
+	tables = t.get_tables(df_vehicles, df_areas, df_income_groups)
+	base_params, trajectories = get_cohort_base_params(tables, veh_names, areas, purchase_years, income_group, custom_discount_rate, escalation_rates, max_age)
+	shape = base_params["lifetime [yr]"].shape #areas, cohorts, vehicles
+	lifetime = base_params["lifetime [yr]"]
+	base_params["lifetime [yr]"] = np.full(shape, float(max_age)) #annual profiles up to the maximum age, weighted with the survival curve
+	params = e.flatten_params(e.derive_params(base_params, trajectories if in_life_trajectories else None), shape)
+	time, mileage, flows = e.get_cash_flows(params)
+	emissions = mileage * e.get_period_values(params["emissions per mile [t/mi]"], time.shape[1])
+	emissions[:,1] += params["production emissions [t]"]
+
+	#share of the vehicles of a cohort in use in each period (on average over the year), the purchase, production and incentives apply to all vehicles bought
+	in_use = (get_survival(time-1, lifetime.ravel()[:,None], survival_shape) + get_survival(time, lifetime.ravel()[:,None], survival_shape)) / 2
+	in_use[:,0] = 0 #pre-purchase
+	in_use[:,1] = 1 #purchase
+	cost_weights = np.repeat(in_use[:,:,None], len(e.cost_type_columns), axis=2)
+	cost_weights[:,:,e.cost_type_columns.index("incentives costs [$]")] = 1
+	dt = np.zeros_like(time)
+	dt[:,1:] = np.diff(time, axis=1)
+	costs = np.nan_to_num(flows * cost_weights) #missing inputs (e.g. prices) do not contribute
+	profiles = np.concatenate([
+				(in_use * dt)[:,:,None],
+				(in_use * mileage)[:,:,None],
+				costs,
+				costs.sum(axis=2, keepdims=True),
+				np.nan_to_num(emissions * in_use)[:,:,None],
+		], axis=2)
+
+	#calendar year of each period: the purchase year for the purchase (and the incentives of the first year), then one year per period
+	n_cohorts = len(purchase_years)
+	calendar_years = np.array(purchase_years)[None,:,None,None] + np.maximum(time.reshape(*shape, -1)-1, 0)
+	first_year = min(purchase_years)
+	years_out = list(range(first_year, max(purchase_years)+1))
+	i_year = (calendar_years - first_year).astype(int)
+	n_purchases = np.broadcast_to(np.asarray(n_purchases, dtype=float), (n_cohorts,))
+	weighted = profiles.reshape(*shape, -1, len(quantities)) * n_purchases[None,:,None,None,None]
+
+	#scatter-add all periods of all cohorts onto the calendar years (periods after the horizon are dropped)
+	fleet = np.zeros((shape[0], shape[2], len(years_out)+1, len(quantities)))
+	i_year = np.where(i_year < len(years_out), i_year, len(years_out))
+	i_area = np.arange(shape[0])[:,None,None,None]
+	i_veh = np.arange(shape[2])[None,None,:,None]
+	np.add.at(fleet, (np.broadcast_to(i_area, i_year.shape), np.broadcast_to(i_veh, i_year.shape), i_year), weighted)
+	fleet = fleet[:,:,:-1]
+
+	coords = {"area": areas, "vehicle": veh_names, "vehicle type": list(veh_names_pairs_dict.keys()), "year": years_out, "quantity": quantities}
+	return (ScenarioCube(fleet, ["area", "vehicle", "year", "quantity"], coords),
+			ScenarioCube(fleet[:,i_EV] - fleet[:,i_ICEV], ["area", "vehicle type", "year", "quantity"], coords))
@@ -85,6 +85,8 @@ numerics = ['int16', 'int32', 'int64', 'float16', 'float32', 'float64']
 # annual_mileage = 11576 #mi/year
 p_DCFC = 0.10 #share of fast-charging for BEV
 eff_charging = 0.95 #charging efficiency
+monthly_insurance_costs = {"ICEV": 149, "EV": 157} #$/month, by powertrain type (area and model dependency to be added later)
+maintenance_costs_per_mile = {"ICEV": 0.101, "EV": 0.061} #$/mi, by powertrain type (area and model dependency to be added later)
 
 R = 0.025 #discount rate
 discount_rate_options = ["Use defaults", *["{0:d}%".format(p) for p in range(0,26)]]
@@ -94,5 +96,109 @@ rec_CO2 = 0 #recycling-phase emissions
 rec_price = 0 #recycling-phase price
 
 
+#input data
+input_snapshot_fn = "data/inputs_snapshot.pkl" #precompiled snapshot of the Excel workbooks in data/, see inputs.py
+
+#import time budget of the headless core (all modules needed to compute results), see check_imports.py
+import_time_budget = 1.0 #s
+
+#benchmarks of the hot paths, see benchmark.py
+benchmark_baseline_fn = "benchmark_baseline.json" #measurements to compare with (recorded with python benchmark.py --save-baseline, on the machine the benchmarks run on)
+benchmark_n_repeats = 5 #timed runs of each benchmark (the median is reported)
+benchmark_tolerance = 0.25 #relative slowdown (or increase of the peak memory) reported as a regression
+
+#tracing and profiling of the hot paths, see tracing.py
+tracing_enabled = False #record spans and counters (otherwise only when a page run is profiled)
+tracing_metrics_fn = "results/metrics.jsonl" #spans and counters recorded while tracing is enabled, None to only keep them in memory
+tracing_max_spans = 10000 #finished spans kept in memory
+profiling_query_param = "profile" #URL query parameter to profile a page run, e.g. ?profile=cprofile or ?profile=pyinstrument
+
+#static image export of Plotly figures, see export.py
+export_n_workers = 4 #number of renderer processes
+export_manifest_fn = "plots/export_manifest.json" #hashes of the exported figures, to skip unchanged ones
+
+#result cache
+model_version = 2 #increase whenever the model changes, so that no results computed by an older version are reused
+cache_max_entries = 2000 #maximum number of results kept in memory
+cache_max_files = 20000 #maximum number of results kept on disk
+cache_directory = "results/cache/"
+cache_custom_discount_rates_on_disk = True #whether to also keep results for custom discount rates on disk (always kept in memory)
+
+#persistence of results computed on demand, see persistence.py: "memory" (never written to disk on the interactive path, the result store and cube are only written by explicit exports such as batch.py), "write-behind" (written by a background thread), or "write-through" (written right away)
+results_persistence = "memory"
+
+#result store
+results_store_directory = "results/store/" #columnar (Parquet) store of all computed results, see store.py
+results_cube_fn = "results/cube.pkl" #cumulative differences of all scenarios offered in the app, for the areas above (written by batch.py, computed at startup if missing or stale)
+
+#uncertainty analysis, see uncertainty.py
+#distribution of the factor that scales the point value of each uncertain input: ("normal", standard deviation), ("lognormal", standard deviation of the logarithm), ("uniform", low, high), or ("triangular", low, high) with the mode at 1
+uncertainty_distributions = {
+				"gas price [$/gal]": ("normal", 0.15),
+				"electricity price [ct/kWh]": ("normal", 0.10),
+				"DCFC electricity price [ct/kWh]": ("normal", 0.15),
+				"share of fast charging": ("uniform", 0.5, 2.5), #p_DCFC of 5-25%
+				"charging efficiency": ("triangular", 0.9, 1.05), #eff_charging of 85.5-99.75%
+				"monthly insurance cost [$]": ("normal", 0.10),
+				"maintenance cost per mile [$/mi]": ("normal", 0.20),
+				"annual mileage [mi]": ("lognormal", 0.25),
+				"lifetime [yr]": ("triangular", 0.7, 1.4),
+	}
+uncertainty_by_powertrain = ["monthly insurance cost [$]", "maintenance cost per mile [$/mi]"] #sampled independently for ICEVs and EVs, all other inputs are the same for all vehicles of a sample
+uncertainty_n_samples = 20000
+uncertainty_percentiles = [5, 25, 50, 75, 95]
+
+#sensitivity analysis, see sensitivity.py
+#range of the factor that scales the point value of each input
+sensitivity_bounds = {
+				"gas price [$/gal]": (0.5, 1.5),
+				"electricity price [ct/kWh]": (0.5, 1.5),
+				"share of fast charging": (0, 3), #p_DCFC of 0-30%
+				"discount rate": (0, 3),
+				"annual mileage [mi]": (0.5, 1.5),
+				"lifetime [yr]": (0.5, 1.5),
+				"incentive [$]": (0, 1), #none to the full federal EV tax credit
+	}
+sensitivity_n_samples = 8192 #base samples of the Sobol design, which needs n_samples*(number of inputs+2) evaluations
+sensitivity_n_trajectories = 100 #Morris trajectories, which need n_trajectories*(number of inputs+1) evaluations
+sensitivity_n_workers = None #worker processes, None for the number of CPUs
+
+#fleet aggregation, see fleet.py
+fleet_income_weights_column = "new vehicle purchases market share" #column of income_groups.xlsx with the share of each income group among the vehicle buyers
+#share of each vehicle type among the vehicles bought (types with overlapping definitions, e.g. "Typical Car" and "Sedan", must not both be included), illustrative values
+fleet_veh_type_mix = {
+				"Sedan": 0.25,
+				"Car SUV": 0.20,
+				"Truck SUV": 0.30,
+				"Minivan/Van": 0.05,
+				"Pickup": 0.20,
+	}
+fleet_n_vehicles = 1 #number of vehicles bought (per area), 1 for the averages per vehicle
+
+#batch evaluation of vehicle catalogs, see catalog.py
+catalog_chunk_size = 2000 #catalog rows read and evaluated at once (times the number of scenarios gives the result rows held in memory)
+catalog_reference_column = "reference vehicle" #optional catalog column with a vehicle of vehicle_types.xlsx to compare each vehicle with
+#column of vehicle_types.xlsx -> column of the catalog (inputs that only apply to the other powertrain type may be missing)
+catalog_columns = {
+				"powertrain_type": "powertrain_type", #"ICEV" or "EV"
+				"average transaction price [$]": "average transaction price [$]",
+				"real-world mpg [mi/gal]": "real-world mpg [mi/gal]",
+				"energy use [kWh/mi]": "energy use [kWh/mi]",
+				"real-world CO2 emissions [g/mi]": "real-world CO2 emissions [g/mi]",
+				"production CO2 footprint [g]": "production CO2 footprint [g]",
+	}
+
+#cohort and fleet turnover simulation, see cohorts.py
+cohort_years = list(range(2021, 2051)) #purchase years of the cohorts
+cohort_max_age = 30 #yr, age at which the last vehicles of a cohort are retired
+cohort_survival_shape = 3.0 #shape of the Weibull survival curve of the vehicles of a cohort (whose mean is the income group-specific lifetime)
+#annual change of the prices and grid intensities after the last year with data of each of them (2022 for the prices, 2021 for the grid intensities, see tables.ParameterTables.last_data_years), at purchase and over the life of the vehicles, for all areas or per area (e.g. {"WA": -0.05, "U.S.": -0.03}), assumptions
+cohort_escalation_rates = {
+				"gas price [$/gal]": 0.02,
+				"electricity price [ct/kWh]": 0.02,
+				"DCFC electricity price [ct/kWh]": 0.02,
+				"electricity emission intensity [g/kWh]": -0.03,
+	}
+
 #consumer behavior
 valuation_ratio = 0.5
@@ -2,7 +2,7 @@
 
 
 def run():
-    import matplotlib
+    import matplotlib.pyplot
     
     matplotlib.pyplot.rcdefaults() #use this to change matplotlib-style-values to default
     matplotlib.pyplot.style.use("config/project.mplstyle")
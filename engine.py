@@ -0,0 +1,603 @@
+"""
+Vectorized computation kernel of the life cycle assessment (LCA).
+
+All requested vehicles are evaluated at once: every cost, present value and
+emissions quantity is computed as one (vehicles x periods x quantities) array
+in a few broadcast operations. The results are only wrapped into the pandas
+DataFrame shape known from LCA.get_results on demand (see to_dataframe).
+
+The periods axis always starts with the "pre-purchase" phase and ends with
+the "post-use" phase. Rows with a shorter lifetime than the longest one in a
+batch are padded with zero-length periods before the "post-use" phase, so
+that vehicles or scenarios with different lifetimes can be evaluated in the
+same batch without changing any (cumulative) result.
+"""
+
+import numpy as np
+import pandas as pd
+
+import tables as t
+
+from config.config import *
+
+
+columns = [
+				"time [yr]", "time (for plotting) [yr]", #only needed for calculations, the actual time is in the index
+				"mileage [mi]", "total mileage [mi]",
+				"purchase costs [$]", "total purchase costs [$]",
+				"incentives costs [$]", "total incentives costs [$]",
+				"operations costs [$]", "total operations costs [$]",
+				"insurance costs [$]", "total insurance costs [$]",
+				"maintenance costs [$]", "total maintenance costs [$]",
+				"costs [$]", "total costs [$]",
+				"future costs [$]", "total future costs [$]", #everything but purchase costs
+				"present value purchase costs [$]", "total present value purchase costs [$]",
+				"present value incentives costs [$]", "total present value incentives costs [$]",
+				"present value operations costs [$]", "total present value operations costs [$]",
+				"present value insurance costs [$]", "total present value insurance costs [$]",
+				"present value maintenance costs [$]", "total present value maintenance costs [$]",
+				"present value costs [$]", "total present value costs [$]",
+				"present value future costs [$]", "total present value future costs [$]",
+				"emissions [tCO$_2$-eq.]", "total emissions [tCO$_2$-eq.]"
+	]
+
+#define subsets of the columns
+non_total_columns = [col for col in columns if not "total" in col and "time" not in col]
+total_columns = [col for col in columns if "total" in col]
+non_total_undiscounted_cost_columns = [col for col in columns if "cost" in col and "total" not in col and "present value" not in col]
+non_total_discounted_cost_columns = [col for col in columns if "cost" in col and "total" not in col and "present value" in col]
+costs_columns = [col for col in columns if "costs" in col]
+emissions_columns = [col for col in columns if "emissions" in col]
+
+#nominal cash flows that are added up to the costs
+cost_type_columns = ["purchase costs [$]", "incentives costs [$]", "operations costs [$]", "insurance costs [$]", "maintenance costs [$]"]
+
+#position of each quantity along the last axis of the results array
+col_idx = {col: i for i,col in enumerate(columns)}
+
+#parameters needed per row (vehicle/scenario combination) of a batch
+param_names = [
+				"purchase price [$]",
+				"incentive [$]", #benefit from incentives, enters the costs with a negative sign
+				"fuel cost per mile [$/mi]",
+				"monthly insurance cost [$]",
+				"maintenance cost per mile [$/mi]",
+				"emissions per mile [t/mi]",
+				"production emissions [t]",
+				"annual mileage [mi]",
+				"lifetime [yr]",
+				"discount rate",
+	]
+
+#parameters that may also be given per year of use, as arrays of shape (N, years of use) (see derive_params and get_period_values)
+period_param_names = [
+				"fuel cost per mile [$/mi]",
+				"emissions per mile [t/mi]",
+	]
+
+
+def get_lifetime_range(lifetime):
+	""" Get the list of points in time [yr] over the lifetime of a vehicle (0, 1, ..., and the fractional lifetime if needed) """
+	lifetime = round(lifetime, 2)
+	lifetime_range = list(range(int(np.floor(lifetime))+1))
+	if int(lifetime) != lifetime: #if lifetime is an even number, we do not need to add another element to lifetime_range
+		lifetime_range += [lifetime]
+	return lifetime_range
+
+def get_times(lifetime):
+	""" Get the index of the results of one vehicle, i.e. the lifetime range framed by the "pre-purchase" and "post-use" phases """
+	return ["pre-purchase", *get_lifetime_range(lifetime), "post-use"]
+
+def get_n_periods(lifetimes):
+	""" Get the number of periods (including "pre-purchase" and "post-use") needed to hold all given lifetimes """
+	lifetimes = np.round(np.asarray(lifetimes, dtype=float), 2)
+	n_lifetime_points = np.floor(lifetimes) + 1 + (np.floor(lifetimes) != lifetimes)
+	return int(n_lifetime_points.max()) + 2
+
+def get_time_grid(lifetimes, n_periods=None):
+	"""
+	Get the time [yr] of each period for an array of lifetimes.
+
+	Parameters
+	----------
+	lifetimes : array-like of shape (N,)
+		Vehicle lifetimes [yr].
+	n_periods : int, optional
+		Number of periods. The default is the minimum number of periods
+		needed to hold all lifetimes (see get_n_periods).
+
+	Returns
+	-------
+	time : numpy.ndarray of shape (N, n_periods)
+		The "pre-purchase" period is at time 0, the "post-use" period and
+		any padding periods are at the end of the lifetime.
+	"""
+
+	lifetimes = np.round(np.asarray(lifetimes, dtype=float), 2)
+	if n_periods is None:
+		n_periods = get_n_periods(lifetimes)
+
+	time = np.empty((len(lifetimes), n_periods))
+	time[:,0] = 0 #pre-purchase
+	time[:,1:-1] = np.minimum(np.arange(n_periods-2), lifetimes[:,None])
+	time[:,-1] = lifetimes #post-use
+	return time
+
+#underlying inputs per row, from which derive_params calculates the parameters
+base_param_names = [
+				"is EV",
+				"purchase price [$]",
+				"incentive [$]",
+				"gas price [$/gal]",
+				"electricity price [ct/kWh]",
+				"DCFC electricity price [ct/kWh]",
+				"share of fast charging", #p_DCFC
+				"charging efficiency", #eff_charging
+				"real-world mpg [mi/gal]",
+				"energy use [kWh/mi]",
+				"real-world CO2 emissions [g/mi]",
+				"electricity emission intensity [g/kWh]",
+				"monthly insurance cost [$]",
+				"maintenance cost per mile [$/mi]",
+				"production emissions [t]",
+				"annual mileage [mi]",
+				"lifetime [yr]",
+				"discount rate",
+	]
+
+def get_base_params(df_vehicles, df_areas, df_income_groups, veh_names, area, year, income_group, custom_discount_rate=None, tables=None):
+	""" Get the underlying inputs (prices, vehicle properties, driving patterns, ...) of the given vehicles in one scenario, see derive_params. They are gathered from the compiled parameter tables of the input data (see tables.py), which can be passed if already known. """
+	if tables is None:
+		tables = t.get_tables(df_vehicles, df_areas, df_income_groups)
+	base_params = tables.get_base_params(veh_names, [area], [year], [income_group], [custom_discount_rate])
+	return {name: base_params[name].reshape(len(veh_names)) for name in base_param_names}
+
+def derive_params(base_params, trajectories=None):
+	"""
+	Calculate the parameters needed by run from the underlying inputs (arrays
+	of any shape, see get_base_params).
+
+	trajectories optionally holds the values of some underlying inputs (e.g.
+	the prices) in each year of use, as arrays of the shape of the other
+	inputs with an additional last axis for the years of use (see
+	tables.ParameterTables.get_trajectories). The parameters in
+	period_param_names then also get this last axis.
+	"""
+	if trajectories is not None:
+		b = {name: trajectories[name] if name in trajectories else np.asarray(values)[...,None] for name,values in base_params.items()}
+		return {name: values if name in period_param_names else values[...,0] for name,values in derive_params(b).items()}
+
+	b = base_params
+	is_EV = b["is EV"].astype(bool)
+	with np.errstate(invalid="ignore", divide="ignore"): #the inputs of the other powertrain type are missing
+		fuel_cost_per_mile_ICEV = b["gas price [$/gal]"] / b["real-world mpg [mi/gal]"]
+		fuel_cost_per_mile_EV = (0.01*((1-b["share of fast charging"])*b["electricity price [ct/kWh]"] + b["share of fast charging"]*b["DCFC electricity price [ct/kWh]"]) * b["energy use [kWh/mi]"])
+		emissions_per_mile_EV = b["energy use [kWh/mi]"] * b["electricity emission intensity [g/kWh]"] / b["charging efficiency"]
+	return {
+				"purchase price [$]": b["purchase price [$]"],
+				"incentive [$]": b["incentive [$]"],
+				"fuel cost per mile [$/mi]": np.where(is_EV, fuel_cost_per_mile_EV, fuel_cost_per_mile_ICEV),
+				"monthly insurance cost [$]": b["monthly insurance cost [$]"],
+				"maintenance cost per mile [$/mi]": b["maintenance cost per mile [$/mi]"],
+				"emissions per mile [t/mi]": np.where(is_EV, emissions_per_mile_EV, b["real-world CO2 emissions [g/mi]"])*1e-6, #g to t conversion
+				"production emissions [t]": b["production emissions [t]"],
+				"annual mileage [mi]": b["annual mileage [mi]"],
+				"lifetime [yr]": b["lifetime [yr]"],
+				"discount rate": b["discount rate"],
+		}
+
+def get_params(df_vehicles, df_areas, df_income_groups, veh_names, area, year, income_group, custom_discount_rate=None, tables=None):
+	""" Get the parameters of the given vehicles in one scenario as needed by run """
+	return derive_params(get_base_params(df_vehicles, df_areas, df_income_groups, veh_names, area, year, income_group, custom_discount_rate, tables))
+
+def broadcast_params(params):
+	""" Broadcast all parameters to arrays of shape (N,), or (N, years of use) for parameters in period_param_names given per year of use """
+	lifetime = np.atleast_1d(np.asarray(params["lifetime [yr]"], dtype=float))
+	N = len(lifetime)
+	broadcast = dict()
+	for name in param_names:
+		values = np.asarray(params[name], dtype=float)
+		if name in period_param_names and values.ndim == 2:
+			broadcast[name] = np.broadcast_to(values, (N, values.shape[1]))
+		else:
+			broadcast[name] = np.broadcast_to(values, (N,))
+	return broadcast
+
+def flatten_params(params, shape):
+	""" Flatten parameters of the given scenario shape (e.g. of a grid of scenarios) to arrays of shape (N,), keeping the last axis of parameters given per year of use """
+	return {name: values.reshape(-1, values.shape[-1]) if values.ndim > len(shape) else values.reshape(-1) for name,values in params.items()}
+
+def get_period_values(values, n_periods):
+	"""
+	Get the value of a parameter in each period, as an array of shape (N, 1)
+	for a constant parameter (shape (N,)) or (N, n_periods) for one given per
+	year of use (shape (N, years of use)). Year of use k (the time from k to
+	k+1) is period k+2, after the "pre-purchase" and purchase periods; the
+	last value holds for any later years.
+	"""
+	if values.ndim == 1:
+		return values[:,None]
+	i_year = np.clip(np.arange(n_periods)-2, 0, values.shape[1]-1)
+	return values[:,i_year]
+
+def get_cash_flows(params, n_periods=None):
+	"""
+	Get the nominal (undiscounted) cash flows of a batch of vehicles. These
+	do not depend on the discount rate and can be re-priced for any discount
+	rate with get_present_values.
+
+	Parameters
+	----------
+	params : dict
+		Dictionary with one array-like of shape (N,) (or a scalar) for each
+		entry of param_names ("discount rate" is not used), or of shape (N,
+		years of use) for entries of period_param_names given per year of use.
+	n_periods : int, optional
+		Number of periods, see get_time_grid.
+
+	Returns
+	-------
+	time : numpy.ndarray of shape (N, n_periods)
+		Time [yr] of each period.
+	mileage : numpy.ndarray of shape (N, n_periods)
+		Mileage [mi] driven in each period.
+	flows : numpy.ndarray of shape (N, n_periods, len(cost_type_columns))
+		Nominal costs [$] in each period, the last axis is ordered like
+		cost_type_columns.
+	"""
+
+	params = broadcast_params(params)
+	time = get_time_grid(params["lifetime [yr]"], n_periods)
+	N,T = time.shape
+	p = {name: get_period_values(values, T) for name,values in params.items()}
+
+	dt = np.zeros((N,T))
+	dt[:,1:] = np.diff(time, axis=1)
+	mileage = dt * p["annual mileage [mi]"]
+
+	flows = np.zeros((N, T, len(cost_type_columns)))
+	flows[:,1,0] = p["purchase price [$]"][:,0]
+	flows[:,2,1] = -p["incentive [$]"][:,0]
+	flows[:,:,2] = mileage * p["fuel cost per mile [$/mi]"]
+	flows[:,:,3] = dt * p["monthly insurance cost [$]"]*12
+	flows[:,:,4] = mileage * p["maintenance cost per mile [$/mi]"]
+	return time, mileage, flows
+
+def get_period_results(params, n_periods=None):
+	"""
+	Calculate the costs and emissions in each period (not cumulative) for a
+	batch of vehicles, the kernel shared by run and get_totals.
+
+	Parameters
+	----------
+	params : dict
+		Dictionary with one array-like of shape (N,) (or a scalar) for each
+		entry of param_names, or of shape (N, years of use) for entries of
+		period_param_names given per year of use.
+	n_periods : int, optional
+		Number of periods, see get_time_grid.
+
+	Returns
+	-------
+	time : numpy.ndarray of shape (N, n_periods)
+		Time [yr] of each period.
+	values : numpy.ndarray of shape (N, n_periods, len(non_total_columns))
+		Unrounded results of each period, the last axis is ordered like
+		non_total_columns.
+	"""
+
+	time, mileage, flows = get_cash_flows(params, n_periods)
+	N,T = time.shape
+	p = {name: get_period_values(values, T) for name,values in broadcast_params(params).items()}
+
+	values = np.empty((N, T, len(non_total_columns)))
+	values[:,:,non_total_columns.index("mileage [mi]")] = mileage
+
+	#nominal costs
+	undiscounted_idx = [non_total_columns.index(col) for col in non_total_undiscounted_cost_columns]
+	values[:,:,[non_total_columns.index(col) for col in cost_type_columns]] = flows
+	values[:,:,non_total_columns.index("costs [$]")] = np.nansum(flows, axis=2) #missing inputs (e.g. prices) do not contribute
+	values[:,:,non_total_columns.index("future costs [$]")] = np.nansum(flows[:,:,1:], axis=2)
+
+	#discount costs
+	discounted_idx = [non_total_columns.index("present value "+col) for col in non_total_undiscounted_cost_columns]
+	values[:,:,discounted_idx] = values[:,:,undiscounted_idx] / ((1 + p["discount rate"])**time)[:,:,None]
+
+	#emissions
+	i_emissions = non_total_columns.index("emissions [tCO$_2$-eq.]")
+	values[:,:,i_emissions] = mileage * p["emissions per mile [t/mi]"]
+	values[:,0,i_emissions] = 0
+	values[:,1,i_emissions] = p["production emissions [t]"][:,0]
+	return time, values
+
+def run(params, n_periods=None):
+	"""
+	Calculate costs and emissions over the lifetime for a batch of vehicles.
+
+	Parameters
+	----------
+	params : dict
+		Dictionary with one array-like of shape (N,) (or a scalar) for each
+		entry of param_names, or of shape (N, years of use) for entries of
+		period_param_names given per year of use.
+	n_periods : int, optional
+		Number of periods, see get_time_grid.
+
+	Returns
+	-------
+	results : numpy.ndarray of shape (N, n_periods, len(columns))
+		Unrounded results, the last axis is ordered like columns.
+	"""
+
+	time, values = get_period_results(params, n_periods)
+	N,T = time.shape
+
+	results = np.zeros((N, T, len(columns)))
+	results[:,:,col_idx["time [yr]"]] = time
+	results[:,:,col_idx["time (for plotting) [yr]"]] = time
+	results[:,0,col_idx["time (for plotting) [yr]"]] = -0.1*time[:,-1]
+	results[:,-1,col_idx["time (for plotting) [yr]"]] = 1.1*time[:,-1]
+	results[:,:,[col_idx[col] for col in non_total_columns]] = values
+
+	#cumulative costs/emissions
+	results[:,:,[col_idx["total "+col] for col in non_total_columns]] = cumsum(values, axis=1)
+	return results
+
+def get_totals(params, n_periods=None):
+	"""
+	Calculate only the total (lifetime) results of a batch of vehicles, like
+	the "post-use" period of run, but without the cumulative sums of all
+	periods.
+
+	Returns
+	-------
+	totals : numpy.ndarray of shape (N, len(total_columns))
+		Unrounded totals, the last axis is ordered like total_columns.
+	"""
+
+	time, values = get_period_results(params, n_periods)
+
+	#like the last row of the cumulative sums (see cumsum)
+	totals = np.nansum(values, axis=1)
+	totals[np.isnan(values[:,-1])] = np.nan
+	return totals
+
+def run_totals(params, chunk_size=1024):
+	"""
+	Calculate only the total (lifetime) results of a batch of vehicles, in
+	chunks of up to chunk_size rows (which bounds the memory use and keeps the
+	arrays of a chunk in the CPU caches).
+
+	Returns
+	-------
+	totals : numpy.ndarray of shape (N, len(total_columns))
+		Unrounded results of the "post-use" period.
+	"""
+	params = broadcast_params(params)
+	n_periods = get_n_periods(params["lifetime [yr]"])
+	N = len(params["lifetime [yr]"])
+	totals = np.empty((N, len(total_columns)))
+	for start in range(0, N, chunk_size):
+		chunk = {name: values[start:start+chunk_size] for name,values in params.items()}
+		totals[start:start+chunk_size] = get_totals(chunk, n_periods)
+	return totals
+
+def get_discount_factors(time, discount_rates):
+	"""
+	Get the discount factors (1+r)^-t.
+
+	Parameters
+	----------
+	time : numpy.ndarray of shape (N, T)
+		Time [yr] of each period, see get_cash_flows.
+	discount_rates : array-like of shape (R,) or (N, R)
+		Discount rates, either the same for all rows or one set per row.
+
+	Returns
+	-------
+	discount_factors : numpy.ndarray of shape (N, R, T)
+	"""
+	discount_rates = np.asarray(discount_rates, dtype=float)
+	if discount_rates.ndim < 2:
+		discount_rates = np.atleast_1d(discount_rates)[None,:]
+	return (1 + discount_rates[:,:,None])**(-time[:,None,:])
+
+def get_present_values(time, flows, discount_rates):
+	"""
+	Re-price nominal cash flows for any vector of discount rates with one
+	discount-factor matrix product.
+
+	Parameters
+	----------
+	time, flows : numpy.ndarray
+		Time grid and nominal cash flows as returned by get_cash_flows.
+	discount_rates : array-like of shape (R,) or (N, R)
+		Discount rates, see get_discount_factors.
+
+	Returns
+	-------
+	present_values : numpy.ndarray of shape (N, R, len(non_total_discounted_cost_columns))
+		Total (lifetime) present values, the last axis is ordered like
+		"total "+col for col in non_total_discounted_cost_columns (i.e. the
+		cost types, followed by all costs and future costs).
+	"""
+	flows = np.nan_to_num(flows) #missing inputs (e.g. prices) do not contribute
+	present_values = np.matmul(get_discount_factors(time, discount_rates), flows)
+	return np.concatenate([present_values, present_values.sum(axis=2, keepdims=True), present_values[...,1:].sum(axis=2, keepdims=True)], axis=2)
+
+def get_break_even_discount_rates(time, flows, rate_bounds=(0, 1), n_iterations=60):
+	"""
+	Get the discount rates at which the total present value of cash flows is
+	zero, e.g. of the cost differences between two vehicles. Solved for all
+	rows at once with a vectorized bisection.
+
+	Parameters
+	----------
+	time : numpy.ndarray of shape (N, T)
+		Time [yr] of each period.
+	flows : numpy.ndarray of shape (N, T)
+		Nominal cash flows (e.g. EV minus ICEV costs) in each period.
+	rate_bounds : tuple
+		Interval of discount rates to search.
+	n_iterations : int
+		Number of bisection steps (the interval shrinks by a factor of two
+		with each step).
+
+	Returns
+	-------
+	break_even_discount_rates : numpy.ndarray of shape (N,)
+		NaN where the present value does not change its sign within
+		rate_bounds.
+	"""
+
+	flows = np.nan_to_num(flows)
+	def get_present_value(discount_rates):
+		return (flows * (1 + discount_rates[:,None])**(-time)).sum(axis=1)
+
+	N = len(time)
+	lo = np.full(N, float(rate_bounds[0]))
+	hi = np.full(N, float(rate_bounds[1]))
+	pv_lo = get_present_value(lo)
+	valid = np.sign(pv_lo) != np.sign(get_present_value(hi))
+	for _ in range(n_iterations):
+		mid = (lo+hi)/2
+		pv_mid = get_present_value(mid)
+		same_sign = np.sign(pv_mid) == np.sign(pv_lo)
+		lo = np.where(same_sign, mid, lo)
+		pv_lo = np.where(same_sign, pv_mid, pv_lo)
+		hi = np.where(same_sign, hi, mid)
+	return np.where(valid, (lo+hi)/2, np.nan)
+
+def get_break_even_points(x, y):
+	"""
+	Get the first x at which y drops to zero or below, by linear
+	interpolation between periods, for all rows at once (e.g. the time at
+	which the cumulative cost difference between two vehicles turns
+	negative).
+
+	Parameters
+	----------
+	x : numpy.ndarray of shape (N, T)
+		Increasing values (e.g. time or mileage) of each period.
+	y : numpy.ndarray of shape (N, T)
+		Values in each period.
+
+	Returns
+	-------
+	break_even_points : numpy.ndarray of shape (N,)
+		x[:,0] where y starts at or below zero, NaN where y stays above zero.
+	"""
+
+	below = y <= 0
+	j = below.argmax(axis=1)
+	crosses = below[np.arange(len(y)),j]
+	j_prev = np.maximum(j-1, 0)
+	x0, x1 = np.take_along_axis(x, j_prev[:,None], 1)[:,0], np.take_along_axis(x, j[:,None], 1)[:,0]
+	y0, y1 = np.take_along_axis(y, j_prev[:,None], 1)[:,0], np.take_along_axis(y, j[:,None], 1)[:,0]
+	with np.errstate(invalid="ignore", divide="ignore"):
+		x_cross = np.where(j == 0, x0, x0 + (x1-x0) * y0/(y0-y1))
+	return np.where(crosses, x_cross, np.nan)
+
+def cumsum(a, axis):
+	""" Cumulative sum that skips missing values but keeps them missing in the output (like pandas.DataFrame.cumsum) """
+	total = np.nancumsum(a, axis=axis)
+	total[np.isnan(a)] = np.nan
+	return total
+
+def round_results(results, result_columns=columns):
+	""" Round costs to full dollars and emissions to two decimals (like the results written by LCA.run), the last axis of results is ordered like result_columns """
+	results = results.copy()
+	costs_idx = [i for i,col in enumerate(result_columns) if col in costs_columns]
+	emissions_idx = [i for i,col in enumerate(result_columns) if col in emissions_columns]
+	results[...,costs_idx] = np.round(results[...,costs_idx], 0)
+	results[...,emissions_idx] = np.round(results[...,emissions_idx], 2)
+	return results
+
+def get_missing_mask(times, is_EV):
+	"""
+	Get the mask of entries that are not defined in the results of one
+	vehicle (e.g. purchase costs in later years), same as in the original
+	DataFrame-based implementation of LCA.run.
+	"""
+
+	T = len(times)
+	missing = np.zeros((T, len(columns)), dtype=bool)
+	for col in cost_type_columns:
+		for prefix in ["", "present value "]:
+			for total in ["", "total "]:
+				i = col_idx[total+prefix+col]
+				if col == "purchase costs [$]": #only defined at purchase (and in pre-purchase/post-use phase)
+					missing[2:-1,i] = True
+				elif col == "incentives costs [$]": #only defined when received (and in pre-purchase/post-use phase)
+					missing[1:-1,i] = True
+					missing[2,i] = not is_EV
+				else: #O&M costs are not defined in the pre-purchase phase
+					missing[0,i] = True
+	return missing
+
+class Results:
+	"""
+	Results of one vehicle in one scenario, with one row per period (the
+	"pre-purchase" phase, the years 0, 1, ..., the lifetime, and the
+	"post-use" phase) and one column per entry of columns. Costs and emissions
+	are rounded like the results previously written by LCA.run, entries that
+	are not defined (e.g. purchase costs in later years) are NaN.
+
+	Parameters
+	----------
+	values : numpy.ndarray of shape (len(times), len(columns))
+		The results (float64).
+	times : list
+		Period labels, see get_times.
+	integer_columns : numpy.ndarray of shape (len(columns),)
+		Whether the unrounded values of each column are whole numbers, which
+		determines the column types of the DataFrame returned by to_dataframe.
+	"""
+
+	__slots__ = ("values", "times", "integer_columns")
+
+	def __init__(self, values, times, integer_columns):
+		self.values = values
+		self.times = times
+		self.integer_columns = integer_columns
+
+	def __getitem__(self, col):
+		""" Get the values of one column over all periods """
+		return self.values[:,col_idx[col]]
+
+	def copy(self):
+		return Results(self.values.copy(), self.times, self.integer_columns)
+
+	def get_post_use(self, result_columns=total_columns):
+		""" Get the values of the "post-use" phase, i.e. the lifetime totals """
+		return self.values[-1,[col_idx[col] for col in result_columns]]
+
+	def to_dataframe(self):
+		""" Convert to a DataFrame in the format previously produced by LCA.run (for display), with nullable integer/float columns indexed by period """
+		df_results = pd.DataFrame(self.values, index=pd.Index(self.times, dtype=object, name="period [yr]"), columns=columns)
+		return df_results.astype({col: "Int64" if is_integer else "Float64" for col,is_integer in zip(columns, self.integer_columns)})
+
+
+def get_results(results, lifetime, is_EV):
+	"""
+	Wrap the results of one vehicle into a Results object.
+
+	Parameters
+	----------
+	results : numpy.ndarray of shape (n_periods, len(columns))
+		Unrounded results of one row of a batch computed by run.
+	lifetime : float
+		Lifetime [yr] of the vehicle, used to remove padding periods.
+	is_EV : bool
+		Whether the vehicle is an EV (determines when incentives apply).
+	"""
+
+	times = get_times(lifetime)
+	results = np.concatenate([results[:len(times)-1], results[-1:]]) #remove padding periods
+	results = np.where(get_missing_mask(times, is_EV), np.nan, results)
+	integer_columns = np.all(np.isnan(results) | (results == np.round(results)), axis=0) #as pandas.DataFrame.convert_dtypes
+	return Results(round_results(results), times, integer_columns)
+
+def to_dataframe(results, lifetime, is_EV):
+	""" Wrap the results of one vehicle into a DataFrame in the format previously produced by LCA.run, see get_results """
+	return get_results(results, lifetime, is_EV).to_dataframe()
@@ -0,0 +1,145 @@
+"""
+Batched static image export of Plotly figures.
+
+Exporting figures one by one (fig.write_image) starts the Kaleido renderer
+for every figure. Instead, write_image queues the figures while a batch is
+open, and renders them at the end of the batch through a pool of renderer
+processes, each of which renders its whole share of the figures in one
+Kaleido session (plotly.io.write_images). Outside of a batch, figures are
+rendered right away.
+
+Figures are only rendered if they changed: the hash of each exported figure
+(its full specification and the export settings) is recorded in a manifest,
+and a figure whose file exists with an unchanged hash is skipped. Example:
+
+	with export.batch(n_workers=4) as exported:
+		for income_group in income_groups:
+			h.plot_waterfall_one_both(veh_type, area, year, income_group, save_figure=True)
+	print(exported.n_rendered, exported.n_skipped)
+"""
+
+import os
+import json
+import hashlib
+import threading
+import multiprocessing
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+
+import tracing
+
+from config.config import *
+
+
+thread_data = threading.local() #queued_jobs and result of each thread: list of jobs and BatchResult while a batch is open in the thread, queued_jobs None otherwise
+manifest_lock = threading.Lock()
+
+
+def get_job(fig, fn, width=None, height=None, scale=None):
+	""" Get an export job, i.e. the figure specification (picklable), the file and the export settings """
+	job = {"fig": fig.to_dict(), "fn": fn, "width": width, "height": height, "scale": scale}
+	job["hash"] = hashlib.sha256(json.dumps(job, sort_keys=True, default=str).encode()).hexdigest()
+	return job
+
+def read_manifest(manifest_fn=export_manifest_fn):
+	""" Read the hashes of the exported figures (file -> hash) """
+	try:
+		with open(manifest_fn) as f:
+			return json.load(f)
+	except (OSError, ValueError): #missing or damaged, export all figures again
+		return dict()
+
+def update_manifest(jobs, manifest_fn=export_manifest_fn):
+	"""
+	Record the hashes of exported figures. Other processes may export at the
+	same time, so the manifest is read again right before it is replaced
+	(atomically); an update that is lost nonetheless only leads to a figure
+	being exported again.
+	"""
+	with manifest_lock:
+		manifest = read_manifest(manifest_fn)
+		manifest.update({job["fn"]: job["hash"] for job in jobs})
+		os.makedirs(os.path.dirname(manifest_fn) or ".", exist_ok=True)
+		tmp_fn = manifest_fn+".%d.tmp"%os.getpid()
+		with open(tmp_fn, "w") as f:
+			json.dump(manifest, f, indent=0, sort_keys=True)
+		os.replace(tmp_fn, manifest_fn)
+
+def render_jobs(jobs):
+	""" Render jobs in one Kaleido session (in this process) """
+	import plotly.io as pio
+
+	for job in jobs:
+		os.makedirs(os.path.dirname(job["fn"]) or ".", exist_ok=True)
+	pio.write_images(
+				fig=[job["fig"] for job in jobs],
+				file=[job["fn"] for job in jobs],
+				width=[job["width"] for job in jobs],
+				height=[job["height"] for job in jobs],
+				scale=[job["scale"] for job in jobs],
+		)
+	return len(jobs)
+
+def render(jobs, n_workers=export_n_workers, force=False):
+	"""
+	Render export jobs, skipping the ones whose file is up to date (unless
+	force is set), with up to n_workers renderer processes.
+
+	Returns
+	-------
+	n_rendered, n_skipped : int
+	"""
+
+	#the last job of the same file wins, as if the figures were written one after another
+	jobs = list({job["fn"]: job for job in jobs}.values())
+	if not force:
+		manifest = read_manifest()
+		jobs_to_render = [job for job in jobs if manifest.get(job["fn"]) != job["hash"] or not os.path.isfile(job["fn"])]
+	else:
+		jobs_to_render = jobs
+	if len(jobs_to_render) == 0:
+		return 0, len(jobs)
+
+	n_workers = max(1, min(n_workers, len(jobs_to_render)))
+	if n_workers == 1:
+		render_jobs(jobs_to_render)
+	else:
+		shards = [jobs_to_render[i::n_workers] for i in range(n_workers)]
+		with ProcessPoolExecutor(max_workers=n_workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+			list(executor.map(render_jobs, shards))
+	update_manifest(jobs_to_render)
+	return len(jobs_to_render), len(jobs)-len(jobs_to_render)
+
+def write_image(fig, fn, width=None, height=None, scale=None):
+	""" Export a figure to fn (queued if a batch is open, otherwise right away), replaces fig.write_image """
+	job = get_job(fig, fn, width, height, scale)
+	queued_jobs = getattr(thread_data, "queued_jobs", None)
+	if queued_jobs is not None:
+		queued_jobs.append(job)
+	else:
+		render([job], n_workers=1)
+
+class BatchResult:
+	""" Counts of an export batch, set when the batch closes: n_rendered (rendered figures) and n_skipped (unchanged figures that were skipped) """
+
+	def __init__(self):
+		self.n_rendered = 0
+		self.n_skipped = 0
+
+@contextmanager
+def batch(n_workers=export_n_workers, force=False):
+	""" Queue all figures exported with write_image within the batch (by the same thread), and render them at its end (see render), yields a BatchResult with the counts """
+	if getattr(thread_data, "queued_jobs", None) is not None: #nested batch, the outermost one renders (and counts)
+		yield thread_data.result
+		return
+	thread_data.queued_jobs = []
+	thread_data.result = BatchResult()
+	try:
+		yield thread_data.result
+		jobs = thread_data.queued_jobs
+	finally:
+		thread_data.queued_jobs = None
+	result = thread_data.result
+	result.n_rendered, result.n_skipped = render(jobs, n_workers, force)
+	tracing.count("exported figures", result.n_rendered)
+	tracing.count("skipped unchanged figures", result.n_skipped)
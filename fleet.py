@@ -0,0 +1,121 @@
+"""
+Fleet-level aggregation of the differences between EVs and ICEVs.
+
+The differences of all scenarios (see sweep.run_grid) are weighted by the
+share of each income group among the vehicle buyers (a column of
+income_groups.xlsx) and by a mix of vehicle types, in one tensor contraction
+over the income groups and vehicle types. Multiplied by the number of
+vehicles bought in each area, this gives population-level totals of the
+cost differences and emissions differences of buying EVs instead of ICEVs,
+per area (negative values are savings). Example:
+
+	totals = fleet.run_fleet(df_vehicles, df_areas, df_income_groups, n_vehicles={"U.S.": 1e6, "WA": 3e4})
+	totals.sel(year=2022, discount_rate=None).to_frame()
+"""
+
+import numpy as np
+
+import sweep
+from sweep import ScenarioCube
+
+from config.config import *
+
+
+def get_income_group_weights(df_income_groups, income_groups=income_groups, weights_column=fleet_income_weights_column):
+	""" Get the weights of the income groups (normalized to a sum of 1) from a column of income_groups.xlsx """
+	if weights_column not in df_income_groups.columns:
+		raise ValueError("income_groups.xlsx: missing column '%s' with the weights of the income groups"%weights_column)
+	weights = df_income_groups.loc[income_groups, weights_column].to_numpy(dtype=float)
+	if not np.isfinite(weights.sum()) or weights.sum() == 0:
+		raise ValueError("income_groups.xlsx: the weights of the income groups in column '%s' must have a finite, nonzero sum (got %s)"%(weights_column, weights.sum()))
+	return weights / weights.sum()
+
+def get_veh_type_weights(veh_type_mix=fleet_veh_type_mix):
+	""" Get the vehicle types and their weights (normalized to a sum of 1) of a mix of vehicle types """
+	veh_types = [veh_type for veh_type,share in veh_type_mix.items() if share > 0]
+	weights = np.array([veh_type_mix[veh_type] for veh_type in veh_types], dtype=float)
+	return veh_types, weights / weights.sum()
+
+def get_n_vehicles(areas, n_vehicles):
+	""" Get the number of vehicles in each area, from a number for all areas or a dict (area -> number) """
+	if isinstance(n_vehicles, dict):
+		return np.array([n_vehicles[area] for area in areas], dtype=float)
+	return np.full(len(areas), n_vehicles, dtype=float)
+
+def aggregate(cube, income_group_weights, veh_types, veh_type_weights, n_vehicles=fleet_n_vehicles, by_veh_type=False):
+	"""
+	Aggregate the differences of a cube over the income groups and vehicle
+	types.
+
+	Parameters
+	----------
+	cube : ScenarioCube
+		Cumulative differences as returned by sweep.run_grid.
+	income_group_weights : numpy.ndarray
+		Weight of each income group of the cube.
+	veh_types : list
+		Vehicle types of the mix (all of them must be in the cube).
+	veh_type_weights : numpy.ndarray
+		Weight of each vehicle type in veh_types.
+	n_vehicles : float or dict
+		Number of vehicles bought (in each area, if a dict).
+	by_veh_type : bool
+		Whether to keep the contribution of each vehicle type (which add up to
+		the totals) instead of summing over them.
+
+	Returns
+	-------
+	totals : ScenarioCube
+		Dims "area", "year", "discount rate", ("vehicle type",) "quantity".
+	"""
+
+	i_veh_types = [cube.get_index("vehicle type", veh_type) for veh_type in veh_types]
+	values = cube.values.take(i_veh_types, axis=cube.dims.index("vehicle type"))
+	n_vehicles = get_n_vehicles(cube.coords["area"], n_vehicles)
+	if by_veh_type:
+		totals = np.einsum("ayirvq,a,i,v->ayrvq", values, n_vehicles, income_group_weights, veh_type_weights, optimize=True)
+	else:
+		totals = np.einsum("ayirvq,a,i,v->ayrq", values, n_vehicles, income_group_weights, veh_type_weights, optimize=True)
+
+	dims = ["area", "year", "discount rate", "vehicle type", "quantity"] if by_veh_type else ["area", "year", "discount rate", "quantity"]
+	coords = dict(cube.coords, **{"vehicle type": veh_types})
+	return ScenarioCube(totals, dims, coords)
+
+def run_fleet(df_vehicles, df_areas, df_income_groups, areas=areas, years=years, custom_discount_rates=[None], veh_type_mix=fleet_veh_type_mix, weights_column=fleet_income_weights_column, n_vehicles=fleet_n_vehicles, by_veh_type=False, cube=None):
+	"""
+	Get the population-level totals of the differences (EV minus ICEV) of a
+	fleet of vehicles bought by all income groups, per area.
+
+	Parameters
+	----------
+	df_vehicles, df_areas, df_income_groups : pandas.DataFrame
+		Input data (see Start.get_data).
+	areas, years, custom_discount_rates : list
+		Scenario dimensions, see sweep.run_grid.
+	veh_type_mix : dict
+		Share of each vehicle type (of veh_names_pairs_dict) among the vehicles
+		bought, see fleet_veh_type_mix in config.config.
+	weights_column : str
+		Column of income_groups.xlsx with the share of each income group among
+		the buyers.
+	n_vehicles : float or dict
+		Number of vehicles bought (in each area, if a dict), 1 for the average
+		per vehicle.
+	by_veh_type : bool
+		Whether to keep the contribution of each vehicle type.
+	cube : ScenarioCube, optional
+		Precomputed differences of all income groups (e.g. the results cube
+		of the app, see helpers.get_results_cube), used instead of computing
+		them for areas, years and custom_discount_rates.
+
+	Returns
+	-------
+	totals : ScenarioCube
+		Dims "area", "year", "discount rate", ("vehicle type",) "quantity".
+	"""
+
+	veh_types, veh_type_weights = get_veh_type_weights(veh_type_mix)
+	if cube is None:
+		cube = sweep.run_grid(df_vehicles, df_areas, df_income_groups, areas, years, income_groups, custom_discount_rates, {veh_type: veh_names_pairs_dict[veh_type] for veh_type in veh_types})
+	income_group_weights = get_income_group_weights(df_income_groups, cube.coords["income group"], weights_column)
+	return aggregate(cube, income_group_weights, veh_types, veh_type_weights, n_vehicles, by_veh_type)
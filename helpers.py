@@ -1,27 +1,60 @@
 import os
 import pandas as pd
 import numpy as np
-import plotly.graph_objects as go
 
 from LCA import LCA
+import cache as c
+import store as s
+import persistence
+import tracing
+import sweep
+import inputs
+import export as ex
 
 from config.config import *
 
-from Start import df_vehicles,df_areas,df_income_groups
-
 
 def get_fn(area, year, income_group, custom_discount_rate):
 	fn = "area={0:s}_year={1:d}_income_group={2:s}".format(area, year, income_group)
 	if custom_discount_rate is not None:
-		# fn += "_{0:g}%".format(custom_discount_rate*100)
-		fn += "_custom_discount_rate"
+		fn += "_{0:g}%".format(custom_discount_rate*100) #one file per custom discount rate, so that different rates do not overwrite each other
 	return fn
 
-def get_diff_cum_df_fn_full(area, year, income_group, custom_discount_rate):
-	""" Get full filename for dataframe of cumulative cost differences for all vehicle pairs """
-	diff_cum_df_fn_full = "results/"+"cumulative differences/"+get_fn(area, year, income_group, custom_discount_rate)+".csv"
-	return diff_cum_df_fn_full
+def get_diff_cum_df_key(df_vehicles, df_areas, df_income_groups, area, year, income_group, custom_discount_rate):
+	""" Get result cache key for dataframe of cumulative cost differences for all vehicle pairs """
+	inputs_hash = c.get_inputs_hash(df_vehicles, df_areas, df_income_groups)
+	return c.get_key(inputs_hash, "cumulative differences", sorted(veh_names_pairs_dict.items()), area, year, income_group, custom_discount_rate)
+
+def get_results_cube(df_vehicles, df_areas, df_income_groups):
+	""" Get the cube of cumulative differences of all scenarios offered in the app, as saved by batch.py if it is up to date, otherwise computed in memory (see sweep.get_app_grid) """
+	cube = s.read_cube(c.get_inputs_hash(df_vehicles, df_areas, df_income_groups))
+	if cube is None:
+		cube = sweep.run_grid(df_vehicles, df_areas, df_income_groups, *sweep.get_app_grid(df_areas, df_income_groups))
+	return cube
+
+@tracing.traced()
+def get_diff_cum_df(df_vehicles, df_areas, df_income_groups, area, year, income_group, custom_discount_rate, cube=None):
+	""" Get dataframe of cumulative cost differences for all vehicle pairs, from the results cube (see get_results_cube), result cache or store if available """
+	if cube is not None:
+		try:
+			return sweep.get_diff_cum_df(cube, area, year, income_group, custom_discount_rate).astype("Float64")
+		except KeyError: #scenario not in the cube
+			pass
+	key = get_diff_cum_df_key(df_vehicles, df_areas, df_income_groups, area, year, income_group, custom_discount_rate)
+	diff_cum_df = c.results_cache.get(key, count_miss=False) #the miss is counted by the re-check below
+	if diff_cum_df is not None:
+		return diff_cum_df
+	with c.results_cache.computing(key): #other sessions requesting the same results wait for them instead of computing them again
+		diff_cum_df = c.results_cache.get(key)
+		if diff_cum_df is None:
+			diff_cum_df = s.read_diff_cum_df(key, area, year)
+			if diff_cum_df is not None:
+				c.results_cache.put(key, diff_cum_df, write=False)
+		if diff_cum_df is None:
+			diff_cum_df = run_LCA_for_all_veh_types(df_vehicles, df_areas, df_income_groups, area, year, income_group, custom_discount_rate)
+	return diff_cum_df
 
+@tracing.traced()
 def run_LCA_for_all_veh_types(df_vehicles, df_areas, df_income_groups, area, year, income_group, custom_discount_rate):
 	diff_cum_df = pd.DataFrame()
 	
@@ -33,32 +66,34 @@ def run_LCA_for_all_veh_types(df_vehicles, df_areas, df_income_groups, area, yea
 		lca.retrieve_results()
 		
 		#derive differences
-		diff = lca.get_results(veh_names[1]).select_dtypes(include=numerics) - lca.get_results(veh_names[0]).select_dtypes(include=numerics)
-		diff_cum = diff.loc["post-use", lca.total_columns]
+		diff_cum = pd.Series(lca.results[veh_names[1]].get_post_use() - lca.results[veh_names[0]].get_post_use(), index=lca.total_columns)
 		
 		if veh_names[0].replace("ICEV", "BEV") == veh_names[1]:
 			fn = veh_names[0].replace(" ICEV", "")
 		elif veh_names[0]=="Toyota Corolla ICEV" and veh_names[1]=="Chevrolet Bolt BEV":
 			fn = "affordable sedan"
 		diff_cum_df[fn] = diff_cum
+	diff_cum_df = diff_cum_df.astype("Float64")
 	diff_cum_df.index.name = "quantity"
+	
+	key = get_diff_cum_df_key(df_vehicles, df_areas, df_income_groups, area, year, income_group, custom_discount_rate)
+	c.results_cache.put(key, diff_cum_df, write=c.write_to_disk(custom_discount_rate))
 
-	#save differences in csv file
-	diff_cum_df_fn_full = get_diff_cum_df_fn_full(area, year, income_group, custom_discount_rate)
-	diff_cum_df.to_csv(diff_cum_df_fn_full)
+	#save differences in the result store, according to the persistence policy
+	persistence.submit(s.write_diff_cum_dfs, [diff_cum_df.copy()], [key], [area], [year], [income_group], [custom_discount_rate])
 	
 	return diff_cum_df
 
-def plot_waterfall_one_either(veh_type, area, year, income_group, custom_discount_rate=None, show_PV=True, save_figure=False):
+@tracing.traced()
+def plot_waterfall_one_either(veh_type, area, year, income_group, custom_discount_rate=None, show_PV=True, save_figure=False, cube=None):
 	"""
 	Waterfall plot for **one** vehicle type, showing **either** nominal or present value cost differences.
 	"""
 	
-	diff_cum_df_fn_full = get_diff_cum_df_fn_full(area, year, income_group, custom_discount_rate)
-	if os.path.isfile(diff_cum_df_fn_full) and custom_discount_rate is None: #read-in cumulative results data
-		diff_cum_df = pd.read_csv(diff_cum_df_fn_full, index_col="quantity")
-	else: #calculate cumulative results data
-		diff_cum_df = run_LCA_for_all_veh_types(df_vehicles, df_areas, df_income_groups, area, year, income_group, custom_discount_rate)
+	import plotly.graph_objects as go
+	
+	df_vehicles,df_areas,df_income_groups = inputs.get_inputs()
+	diff_cum_df = get_diff_cum_df(df_vehicles, df_areas, df_income_groups, area, year, income_group, custom_discount_rate, cube)
 	
 	cols_for_waterfall_plot = ["total "+cost_type+" costs [$]" for cost_type in cost_types]
 	if show_PV:
@@ -78,7 +113,7 @@ def plot_waterfall_one_either(veh_type, area, year, income_group, custom_discoun
 		measure = [*["relative" for i in cost_types], "total"],
 		x = cost_types+["total"], 
 		textposition = "outside",
-		text = ["<b>{0}${1:.1f}k</b>".format('+-'[i<0], abs(i/1000)) for i in y], 
+		text = ["<b>{0}${1:.1f}k</b>".format('+-'[int(i<0)], abs(i/1000)) for i in y], 
 		textfont_color = "black", 
 		textfont_size = fsize, 
 		y = y, 
@@ -142,21 +177,21 @@ def plot_waterfall_one_either(veh_type, area, year, income_group, custom_discoun
 			suffix += " (default)" if custom_discount_rate is None else " ({0:.0f}%)".format(custom_discount_rate*100)
 		fn = "waterfall_veh_type={0:s}_area={1:s}_year={2:d}_income_group={3:s}_{4:s}".format(veh_type.replace("/","-"), area, year, income_group, suffix)
 		width = fsize*1150/22
-		fig.write_image("plots/"+"waterfalls/one_either/"+fn+".png", width=width, height=0.65*width, scale=5)
+		ex.write_image(fig, "plots/"+"waterfalls/one_either/"+fn+".png", width=width, height=0.65*width, scale=5) #queued if an export batch is open (see export.py)
 	
 	return fig
 
 
-def plot_waterfall_one_both(veh_type, area, year, income_group, custom_discount_rate=None, save_figure=False):
+@tracing.traced()
+def plot_waterfall_one_both(veh_type, area, year, income_group, custom_discount_rate=None, save_figure=False, cube=None):
 	"""
 	Waterfall plot for **one** vehicle type, showing **both** nominal and present value cost differences.
 	"""
 	
-	diff_cum_df_fn_full = get_diff_cum_df_fn_full(area, year, income_group, custom_discount_rate)
-	if os.path.isfile(diff_cum_df_fn_full) and custom_discount_rate is None: #read-in cumulative results data
-		diff_cum_df = pd.read_csv(diff_cum_df_fn_full, index_col="quantity")
-	else: #calculate cumulative results data
-		diff_cum_df = run_LCA_for_all_veh_types(df_vehicles, df_areas, df_income_groups, area, year, income_group, custom_discount_rate)
+	import plotly.graph_objects as go
+	
+	df_vehicles,df_areas,df_income_groups = inputs.get_inputs()
+	diff_cum_df = get_diff_cum_df(df_vehicles, df_areas, df_income_groups, area, year, income_group, custom_discount_rate, cube)
 	
 	fig = go.Figure()
 	
@@ -169,7 +204,7 @@ def plot_waterfall_one_both(veh_type, area, year, income_group, custom_discount_
 		measure = [*["relative" for i in cost_types], "total"],
 		x = cost_types+["total"], 
 		textposition = "outside",
-		text = ["<b>{0}${1:.1f}k</b>".format('+-'[i<0], abs(i/1000)) for i in y], 
+		text = ["<b>{0}${1:.1f}k</b>".format('+-'[int(i<0)], abs(i/1000)) for i in y], 
 		textfont_color = "black", 
 		textfont_size = fsize, 
 		y = y, 
@@ -188,7 +223,7 @@ def plot_waterfall_one_both(veh_type, area, year, income_group, custom_discount_
 		measure = [*["relative" for i in cost_types], "total"], 
 		x = cost_types+["total"], 
 		textposition = "outside", 
-		text = ["<b>{0}${1:.1f}k</b>".format('+-'[i<0], abs(i/1000)) for i in y], 
+		text = ["<b>{0}${1:.1f}k</b>".format('+-'[int(i<0)], abs(i/1000)) for i in y], 
 		textfont_color = "black", 
 		textfont_size = fsize, 
 		y = y, 
@@ -251,21 +286,21 @@ def plot_waterfall_one_both(veh_type, area, year, income_group, custom_discount_
 		fn = "waterfalls_veh_type={0:s}_area={1:s}_year={2:d}_income_group={3:s}".format(veh_type.replace("/","-"), area, year, income_group)
 		fn += " (discount rate=default)" if custom_discount_rate is None else " (discount rate={0:.0f}%)".format(custom_discount_rate*100)
 		width = fsize*1150/22
-		fig.write_image("plots/"+"waterfalls/one_both/"+fn+".png", width=width, height=0.65*width, scale=5)
+		ex.write_image(fig, "plots/"+"waterfalls/one_both/"+fn+".png", width=width, height=0.65*width, scale=5) #queued if an export batch is open (see export.py)
 	
 	return fig
 
 
-def plot_waterfall_all_either(veh_types_to_show, area, year, income_group, custom_discount_rate=None, show_PV=True, save_figure=False):
+@tracing.traced()
+def plot_waterfall_all_either(veh_types_to_show, area, year, income_group, custom_discount_rate=None, show_PV=True, save_figure=False, cube=None):
 	"""
 	Waterfall plot for **all** vehicle types, showing **either** nominal or present value cost differences.
 	"""
 	
-	diff_cum_df_fn_full = get_diff_cum_df_fn_full(area, year, income_group, custom_discount_rate)
-	if os.path.isfile(diff_cum_df_fn_full) and custom_discount_rate is None: #read-in cumulative results data
-		diff_cum_df = pd.read_csv(diff_cum_df_fn_full, index_col="quantity")
-	else: #calculate cumulative results data
-		diff_cum_df = run_LCA_for_all_veh_types(df_vehicles, df_areas, df_income_groups, area, year, income_group, custom_discount_rate)
+	import plotly.graph_objects as go
+	
+	df_vehicles,df_areas,df_income_groups = inputs.get_inputs()
+	diff_cum_df = get_diff_cum_df(df_vehicles, df_areas, df_income_groups, area, year, income_group, custom_discount_rate, cube)
 	
 	#settings regarding whether or not to plot nominal or present value
 	if show_PV:
@@ -294,7 +329,7 @@ def plot_waterfall_all_either(veh_types_to_show, area, year, income_group, custo
 			measure = [*["relative" for i in cost_types], "total"],
 			x = cost_types+["total"], 
 			textposition = "outside",
-			text = ["<b>{0}${1:.1f}k</b>".format('+-'[i<0], abs(i/1000)) for i in y], 
+			text = ["<b>{0}${1:.1f}k</b>".format('+-'[int(i<0)], abs(i/1000)) for i in y], 
 			textfont_color = "black", 
 			textfont_size = fsize, 
 			y = y, 
@@ -367,6 +402,6 @@ def plot_waterfall_all_either(veh_types_to_show, area, year, income_group, custo
 			suffix += " (default)" if custom_discount_rate is None else " ({0:.0f}%)".format(custom_discount_rate*100)
 		fn = "waterfall_area={0:s}_year={1:d}_income_group={2:s}_{3:s}".format(area, year, income_group, suffix)
 		width = fsize*1150/22
-		fig.write_image("plots/"+"waterfalls/all_either/"+fn+".png", width=width, height=0.65*width, scale=5)
+		ex.write_image(fig, "plots/"+"waterfalls/all_either/"+fn+".png", width=width, height=0.65*width, scale=5) #queued if an export batch is open (see export.py)
 	
 	return fig
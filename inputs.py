@@ -0,0 +1,169 @@
+"""
+Input data (vehicle_types.xlsx, areas.xlsx, income_groups.xlsx) and its
+precompiled snapshot.
+
+Parsing the Excel workbooks dominates the start-up time of the app, so they
+are compiled once into a binary snapshot (see build), which holds the
+validated DataFrames, the hashes of the workbooks they were read from and a
+hash of their contents. load_inputs uses the snapshot if it is intact and up
+to date, and otherwise falls back to the workbooks and rebuilds it.
+
+Build the snapshot with
+
+	python inputs.py
+"""
+
+import os
+import sys
+import pickle
+import hashlib
+import threading
+
+import pandas as pd
+
+import tracing
+
+from config.config import *
+
+
+#workbooks, their index columns and the columns the model requires (with their kind)
+input_files = {
+			"vehicles": ("data/vehicle_types.xlsx", "name"),
+			"areas": ("data/areas.xlsx", "area"),
+			"income groups": ("data/income_groups.xlsx", "household income group"),
+	}
+schemas = {
+			"vehicles": {
+						"powertrain_type": "text",
+						"label": "text",
+						"average transaction price [$]": "numeric",
+						"production CO2 footprint [g]": "numeric",
+						"real-world mpg [mi/gal]": "numeric",
+						"real-world CO2 emissions [g/mi]": "numeric",
+						"energy use [kWh/mi]": "numeric",
+						"color": "text",
+						"marker_option": "text",
+						"lw": "numeric",
+						"zorder": "numeric",
+				},
+			"areas": {
+						**{"gas_price %d [$/gal]"%year: "numeric" for year in years},
+						**{"electricity_price %d [ct/kWh]"%(year-1): "numeric" for year in years},
+						"electricity_emission_intensity 2021 [g/kWh]": "numeric",
+				},
+			"income groups": {
+						"maximum benefit from federal $7,500 EV tax credit": "numeric",
+						"discount rate": "numeric",
+						"average annual mileage per vehicle (U.S.) [mi]": "numeric",
+						"average vehicle age [years]": "numeric",
+						fleet_income_weights_column: "numeric", #see fleet.py
+				},
+	}
+snapshot_version = 2 #increase whenever the format of the snapshot (or the schemas, so that snapshots are validated again) changes
+
+
+def get_file_hash(fn):
+	h = hashlib.sha256()
+	with open(fn, "rb") as f:
+		h.update(f.read())
+	return h.hexdigest()
+
+def get_data_hash(dfs):
+	""" Hash of the contents of the input DataFrames """
+	h = hashlib.sha256()
+	for name in input_files:
+		h.update(pd.util.hash_pandas_object(dfs[name], index=True).to_numpy().tobytes())
+		h.update(repr(list(dfs[name].columns)).encode())
+	return h.hexdigest()
+
+def validate(name, df):
+	""" Check that a workbook has all columns required by the model, with the right kind of values """
+	if not df.index.is_unique:
+		raise ValueError("%s: duplicate entries in index column '%s'"%(input_files[name][0], df.index.name))
+	for col,kind in schemas[name].items():
+		if col not in df.columns:
+			raise ValueError("%s: missing column '%s'"%(input_files[name][0], col))
+		if kind == "numeric" and not pd.api.types.is_numeric_dtype(df[col]):
+			raise ValueError("%s: column '%s' is not numeric"%(input_files[name][0], col))
+
+def read_workbooks():
+	""" Read and validate the input data from the Excel workbooks """
+	dfs = dict()
+	for name,(fn,index_col) in input_files.items():
+		dfs[name] = pd.read_excel(fn, index_col=index_col)
+		validate(name, dfs[name])
+	return dfs
+
+def build(snapshot_fn=input_snapshot_fn):
+	""" Compile the Excel workbooks into the snapshot, returns the input DataFrames """
+	dfs = read_workbooks()
+	snapshot = {
+				"version": snapshot_version,
+				"pandas version": pd.__version__,
+				"file hashes": {fn: get_file_hash(fn) for fn,index_col in input_files.values()},
+				"data hash": get_data_hash(dfs),
+				"dfs": dfs,
+		}
+	tmp_fn = snapshot_fn+".%d.tmp"%os.getpid()
+	with open(tmp_fn, "wb") as f:
+		pickle.dump(snapshot, f, protocol=pickle.HIGHEST_PROTOCOL)
+	os.replace(tmp_fn, snapshot_fn) #atomic, other processes never see a partially written snapshot
+	return dfs
+
+def read_snapshot(snapshot_fn=input_snapshot_fn):
+	""" Read the snapshot, None if it is missing, damaged, outdated, or was written by another version """
+	try:
+		with open(snapshot_fn, "rb") as f:
+			snapshot = pickle.load(f)
+	except Exception: #missing, or not readable by this version of python/pandas
+		return None
+	if tracing.is_active():
+		tracing.count("input snapshot bytes read", tracing.get_file_size(snapshot_fn))
+	if not isinstance(snapshot, dict) or snapshot.get("version") != snapshot_version or snapshot.get("pandas version") != pd.__version__:
+		return None
+	if get_data_hash(snapshot["dfs"]) != snapshot["data hash"]:
+		return None
+
+	#a workbook that was modified after the snapshot was written is only a reason to rebuild if its contents changed (e.g. not after a fresh checkout)
+	snapshot_mtime = os.path.getmtime(snapshot_fn)
+	for fn,index_col in input_files.values():
+		if os.path.isfile(fn) and os.path.getmtime(fn) > snapshot_mtime and get_file_hash(fn) != snapshot["file hashes"].get(fn):
+			return None
+	return snapshot
+
+@tracing.traced()
+def load_inputs(snapshot_fn=input_snapshot_fn):
+	"""
+	Load the input data, from the snapshot if it is up to date, otherwise from
+	the Excel workbooks (and then rebuild the snapshot).
+
+	Returns
+	-------
+	df_vehicles, df_areas, df_income_groups : pandas.DataFrame
+	"""
+	snapshot = read_snapshot(snapshot_fn)
+	if snapshot is not None:
+		dfs = snapshot["dfs"]
+	else:
+		try:
+			dfs = build(snapshot_fn)
+		except OSError: #e.g. read-only file system, use the workbooks without a snapshot
+			dfs = read_workbooks()
+	return dfs["vehicles"], dfs["areas"], dfs["income groups"]
+
+loaded_inputs = None
+loaded_inputs_lock = threading.Lock()
+
+def get_inputs():
+	""" Get the input data, loaded once per process (see load_inputs). Every caller gets its own copies, so that no caller (e.g. session) can change the data of another one. """
+	global loaded_inputs
+	with loaded_inputs_lock:
+		if loaded_inputs is None:
+			loaded_inputs = load_inputs()
+	return tuple(df.copy() for df in loaded_inputs)
+
+
+if __name__ == "__main__":
+	snapshot_fn = sys.argv[1] if len(sys.argv) > 1 else input_snapshot_fn
+	dfs = build(snapshot_fn)
+	print("Wrote %s (%s)"%(snapshot_fn, ", ".join("%s: %d rows"%(name, len(df)) for name,df in dfs.items())))
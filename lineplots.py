@@ -0,0 +1,136 @@
+"""
+Line plots of LCA results (the same figures as LCA.plot_results) for many
+scenarios, rendered headless with the Agg backend.
+
+Instead of creating and setting up a new figure for every plot, one figure
+template is built per layout (number of vehicles, lifetime and annual mileage,
+which determine the x-axes), and only the lines, annotation, y-axis and
+legend are updated for each scenario and quantity. Figures never go through
+pyplot, so they need no closing and no display. Example:
+
+	for lca in lcas:
+		lca.retrieve_results()
+		lineplots.save_line_plots(lca, ["total costs [$]", "total present value costs [$]"], formats=["png", "svg"])
+"""
+
+import threading
+
+import numpy as np
+
+from config.config import *
+
+
+thread_data = threading.local() #templates (layout -> LinePlotTemplate) of each thread, a figure must not be changed by several threads at once
+
+
+class LinePlotTemplate:
+	"""
+	Figure for line plots of all scenarios with the same layout.
+
+	Parameters
+	----------
+	lca : LCA
+		First scenario of the layout (with retrieved results), used to set up
+		the x-axes.
+	y_quant : str
+		Quantity to plot for the first scenario.
+	"""
+
+	def __init__(self, lca, y_quant):
+		from matplotlib.figure import Figure
+		from matplotlib.backends.backend_agg import FigureCanvasAgg
+		import utils as u
+
+		self.fig = Figure(figsize=(8,6))
+		FigureCanvasAgg(self.fig)
+		self.ax = self.fig.add_subplot()
+		ax = self.ax
+
+		#lines (with the data of the first scenario, since the x-axis limits are derived from it as in LCA.plot_results)
+		self.lines = []
+		for veh_name in lca.veh_names:
+			x = lca.results[veh_name]["time (for plotting) [yr]"]
+			y = lca.results[veh_name][y_quant]
+			self.lines += ax.plot(x, y, ls="-", alpha=1.)
+
+		props = dict(boxstyle="round", facecolor="white", alpha=0.8)
+		self.text = ax.text(0.97, 0.04, "", transform=ax.transAxes, fontsize=14,
+				verticalalignment="bottom", ha="right", bbox=props)
+
+		xlim = ax.get_xlim()
+		ax.axvspan(xlim[0], 0, alpha=0.2, color="red")
+		ax.axvspan(lca.lifetime, xlim[1], alpha=0.2, color="cyan")
+		u.fig_ax_setup(	self.fig,
+						xlim=xlim,
+						xticks=lca.lifetime_range,
+						legend_position=None,
+						x_axis_formatting=True, y_axis_formatting=True
+					)
+		lca.setup_plot_xaxis(ax)
+
+	def update(self, lca, y_quant):
+		""" Show y_quant of the vehicles of a scenario (with retrieved results) """
+		ax = self.ax
+		for line,veh_name in zip(self.lines, lca.veh_names):
+			line.set_data(lca.results[veh_name]["time (for plotting) [yr]"], lca.results[veh_name][y_quant])
+			line.set_label(lca.df_vehicles.loc[veh_name, "label"])
+			line.set_color(lca.df_vehicles.loc[veh_name, "color"])
+			line.set_linewidth(lca.df_vehicles.loc[veh_name, "lw"])
+			line.set_marker(lca.df_vehicles.loc[veh_name, "marker_option"])
+			line.set_zorder(lca.df_vehicles.loc[veh_name, "zorder"])
+		self.text.set_text(lca.get_plot_textstr(y_quant))
+		ax.set_title(y_quant)
+		ax.set_ylabel(y_quant)
+
+		#y-axis limits, from the automatically scaled y-axis of the new data
+		ax.set_autoscaley_on(True)
+		ax.relim()
+		ax.autoscale_view(scalex=False)
+		ylim = lca.get_plot_ylim(y_quant, ax.get_ylim()[1])
+		if ylim is not None:
+			ax.set_ylim(ylim)
+
+		ax.legend(loc="upper left")
+		return self.fig
+
+def get_layout(lca):
+	return (len(lca.veh_names), lca.lifetime, lca.annual_mileage)
+
+def get_figure(lca, y_quant):
+	""" Get the figure of a line plot of y_quant for the vehicles of a scenario (with retrieved results), reusing the template of its layout """
+	layout = get_layout(lca)
+	if not hasattr(thread_data, "templates"):
+		thread_data.templates = dict()
+	templates = thread_data.templates
+	if layout not in templates:
+		templates[layout] = LinePlotTemplate(lca, y_quant)
+	return templates[layout].update(lca, y_quant)
+
+def save_figure(fig, fns, dpi=300):
+	"""
+	Save a figure to several files (e.g. in different formats) with the same
+	result as utils.save_figure, but determining the tight bounding box only
+	once for all of them.
+	"""
+	import os
+	import utils as u
+
+	dpi_orig = fig.dpi
+	fig.set_dpi(dpi) #text extents, and thus the bounding box, depend on the resolution
+	fig.draw_without_rendering()
+	bbox = fig.get_tightbbox(fig.canvas.get_renderer()).padded(u.pad_inches)
+	fig.set_dpi(dpi_orig)
+	for fn in fns:
+		os.makedirs(os.path.dirname(fn) or ".", exist_ok=True)
+		fig.savefig(fn, dpi=dpi, bbox_inches=bbox)
+
+def save_line_plots(lca, y_quants, formats=["png"], dpi=300, directory="plots/line plots/"):
+	"""
+	Save line plots of several quantities for the vehicles of a scenario (with
+	retrieved results), in several formats (e.g. "png" and "svg"), to the same
+	files as LCA.plot_results(y_quant, save_figure=True).
+	"""
+	fn = lca.get_plot_fn()
+	for y_quant in y_quants:
+		fig = get_figure(lca, y_quant)
+		save_figure(fig, [directory+y_quant+"/"+fn+"."+fmt for fmt in formats], dpi)
@@ -4,6 +4,7 @@ import pandas as pd
 import plotly.graph_objects as go
 
 import helpers as h
+import tracing
 from LCA import LCA
 
 from config.config import *
@@ -11,7 +12,9 @@ from config.config import *
 import config.init
 config.init.run()
 
-from Start import df_vehicles,df_areas,df_income_groups
+from Start import df_vehicles,df_areas,df_income_groups,results_cube
+
+profile = tracing.start_profile(st.query_params) #profile this page run if requested in the URL (see tracing.py)
 
 
 st.title("Total costs of ownership of different vehicles")
@@ -34,7 +37,7 @@ custom_discount_rate = None if "default" in custom_discount_rate_selection else
 #initialize LCA class object and run/read results
 # lca = LCA(df_vehicles, df_areas, df_income_groups, veh_names, area, year, income_group)
 #slider to specify discount rate
-#think about mechanism to store results with custom discoutn rates, probably just in a separate file with a suffix "_custom_discount_rate" without specifying what it is, rather calculate new every time (need to make sure that when custom_discount_rate is not None that results are calculated new and not read from existing file)
+#results are cached per exact discount rate (see cache.py), so moving the slider back and forth does not recalculate them
 lca = LCA(df_vehicles, df_areas, df_income_groups, veh_names, area, year, income_group, custom_discount_rate)
 lca.retrieve_results()
 
@@ -112,16 +115,16 @@ st.markdown(second_string, unsafe_allow_html=True)
 
 #plot the waterfall plot
 if plot_type == "one_either":
-	fig_one_either = h.plot_waterfall_one_either(veh_type, area, year, income_group, custom_discount_rate, show_PV, save_figure=False)
+	fig_one_either = h.plot_waterfall_one_either(veh_type, area, year, income_group, custom_discount_rate, show_PV, save_figure=False, cube=results_cube)
 	fig = fig_one_either
 elif plot_type == "one_both":
-	fig_one_both = h.plot_waterfall_one_both(veh_type, area, year, income_group, custom_discount_rate, save_figure=False)
+	fig_one_both = h.plot_waterfall_one_both(veh_type, area, year, income_group, custom_discount_rate, save_figure=False, cube=results_cube)
 	fig = fig_one_both
 elif plot_type == "all_either":
-	fig_all_either = h.plot_waterfall_all_either(veh_types_to_show, area, year, income_group, custom_discount_rate, show_PV, save_figure=False)
+	fig_all_either = h.plot_waterfall_all_either(veh_types_to_show, area, year, income_group, custom_discount_rate, show_PV, save_figure=False, cube=results_cube)
 	fig = fig_all_either
 
-st.plotly_chart(fig, sharing="streamlit", use_container_width=True, height=0.6)
+st.plotly_chart(fig, width="stretch")
 
 
 
@@ -170,4 +173,4 @@ def write(data):
 		
 	# """
 
-
+tracing.show_profile(profile)
@@ -3,10 +3,13 @@ import streamlit as st
 import pandas as pd
 
 import helpers as h
+import tracing
 
 from config.config import *
 
-from Start import df_vehicles,df_areas,df_income_groups
+from Start import df_vehicles,df_areas,df_income_groups,results_cube
+
+profile = tracing.start_profile(st.query_params) #profile this page run if requested in the URL (see tracing.py)
 
 st.title("Summary tables of results")
 
@@ -26,15 +29,8 @@ custom_discount_rate_selection = st.select_slider("Select what discount rate to
 custom_discount_rate = None if "default" in custom_discount_rate_selection else float(custom_discount_rate_selection[:-1])/100
 # incentives = st.multiselect("Incentives:": ["$7,500 Federal EV Tax Credit"])
 
-#read-in cumulative results data
-diff_cum_df_fn_full = h.get_diff_cum_df_fn_full(area, year, income_group, custom_discount_rate)
-# diff_cum_df_fn = "diff_cum_all_area={0:s}_year={1:d}_income_group={2:s}".format(area,year,income_group)
-# diff_cum_df = pd.read_csv("results/"+"cumulative differences/"+diff_cum_df_fn+".csv", index_col="quantity")
-if custom_discount_rate is not None or not os.path.isfile(diff_cum_df_fn_full):
-	#recalculate
-	h.run_LCA_for_all_veh_types(df_vehicles, df_areas, df_income_groups, area, year, income_group, custom_discount_rate)
-	
-diff_cum_df = pd.read_csv(diff_cum_df_fn_full, index_col="quantity")
+#get cumulative results data (a slice of the precomputed results cube, or recalculated for scenarios not in it)
+diff_cum_df = h.get_diff_cum_df(df_vehicles, df_areas, df_income_groups, area, year, income_group, custom_discount_rate, cube=results_cube)
 
 colorcode = st.checkbox("Apply colors according to cost savings/premiums?", value=False)
 if colorcode:
@@ -58,3 +54,5 @@ if colorcode:
 else:
 	# st.dataframe(diff_cum_df.style.set_precision(0))
 	st.dataframe(diff_cum_df.style.format(precision=0))
+
+tracing.show_profile(profile)
@@ -0,0 +1,93 @@
+"""
+Persistence policy of results computed on demand (e.g. by LCA.retrieve_results
+or helpers.get_diff_cum_df in a Streamlit session), see results_persistence
+in config.config:
+
++ "memory": results are only kept in memory (in the result cache). Nothing
+  is written to disk on the interactive path; the result store and the
+  results cube are filled by explicit exports (store.build, store.build_cube,
+  batch.py) and only read by the app.
++ "write-behind": results are written to disk by one background writer
+  thread, so callers never wait for the filesystem and writes of the same
+  process never run concurrently. Failed writes are logged, counted (see
+  tracing.py) and raised by the next flush (also at exit).
++ "write-through": results are written right away, before the call returns
+  (e.g. for scripts that need their results on disk when they finish).
+
+All writes go to temporary files that are moved into place atomically, so
+that readers in other sessions or processes never see partially written
+files.
+"""
+
+import queue
+import atexit
+import logging
+import threading
+
+import tracing
+
+from config.config import *
+
+
+policies = ["memory", "write-behind", "write-through"]
+policy = results_persistence
+
+write_queue = queue.Queue()
+writer_lock = threading.Lock()
+writer = None #background writer thread, started with the first write-behind
+failed_writes = [] #exceptions of the write-behind writes that failed since the last flush
+logger = logging.getLogger(__name__)
+
+
+def set_policy(new_policy):
+	""" Set the persistence policy of this process (one of policies) """
+	global policy
+	if new_policy not in policies:
+		raise ValueError("unknown persistence policy: {0:s} (use one of {1:s})".format(new_policy, ", ".join(policies)))
+	policy = new_policy
+
+def run_writer():
+	while True:
+		function, args, kwargs = write_queue.get()
+		try:
+			function(*args, **kwargs)
+		except Exception as exception: #the results remain in memory, only their copy on disk is missing (raised by flush)
+			logger.exception("writing results to disk failed")
+			tracing.count("result writes failed")
+			with writer_lock:
+				failed_writes.append(exception)
+		finally:
+			write_queue.task_done()
+
+def start_writer():
+	global writer
+	with writer_lock:
+		if writer is None:
+			writer = threading.Thread(target=run_writer, name="results writer", daemon=True)
+			writer.start()
+			atexit.register(flush) #finish pending writes before the interpreter exits
+
+def submit(function, *args, **kwargs):
+	"""
+	Persist results by calling function(*args, **kwargs) according to the
+	policy: not at all ("memory"), in the background writer thread
+	("write-behind"), or right away ("write-through"). The arguments must not
+	be modified afterwards.
+	"""
+	if policy == "memory":
+		return
+	elif policy == "write-behind":
+		start_writer()
+		write_queue.put((function, args, kwargs))
+	else:
+		function(*args, **kwargs)
+
+def flush():
+	""" Wait until all pending write-behind writes are finished, RuntimeError (from the first failure) if any write failed since the last flush """
+	if writer is not None:
+		write_queue.join()
+	with writer_lock:
+		exceptions = failed_writes.copy()
+		failed_writes.clear()
+	if len(exceptions) > 0:
+		raise RuntimeError("{0:d} write-behind writes of results failed, their results are not on disk".format(len(exceptions))) from exceptions[0]
@@ -0,0 +1,238 @@
+"""
+Global sensitivity analysis of the differences between the EV and ICEV of
+each vehicle type, i.e. which inputs drive them.
+
+The inputs (see sensitivity_bounds in config.config) are scaled with factors
+that vary within their bounds. Two methods are available:
+
+- run_sobol: first-order and total-order Sobol indices (Saltelli design with
+  the Saltelli (2010) first-order and Jansen total-order estimators), i.e.
+  the share of the variance of a difference that is due to an input alone,
+  and including all its interactions.
+- run_morris: Morris elementary effects (mu*, the mean absolute effect, and
+  sigma, a measure of nonlinearity and interactions), a cheaper screening.
+
+The sample designs are evaluated with the batched engine path (see
+uncertainty.py), in chunks that are spread over a pool of worker processes.
+Example:
+
+	indices = sensitivity.run_sobol(df_vehicles, df_areas, df_income_groups, ["U.S.", "WA"], 2022, "$50-75k", seed=0)
+	indices.sel(area="WA", quantity="total present value costs [$]", index="total order").to_frame()
+"""
+
+import os
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import engine as e
+import tables as t
+import uncertainty as un
+from sweep import ScenarioCube, get_pairs_indices
+
+from config.config import *
+
+
+quantities_default = ["total costs [$]", "total present value costs [$]", "total emissions [tCO$_2$-eq.]"]
+
+
+def get_sobol_design(n_samples, n_inputs, rng):
+	"""
+	Get the Saltelli design in the unit hypercube, of shape
+	(n_samples*(n_inputs+2), n_inputs): the rows of the matrices A, B, and
+	A with column i taken from B (for each input i).
+	"""
+	A = rng.random((n_samples, n_inputs))
+	B = rng.random((n_samples, n_inputs))
+	AB = np.repeat(A[None], n_inputs, axis=0)
+	for i in range(n_inputs):
+		AB[i,:,i] = B[:,i]
+	return np.concatenate([A, B, AB.reshape(-1, n_inputs)])
+
+def get_morris_design(n_trajectories, n_inputs, rng, n_levels=4):
+	"""
+	Get Morris trajectories in the unit hypercube. Each trajectory starts at
+	a random point of the grid of n_levels levels per input and changes one
+	input after the other (in random order) by delta.
+
+	Returns
+	-------
+	design : numpy.ndarray of shape (n_trajectories*(n_inputs+1), n_inputs)
+	order : numpy.ndarray of shape (n_trajectories, n_inputs)
+		Input changed in each step of each trajectory.
+	delta : float
+	"""
+	delta = n_levels / (2*(n_levels-1))
+	start = rng.integers(0, n_levels//2, (n_trajectories, n_inputs)) / (n_levels-1)
+	order = np.argsort(rng.random((n_trajectories, n_inputs)), axis=1)
+	design = np.repeat(start[:,None], n_inputs+1, axis=1)
+	for step in range(n_inputs):
+		design[:,step+1:][np.arange(n_trajectories),:,order[:,step]] += delta
+	return design.reshape(-1, n_inputs), order, delta
+
+def evaluate(base_params, unit_design, input_names, bounds, i_ICEV, i_EV, quantities):
+	"""
+	Evaluate the differences (EV minus ICEV) for the rows of a design in the
+	unit hypercube (in a worker process).
+
+	Returns
+	-------
+	diff_cum : numpy.ndarray of shape (len(unit_design), len(i_EV), len(quantities))
+	"""
+	n_vehicles = len(base_params["is EV"])
+	factors = dict()
+	for j,name in enumerate(input_names):
+		low, high = bounds[name]
+		factors[name] = np.broadcast_to((low + unit_design[:,j]*(high-low))[:,None], (len(unit_design), n_vehicles))
+	params = un.get_sample_params(base_params, factors)
+	totals = e.run_totals(params).reshape(len(unit_design), n_vehicles, len(e.total_columns))
+	totals = totals[:,:,[e.total_columns.index(quantity) for quantity in quantities]]
+	return totals[:,i_EV] - totals[:,i_ICEV]
+
+def evaluate_design(base_params_list, unit_design, input_names, bounds, i_ICEV, i_EV, quantities, n_workers=sensitivity_n_workers, chunk_size=2048):
+	"""
+	Evaluate a design for several scenarios (one set of base parameters each),
+	in chunks of up to chunk_size rows on up to n_workers processes.
+
+	Returns
+	-------
+	diff_cum : numpy.ndarray of shape (len(base_params_list), len(unit_design), len(i_EV), len(quantities))
+	"""
+	diff_cum = np.empty((len(base_params_list), len(unit_design), len(i_EV), len(quantities)))
+	tasks = [(i, start) for i in range(len(base_params_list)) for start in range(0, len(unit_design), chunk_size)]
+	def get_args(task):
+		i, start = task
+		return (base_params_list[i], unit_design[start:start+chunk_size], input_names, bounds, i_ICEV, i_EV, quantities)
+
+	n_workers = max(1, min(n_workers or os.cpu_count(), len(tasks)))
+	if n_workers == 1:
+		for task in tasks:
+			i, start = task
+			diff_cum[i,start:start+chunk_size] = evaluate(*get_args(task))
+	else:
+		with ProcessPoolExecutor(max_workers=n_workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+			futures = [executor.submit(evaluate, *get_args(task)) for task in tasks]
+			for (i, start),future in zip(tasks, futures):
+				diff_cum[i,start:start+chunk_size] = future.result()
+	return diff_cum
+
+def get_sobol_indices(y, n_inputs):
+	"""
+	Get the first-order and total-order Sobol indices (Saltelli (2010)
+	first-order and Jansen total-order estimators) from the outputs y of a
+	Saltelli design (sample axis first).
+
+	Returns
+	-------
+	S1, ST : numpy.ndarray
+		Indices with an additional first axis for the inputs (NaN for outputs
+		that do not vary).
+	"""
+	y = y.reshape(n_inputs+2, -1, *y.shape[1:])
+	f_A, f_B, f_AB = y[0], y[1], y[2:]
+	variance = np.concatenate([f_A, f_B]).var(axis=0)
+	with np.errstate(invalid="ignore", divide="ignore"):
+		S1 = (f_B * (f_AB - f_A)).mean(axis=1) / variance
+		ST = 0.5*((f_A - f_AB)**2).mean(axis=1) / variance
+	return S1, ST
+
+def get_morris_indices(y, order, delta):
+	"""
+	Get mu* (mean absolute elementary effect), mu (mean elementary effect) and
+	sigma (standard deviation of the elementary effects) from the outputs y of
+	Morris trajectories (sample axis first). The elementary effects are per
+	unit of the range of each input.
+
+	Returns
+	-------
+	mu_star, mu, sigma : numpy.ndarray
+		Indices with an additional first axis for the inputs.
+	"""
+	n_trajectories, n_inputs = order.shape
+	y = y.reshape(n_trajectories, n_inputs+1, *y.shape[1:])
+	effects = np.empty((n_inputs, n_trajectories, *y.shape[2:]))
+	for step in range(n_inputs):
+		effects[order[:,step], np.arange(n_trajectories)] = (y[:,step+1] - y[:,step]) / delta
+	return np.abs(effects).mean(axis=1), effects.mean(axis=1), effects.std(axis=1, ddof=1)
+
+def get_base_params_list(df_vehicles, df_areas, df_income_groups, veh_names, areas, year, income_group, custom_discount_rate):
+	tables = t.get_tables(df_vehicles, df_areas, df_income_groups)
+	return [e.get_base_params(df_vehicles, df_areas, df_income_groups, veh_names, area, year, income_group, custom_discount_rate, tables) for area in areas]
+
+def get_cube(indices, index_names, areas, veh_names_pairs_dict, quantities, input_names):
+	""" Combine indices (each with axes input, area, vehicle type, quantity) into a ScenarioCube """
+	values = np.stack(indices, axis=-1).transpose(1, 2, 3, 0, 4)
+	coords = {
+				"area": areas,
+				"vehicle type": list(veh_names_pairs_dict.keys()),
+				"quantity": quantities,
+				"input": input_names,
+				"index": index_names,
+		}
+	return ScenarioCube(values, list(coords.keys()), coords)
+
+def run_sobol(df_vehicles, df_areas, df_income_groups, areas, year, income_group, custom_discount_rate=None, veh_names_pairs_dict=veh_names_pairs_dict, quantities=quantities_default, bounds=sensitivity_bounds, n_samples=sensitivity_n_samples, n_workers=sensitivity_n_workers, seed=None):
+	"""
+	Get the Sobol indices of the inputs for the differences between the
+	vehicles of each pair, in each area.
+
+	Parameters
+	----------
+	df_vehicles, df_areas, df_income_groups : pandas.DataFrame
+		Input data (see Start.get_data).
+	areas : list
+		Areas to analyze (with the same sample design).
+	year, income_group, custom_discount_rate
+		Scenario, as for LCA.
+	veh_names_pairs_dict : dict
+		Vehicle pairs (ICEV, EV) to compare, one for each vehicle type.
+	quantities : list
+		Total quantities (see engine.total_columns) to analyze.
+	bounds : dict
+		Range of the factor of each input (see engine.base_param_names for the
+		names), see sensitivity_bounds in config.config.
+	n_samples : int
+		Number of base samples, the design has n_samples*(len(bounds)+2) rows.
+	n_workers : int
+		Number of worker processes, None for the number of CPUs.
+	seed : int, optional
+		Seed of the random number generator, for reproducible results.
+
+	Returns
+	-------
+	indices : ScenarioCube
+		Dims "area", "vehicle type", "quantity", "input", "index", with the
+		"first order" and "total order" indices.
+	"""
+
+	input_names = list(bounds.keys())
+	veh_names, i_ICEV, i_EV = get_pairs_indices(veh_names_pairs_dict)
+	base_params_list = get_base_params_list(df_vehicles, df_areas, df_income_groups, veh_names, areas, year, income_group, custom_discount_rate)
+	unit_design = get_sobol_design(n_samples, len(input_names), np.random.default_rng(seed))
+	diff_cum = evaluate_design(base_params_list, unit_design, input_names, bounds, i_ICEV, i_EV, quantities, n_workers)
+	S1, ST = get_sobol_indices(diff_cum.swapaxes(0, 1), len(input_names))
+	return get_cube([S1, ST], ["first order", "total order"], areas, veh_names_pairs_dict, quantities, input_names)
+
+def run_morris(df_vehicles, df_areas, df_income_groups, areas, year, income_group, custom_discount_rate=None, veh_names_pairs_dict=veh_names_pairs_dict, quantities=quantities_default, bounds=sensitivity_bounds, n_trajectories=sensitivity_n_trajectories, n_levels=4, n_workers=sensitivity_n_workers, seed=None):
+	"""
+	Get the Morris elementary effects of the inputs for the differences
+	between the vehicles of each pair, in each area. The parameters are the
+	same as for run_sobol, with n_trajectories trajectories of n_levels
+	levels per input instead of n_samples.
+
+	Returns
+	-------
+	indices : ScenarioCube
+		Dims "area", "vehicle type", "quantity", "input", "index", with the
+		indices "mu*", "mu" and "sigma" (in the units of the quantity, per
+		range of the input).
+	"""
+
+	input_names = list(bounds.keys())
+	veh_names, i_ICEV, i_EV = get_pairs_indices(veh_names_pairs_dict)
+	base_params_list = get_base_params_list(df_vehicles, df_areas, df_income_groups, veh_names, areas, year, income_group, custom_discount_rate)
+	unit_design, order, delta = get_morris_design(n_trajectories, len(input_names), np.random.default_rng(seed), n_levels)
+	diff_cum = evaluate_design(base_params_list, unit_design, input_names, bounds, i_ICEV, i_EV, quantities, n_workers)
+	mu_star, mu, sigma = get_morris_indices(diff_cum.swapaxes(0, 1), order, delta)
+	return get_cube([mu_star, mu, sigma], ["mu*", "mu", "sigma"], areas, veh_names_pairs_dict, quantities, input_names)
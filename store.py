@@ -0,0 +1,226 @@
+"""
+Columnar store of LCA results, replacing the per-scenario CSV files.
+
+Results are kept in two Parquet datasets under results_store_directory,
+both partitioned by area and year:
+
++ "individual vehicle names": the unrounded results of each vehicle and
+  scenario over its lifetime (one row per period),
++ "cumulative differences": the cumulative differences between the vehicles
+  of each pair in veh_names_pairs_dict (one row per quantity).
+
+Every row carries the result cache key (see cache.py), which hashes the input
+data, the model constants and the scenario, so that reading a key never
+returns stale results. Reads use predicate pushdown (partition pruning on
+area and year, row filters on the keys) and memory-mapped files, so all
+results of a scenario are loaded with one read.
+"""
+
+import os
+import shutil
+import pickle
+import hashlib
+import threading
+
+import numpy as np
+import pandas as pd
+
+import engine as e
+import tracing
+
+from config.config import *
+
+
+vehicle_results_directory = results_store_directory+"individual vehicle names/"
+diff_cum_directory = results_store_directory+"cumulative differences/"
+
+
+def get_discount_rate_label(custom_discount_rate):
+	return "default" if custom_discount_rate is None else "{0:g}%".format(custom_discount_rate*100)
+
+def get_basename(keys):
+	""" Get the file basename of a batch of results (writing the same batch again replaces its file) """
+	return hashlib.sha256("".join(keys).encode()).hexdigest()[:32]
+
+def write_table(df, directory, basename):
+	""" Write rows to a dataset, partitioned by area and year. The files are written to a temporary directory and then moved into place, so that readers never see partially written files. """
+	import pyarrow as pa
+	import pyarrow.dataset as ds
+	
+	table = pa.Table.from_pandas(df, preserve_index=False)
+	tmp_directory = directory.rstrip("/")+".%d.%d.tmp/"%(os.getpid(), threading.get_ident())
+	ds.write_dataset(table, tmp_directory, format="parquet", partitioning=["area", "year"], partitioning_flavor="hive", basename_template=basename+"-{i}.parquet", existing_data_behavior="overwrite_or_ignore")
+	for root,_,fns in os.walk(tmp_directory):
+		for fn in fns:
+			target_fn = os.path.join(directory, os.path.relpath(os.path.join(root, fn), tmp_directory))
+			os.makedirs(os.path.dirname(target_fn), exist_ok=True)
+			if tracing.is_active():
+				tracing.count("result store bytes written", tracing.get_file_size(os.path.join(root, fn)))
+			os.replace(os.path.join(root, fn), target_fn) #atomic
+	shutil.rmtree(tmp_directory, ignore_errors=True)
+
+def read_table(directory, area, year, keys):
+	""" Read all rows of the given keys in one partition (None if the store does not exist) """
+	if not os.path.isdir(directory):
+		return None
+	import pyarrow.parquet as pq
+	
+	filters = [("area", "=", area), ("year", "=", year), ("key", "in", list(keys))]
+	table = pq.read_table(directory, filters=filters, memory_map=True)
+	if tracing.is_active():
+		tracing.count("result store bytes read", table.nbytes) #decoded size of the rows read
+	return table.to_pandas()
+
+def write_vehicle_results(results, keys, veh_names, is_EV, area, year, income_group, custom_discount_rate, lifetime):
+	"""
+	Write the results of several vehicles in one scenario to the store.
+
+	Parameters
+	----------
+	results : numpy.ndarray of shape (N, n_periods, len(engine.columns))
+		Unrounded results as returned by engine.run.
+	keys, veh_names, is_EV : list
+		Cache key, name and powertrain (EV or not) of each vehicle.
+	area, year, income_group, custom_discount_rate, lifetime : str, int, str, float or None, float
+		Scenario (same for all vehicles).
+	"""
+	write_batch(results, keys, veh_names, is_EV, [area]*len(keys), [year]*len(keys), [income_group]*len(keys), [custom_discount_rate]*len(keys), [lifetime]*len(keys))
+
+def write_batch(results, keys, veh_names, is_EV, areas, years, income_groups, custom_discount_rates, lifetimes):
+	""" Write results of vehicles in different scenarios (one entry per row of results in each list) to the store """
+	n_periods = np.array([len(e.get_times(lifetime)) for lifetime in lifetimes])
+	rows = np.repeat(np.arange(len(keys)), n_periods)
+	periods = np.concatenate([np.arange(n) for n in n_periods])
+	padded_periods = np.where(periods == n_periods[rows]-1, results.shape[1]-1, periods) #remove padding periods (the post-use period is the last one in results)
+	labels = {
+				"area": areas,
+				"year": years,
+				"key": keys,
+				"veh_name": veh_names,
+				"income group": income_groups,
+				"discount rate": [get_discount_rate_label(custom_discount_rate) for custom_discount_rate in custom_discount_rates],
+				"is_EV": np.asarray(is_EV, dtype=bool),
+				"lifetime [yr]": np.asarray(lifetimes, dtype=float),
+		}
+	df = pd.DataFrame({name: np.asarray(values)[rows] for name,values in labels.items()})
+	df["period"] = periods
+	df = pd.concat([df, pd.DataFrame(results[rows, padded_periods], columns=e.columns)], axis=1)
+	for (area,year),df_partition in df.groupby(["area", "year"], sort=False):
+		write_table(df_partition, vehicle_results_directory, get_basename(df_partition["key"].unique()))
+
+def read_vehicle_results(keys, area, year):
+	"""
+	Read the results of several vehicles in one partition (area and year)
+	from the store, in one read.
+
+	Returns
+	-------
+	results : dict
+		key -> engine.Results, only for the keys that were found.
+	"""
+	df = read_table(vehicle_results_directory, area, year, keys)
+	if df is None:
+		return dict()
+	results = dict()
+	for key,df_key in df.groupby("key", sort=False, observed=True):
+		df_key = df_key.drop_duplicates("period").sort_values("period") #the same results may have been written more than once
+		results[key] = e.get_results(df_key[e.columns].to_numpy(dtype=float), df_key["lifetime [yr]"].iloc[0], bool(df_key["is_EV"].iloc[0]))
+	return results
+
+def write_diff_cum_dfs(diff_cum_dfs, keys, areas, years, income_groups, custom_discount_rates):
+	""" Write dataframes of cumulative differences (one per scenario, see helpers.run_LCA_for_all_veh_types) to the store """
+	dfs = []
+	for i,key in enumerate(keys):
+		df = diff_cum_dfs[i].reset_index()
+		df.insert(0, "discount rate", get_discount_rate_label(custom_discount_rates[i]))
+		df.insert(0, "income group", income_groups[i])
+		df.insert(0, "key", key)
+		df.insert(0, "year", years[i])
+		df.insert(0, "area", areas[i])
+		dfs.append(df)
+	df = pd.concat(dfs, ignore_index=True)
+	for (area,year),df_partition in df.groupby(["area", "year"], sort=False):
+		write_table(df_partition, diff_cum_directory, get_basename(df_partition["key"].unique()))
+
+def read_diff_cum_df(key, area, year):
+	""" Read a dataframe of cumulative differences from the store (None if it is not stored) """
+	df = read_table(diff_cum_directory, area, year, [key])
+	if df is None or len(df) == 0:
+		return None
+	df = df.drop_duplicates("quantity").set_index("quantity")
+	return df.drop(columns=["area", "year", "key", "income group", "discount rate"]).dropna(axis=1, how="all").astype("Float64") #same dtypes as returned by helpers.run_LCA_for_all_veh_types
+
+def write_cube(cube, inputs_hash, fn=results_cube_fn):
+	""" Save a cube of cumulative differences (see sweep.run_grid) with the hash of the inputs it was computed from """
+	os.makedirs(os.path.dirname(fn) or ".", exist_ok=True)
+	tmp_fn = fn+".%d.%d.tmp"%(os.getpid(), threading.get_ident())
+	with open(tmp_fn, "wb") as f:
+		pickle.dump({"inputs hash": inputs_hash, "cube": cube}, f, protocol=pickle.HIGHEST_PROTOCOL)
+	if tracing.is_active():
+		tracing.count("results cube bytes written", tracing.get_file_size(tmp_fn))
+	os.replace(tmp_fn, fn) #atomic, readers never see a partially written file
+
+def read_cube(inputs_hash, fn=results_cube_fn):
+	""" Read a cube saved with write_cube, None if it is missing, damaged, or was computed from other inputs """
+	try:
+		with open(fn, "rb") as f:
+			data = pickle.load(f)
+	except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError):
+		return None
+	if tracing.is_active():
+		tracing.count("results cube bytes read", tracing.get_file_size(fn))
+	if not isinstance(data, dict) or data.get("inputs hash") != inputs_hash:
+		return None
+	return data["cube"]
+
+def build_cube(df_vehicles, df_areas, df_income_groups):
+	""" Compute the cube of cumulative differences of all scenarios offered in the app (see sweep.get_app_grid) and save it """
+	import sweep
+	import cache as c
+
+	cube = sweep.run_grid(df_vehicles, df_areas, df_income_groups, *sweep.get_app_grid(df_areas, df_income_groups))
+	write_cube(cube, c.get_inputs_hash(df_vehicles, df_areas, df_income_groups))
+	return cube
+
+def build(df_vehicles, df_areas, df_income_groups, areas=areas, years=years, income_groups=income_groups, custom_discount_rates=[None]):
+	"""
+	Compute the results of all vehicle pairs for the full scenario grid in one
+	batch (see sweep.py) and write them to the store. Returns the cube of
+	cumulative differences (see sweep.run_grid).
+	"""
+
+	import sweep
+	import cache as c
+	import helpers as h
+
+	inputs_hash = c.get_inputs_hash(df_vehicles, df_areas, df_income_groups)
+	veh_names, i_ICEV, i_EV = sweep.get_pairs_indices(veh_names_pairs_dict)
+	is_EV = [df_vehicles.loc[veh_name, "powertrain_type"] == "EV" for veh_name in veh_names]
+
+	#individual vehicle results
+	params = sweep.get_grid_params(df_vehicles, df_areas, df_income_groups, veh_names, areas, years, income_groups, custom_discount_rates)
+	shape = params["lifetime [yr]"].shape
+	results = e.run({name: values.ravel() for name,values in params.items()})
+	labels = list(np.ndindex(shape))
+	write_batch(
+				results,
+				[c.get_key(inputs_hash, "individual vehicle", veh_names[i_veh], areas[i_area], years[i_year], income_groups[i_income_group], custom_discount_rates[i_rate]) for i_area,i_year,i_income_group,i_rate,i_veh in labels],
+				[veh_names[label[4]] for label in labels],
+				[is_EV[label[4]] for label in labels],
+				[areas[label[0]] for label in labels],
+				[years[label[1]] for label in labels],
+				[income_groups[label[2]] for label in labels],
+				[custom_discount_rates[label[3]] for label in labels],
+				params["lifetime [yr]"].ravel(),
+		)
+
+	#cumulative differences
+	cube = sweep.run_grid(df_vehicles, df_areas, df_income_groups, areas, years, income_groups, custom_discount_rates)
+	scenarios = [(area, year, income_group, custom_discount_rate) for area in areas for year in years for income_group in income_groups for custom_discount_rate in custom_discount_rates]
+	write_diff_cum_dfs(
+				[sweep.get_diff_cum_df(cube, *scenario) for scenario in scenarios],
+				[h.get_diff_cum_df_key(df_vehicles, df_areas, df_income_groups, *scenario) for scenario in scenarios],
+				*[list(x) for x in zip(*scenarios)],
+		)
+	
+	return cube
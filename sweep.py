@@ -0,0 +1,354 @@
+"""
+Sweep over the full scenario grid (areas x years x income groups x discount
+rates x vehicle pairs) in one batched computation of the vectorized engine.
+
+The result is a ScenarioCube, a labeled N-dimensional array of the
+cumulative ("post-use") differences between the two vehicles of each pair in
+veh_names_pairs_dict, i.e. the same numbers that run_LCA_for_all_veh_types
+in helpers.py produces for one scenario at a time.
+"""
+
+import numpy as np
+import pandas as pd
+
+import engine as e
+import tables as t
+
+from config.config import *
+
+
+class ScenarioCube:
+	"""
+	Labeled N-dimensional array of scenario results.
+
+	Parameters
+	----------
+	values : numpy.ndarray
+		The results, one axis per entry of dims.
+	dims : list of str
+		Names of the axes of values.
+	coords : dict
+		Labels along each axis (dim name -> list of labels).
+	"""
+
+	def __init__(self, values, dims, coords):
+		self.values = values
+		self.dims = list(dims)
+		self.coords = {dim: list(coords[dim]) for dim in self.dims}
+		self.indices = {dim: {label: i for i,label in enumerate(self.coords[dim])} for dim in self.dims}
+
+	def get_index(self, dim, label):
+		""" Get the position of a label along an axis (discount rate None means the default discount rates), raises a KeyError for unknown labels """
+		return self.indices[dim][label]
+
+	def sel(self, **labels):
+		"""
+		Select a sub-array by labels, e.g. cube.sel(area="U.S.", year=2022).
+		Dim names with spaces are given with underscores instead (e.g.
+		income_group="$50-75k").
+		"""
+		idx = []
+		dims = []
+		coords = {}
+		for dim in self.dims:
+			key = dim.replace(" ", "_")
+			if key in labels:
+				idx.append(self.get_index(dim, labels[key]))
+			else:
+				idx.append(slice(None))
+				dims.append(dim)
+				coords[dim] = self.coords[dim]
+		values = self.values[tuple(idx)]
+		if len(dims) == 0:
+			return values
+		return ScenarioCube(values, dims, coords)
+
+	def to_frame(self):
+		""" Convert to a long-format table with one row per combination of labels """
+		labels = [["default" if label is None else label for label in self.coords[dim]] for dim in self.dims]
+		index = pd.MultiIndex.from_product(labels, names=self.dims)
+		return pd.DataFrame({"value": self.values.ravel()}, index=index)
+
+
+def get_diff_cum_df(cube, area, year, income_group, custom_discount_rate=None):
+	""" Get the cumulative differences of one scenario from a cube returned by run_grid, in the format of run_LCA_for_all_veh_types in helpers.py """
+	sub = cube.sel(area=area, year=year, income_group=income_group, discount_rate=custom_discount_rate)
+	diff_cum_df = pd.DataFrame(sub.values.T, index=sub.coords["quantity"], columns=sub.coords["vehicle type"])
+	diff_cum_df.index.name = "quantity"
+	return diff_cum_df
+
+def get_custom_discount_rate(discount_rate_option):
+	""" Convert one of discount_rate_options (e.g. "5%") to a custom discount rate (None for "Use defaults") """
+	return None if "default" in discount_rate_option else float(discount_rate_option[:-1])/100
+
+def get_app_grid(df_areas, df_income_groups):
+	""" Get the scenario dimensions (areas, years, income groups, custom discount rates) of the selections offered in the app, for the areas in config.config (not the pseudo-area "DCFC" and the other rows of areas.xlsx, which are computed on demand, see helpers.get_diff_cum_df) """
+	return areas, years, list(df_income_groups.index), [get_custom_discount_rate(option) for option in discount_rate_options]
+
+def get_grid_base_params(df_vehicles, df_areas, df_income_groups, veh_names, areas, years, income_groups, custom_discount_rates):
+	"""
+	Get the underlying inputs (see engine.get_base_params) for all
+	combinations of the given scenario dimensions, gathered from the compiled
+	parameter tables (see tables.py). Returns a dict of arrays of shape
+	(areas, years, income groups, discount rates, vehicles).
+	"""
+
+	return t.get_tables(df_vehicles, df_areas, df_income_groups).get_base_params(veh_names, areas, years, income_groups, custom_discount_rates)
+
+def get_grid_params(df_vehicles, df_areas, df_income_groups, veh_names, areas, years, income_groups, custom_discount_rates, trajectories=None):
+	"""
+	Get the engine parameters for all combinations of the given scenario
+	dimensions. Returns a dict of arrays of shape (areas, years, income
+	groups, discount rates, vehicles), with an additional last axis for the
+	years of use for the parameters that follow trajectories (see
+	tables.ParameterTables.get_trajectories), if given.
+	"""
+	base_params = get_grid_base_params(df_vehicles, df_areas, df_income_groups, veh_names, areas, years, income_groups, custom_discount_rates)
+	if trajectories is None:
+		return e.derive_params(base_params)
+	n_years = int(np.ceil(base_params["lifetime [yr]"].max()))
+	trajectories = t.get_tables(df_vehicles, df_areas, df_income_groups).get_trajectories(areas, years, n_years, trajectories)
+	return e.derive_params(base_params, trajectories)
+
+def run_grid(df_vehicles, df_areas, df_income_groups, areas=areas, years=years, income_groups=income_groups, custom_discount_rates=[None], veh_names_pairs_dict=veh_names_pairs_dict, chunk_size=4096, trajectories=None):
+	"""
+	Run the LCA for all combinations of scenarios and vehicle pairs.
+
+	Parameters
+	----------
+	df_vehicles, df_areas, df_income_groups : pandas.DataFrame
+		Input data (see Start.get_data).
+	areas, years, income_groups : list
+		Scenario dimensions, the defaults are taken from config.config.
+	custom_discount_rates : list
+		Discount rates to evaluate, None stands for the income group-specific
+		default discount rates. Use e.g. [get_custom_discount_rate(option) for
+		option in discount_rate_options] for all options of the app.
+	veh_names_pairs_dict : dict
+		Vehicle pairs (ICEV, EV) to compare, one for each vehicle type.
+	chunk_size : int
+		Maximum number of vehicle/scenario combinations evaluated at once
+		(bounds the memory use of the engine).
+	trajectories : dict, optional
+		Escalation rates or explicit series of the prices and grid intensities
+		over the lifetime (see tables.ParameterTables.get_trajectories). By
+		default, those of the purchase year hold for the whole lifetime.
+
+	Returns
+	-------
+	cube : ScenarioCube
+		Cumulative differences (EV minus ICEV) with dims "area", "year",
+		"income group", "discount rate", "vehicle type", "quantity".
+	"""
+
+	veh_names, i_ICEV, i_EV = get_pairs_indices(veh_names_pairs_dict)
+	params = get_grid_params(df_vehicles, df_areas, df_income_groups, veh_names, areas, years, income_groups, custom_discount_rates, trajectories)
+	shape = params["lifetime [yr]"].shape
+	params = e.flatten_params(params, shape)
+	N = len(params["lifetime [yr]"])
+
+	#run all vehicle/scenario combinations in one batch (split into chunks to bound memory), keep the cumulative results
+	totals = e.round_results(e.run_totals(params, chunk_size), e.total_columns).reshape(*shape, len(e.total_columns))
+
+	#derive differences
+	diff_cum = totals[...,i_EV,:] - totals[...,i_ICEV,:]
+
+	coords = {
+				"area": areas,
+				"year": years,
+				"income group": income_groups,
+				"discount rate": custom_discount_rates,
+				"vehicle type": list(veh_names_pairs_dict.keys()),
+				"quantity": e.total_columns,
+		}
+	return ScenarioCube(diff_cum, list(coords.keys()), coords)
+
+def get_pairs_indices(veh_names_pairs_dict):
+	""" Get the list of all vehicle names in veh_names_pairs_dict and the positions of the ICEVs and EVs of the pairs in it """
+	veh_names = list(dict.fromkeys([veh_name for pair in veh_names_pairs_dict.values() for veh_name in pair]))
+	i_ICEV = [veh_names.index(pair[0]) for pair in veh_names_pairs_dict.values()]
+	i_EV = [veh_names.index(pair[1]) for pair in veh_names_pairs_dict.values()]
+	return veh_names, i_ICEV, i_EV
+
+def get_grid_cash_flows(df_vehicles, df_areas, df_income_groups, areas, years, income_groups, veh_names):
+	"""
+	Get the nominal cash flows (see engine.get_cash_flows) for all
+	combinations of the given scenario dimensions and vehicles. The time
+	grid has the shape (areas, years, income groups, vehicles, periods), the
+	cash flows have an additional last axis for the cost types.
+	"""
+	params = get_grid_params(df_vehicles, df_areas, df_income_groups, veh_names, areas, years, income_groups, [None])
+	shape = params["lifetime [yr]"].shape[:3] + (len(veh_names),)
+	time, mileage, flows = e.get_cash_flows({name: values.ravel() for name,values in params.items()})
+	return time.reshape(*shape, -1), flows.reshape(*shape, *flows.shape[1:])
+
+def run_present_value_curves(df_vehicles, df_areas, df_income_groups, discount_rates, areas=areas, years=years, income_groups=income_groups, veh_names_pairs_dict=veh_names_pairs_dict):
+	"""
+	Get the present value cost differences (EV minus ICEV) for any vector of
+	discount rates. The nominal cash flows are calculated once per vehicle
+	and scenario and then re-priced for all discount rates at once (see
+	engine.get_present_values), e.g. for a full NPV-vs-rate curve.
+
+	Returns
+	-------
+	cube : ScenarioCube
+		Unrounded total present value cost differences with dims "area",
+		"year", "income group", "vehicle type", "discount rate", "quantity".
+	"""
+
+	veh_names, i_ICEV, i_EV = get_pairs_indices(veh_names_pairs_dict)
+	time, flows = get_grid_cash_flows(df_vehicles, df_areas, df_income_groups, areas, years, income_groups, veh_names)
+	shape = time.shape[:-1]
+	present_values = e.get_present_values(time.reshape(-1, time.shape[-1]), flows.reshape(-1, *flows.shape[-2:]), discount_rates)
+	present_values = present_values.reshape(*shape, *present_values.shape[1:])
+	diff = present_values[...,i_EV,:,:] - present_values[...,i_ICEV,:,:]
+
+	coords = {
+				"area": areas,
+				"year": years,
+				"income group": income_groups,
+				"vehicle type": list(veh_names_pairs_dict.keys()),
+				"discount rate": list(np.asarray(discount_rates, dtype=float)),
+				"quantity": ["total "+col for col in e.non_total_discounted_cost_columns],
+		}
+	return ScenarioCube(diff, list(coords.keys()), coords)
+
+def run_break_even_discount_rates(df_vehicles, df_areas, df_income_groups, areas=areas, years=years, income_groups=income_groups, veh_names_pairs_dict=veh_names_pairs_dict, rate_bounds=(0, 1)):
+	"""
+	Get the discount rate at which the EV and the ICEV of each pair have the
+	same total present value costs. Below it, the EV is the financially more
+	attractive alternative (if it has higher upfront and lower future costs).
+
+	Returns
+	-------
+	cube : ScenarioCube
+		Break-even discount rates with dims "area", "year", "income group",
+		"vehicle type" (NaN where there is none within rate_bounds).
+	"""
+
+	veh_names, i_ICEV, i_EV = get_pairs_indices(veh_names_pairs_dict)
+	time, flows = get_grid_cash_flows(df_vehicles, df_areas, df_income_groups, areas, years, income_groups, veh_names)
+	flows = np.nansum(flows, axis=-1) #all costs
+	diff = flows[...,i_EV,:] - flows[...,i_ICEV,:]
+	time = time[...,i_EV,:] #same for both vehicles of a pair
+	break_even_discount_rates = e.get_break_even_discount_rates(time.reshape(-1, time.shape[-1]), diff.reshape(-1, diff.shape[-1]), rate_bounds)
+
+	coords = {
+				"area": areas,
+				"year": years,
+				"income group": income_groups,
+				"vehicle type": list(veh_names_pairs_dict.keys()),
+		}
+	return ScenarioCube(break_even_discount_rates.reshape(diff.shape[:-1]), list(coords.keys()), coords)
+
+def get_grid_coords(areas, years, income_groups, custom_discount_rates, veh_names_pairs_dict):
+	return {
+				"area": areas,
+				"year": years,
+				"income group": income_groups,
+				"discount rate": custom_discount_rates,
+				"vehicle type": list(veh_names_pairs_dict.keys()),
+		}
+
+def run_break_even_points(df_vehicles, df_areas, df_income_groups, areas=areas, years=years, income_groups=income_groups, custom_discount_rates=[None], veh_names_pairs_dict=veh_names_pairs_dict, y_quant="total present value costs [$]"):
+	"""
+	Get the time and the mileage after which the cumulative costs of the EV
+	of each pair drop below the ones of the ICEV (payback period), by linear
+	interpolation between the periods of the cumulative cost differences.
+
+	Parameters
+	----------
+	areas, years, income_groups, custom_discount_rates, veh_names_pairs_dict
+		Scenario grid, see run_grid.
+	y_quant : str
+		"total present value costs [$]" or "total costs [$]" (nominal).
+
+	Returns
+	-------
+	cube : ScenarioCube
+		Dims "area", "year", "income group", "discount rate", "vehicle type",
+		"break-even" (with the labels "time [yr]" and "mileage [mi]"). 0 where
+		the EV is cheaper from the purchase on, NaN where it does not become
+		cheaper within the lifetime.
+	"""
+
+	veh_names, i_ICEV, i_EV = get_pairs_indices(veh_names_pairs_dict)
+	params = get_grid_params(df_vehicles, df_areas, df_income_groups, veh_names, areas, years, income_groups, custom_discount_rates)
+	time, mileage, flows = e.get_cash_flows({name: values[:,:,:,0].ravel() for name,values in params.items()}) #the cash flows do not depend on the discount rate
+	shape = params["lifetime [yr]"].shape[:3] + (1, len(veh_names), time.shape[-1])
+	time = time.reshape(shape)
+	costs = np.nansum(flows, axis=-1).reshape(shape) #missing inputs (e.g. prices) do not contribute
+	if y_quant == "total present value costs [$]":
+		costs = costs / (1 + params["discount rate"][...,None])**time
+	elif y_quant != "total costs [$]":
+		raise ValueError("unknown y_quant: {0:s}".format(y_quant))
+
+	#cumulative cost differences from the purchase on (the pre-purchase period has no costs)
+	diff_cum = e.cumsum(costs[...,i_EV,1:] - costs[...,i_ICEV,1:], axis=-1)
+	time = np.broadcast_to(time[...,i_EV,1:], diff_cum.shape) #same for both vehicles of a pair
+	break_even_times = e.get_break_even_points(time.reshape(-1, time.shape[-1]), diff_cum.reshape(-1, diff_cum.shape[-1])).reshape(diff_cum.shape[:-1])
+	break_even_mileages = break_even_times * params["annual mileage [mi]"][...,i_EV]
+
+	coords = get_grid_coords(areas, years, income_groups, custom_discount_rates, veh_names_pairs_dict)
+	coords["break-even"] = ["time [yr]", "mileage [mi]"]
+	return ScenarioCube(np.stack([break_even_times, break_even_mileages], axis=-1), list(coords.keys()), coords)
+
+#inputs on which the lifetime costs and emissions depend linearly (see run_break_even_values)
+linear_base_param_names = (
+				"purchase price [$]",
+				"incentive [$]",
+				"gas price [$/gal]",
+				"electricity price [ct/kWh]",
+				"DCFC electricity price [ct/kWh]",
+				"share of fast charging",
+				"energy use [kWh/mi]",
+				"real-world CO2 emissions [g/mi]",
+				"electricity emission intensity [g/kWh]",
+				"monthly insurance cost [$]",
+				"maintenance cost per mile [$/mi]",
+				"production emissions [t]",
+				"annual mileage [mi]",
+	)
+
+def run_break_even_values(df_vehicles, df_areas, df_income_groups, base_param_name, areas=areas, years=years, income_groups=income_groups, custom_discount_rates=[None], veh_names_pairs_dict=veh_names_pairs_dict, y_quant="total present value costs [$]"):
+	"""
+	Get the value of an input (e.g. "gas price [$/gal]", "electricity price
+	[ct/kWh]" or "annual mileage [mi]", one of linear_base_param_names), set
+	for both vehicles of each pair, at which the EV and the ICEV have the same
+	lifetime costs (y_quant). The costs are linear in these inputs, so two
+	runs of the engine determine the break-even value exactly. Other inputs
+	(e.g. the lifetime) raise a ValueError, for the discount rate use
+	run_break_even_discount_rates.
+
+	Returns
+	-------
+	cube : ScenarioCube
+		Break-even values with dims "area", "year", "income group", "discount
+		rate", "vehicle type" (NaN where the difference does not depend on the
+		input, or where the break-even value is negative).
+	"""
+
+	if base_param_name == "discount rate":
+		raise ValueError("the costs are not linear in the discount rate, use run_break_even_discount_rates")
+	if base_param_name not in linear_base_param_names:
+		raise ValueError("the costs are not linear in {0:s}, break-even values are only available for: {1:s}".format(repr(base_param_name), ", ".join(linear_base_param_names)))
+
+	veh_names, i_ICEV, i_EV = get_pairs_indices(veh_names_pairs_dict)
+	base_params = get_grid_base_params(df_vehicles, df_areas, df_income_groups, veh_names, areas, years, income_groups, custom_discount_rates)
+	shape = base_params["lifetime [yr]"].shape
+	i_quant = e.total_columns.index(y_quant)
+
+	def get_differences(values):
+		params = e.derive_params(dict(base_params, **{base_param_name: values}))
+		totals = e.run_totals({name: values.ravel() for name,values in params.items()})[:,i_quant].reshape(shape)
+		return totals[...,i_EV] - totals[...,i_ICEV]
+
+	#the difference is a + b*value, with the same value for both vehicles of a pair (e.g. the gas price only affects the ICEV)
+	a = get_differences(np.zeros(shape))
+	b = (get_differences(np.ones(shape)) - a)
+	with np.errstate(invalid="ignore", divide="ignore"):
+		break_even_values = -a / b
+	break_even_values = np.where((np.abs(b) > 1e-9*np.maximum(np.abs(a), 1)) & (break_even_values >= 0), break_even_values, np.nan)
+
+	coords = get_grid_coords(areas, years, income_groups, custom_discount_rates, veh_names_pairs_dict)
+	return ScenarioCube(break_even_values, list(coords.keys()), coords)
@@ -0,0 +1,239 @@
+"""
+Compiled parameter tables of the input data.
+
+All inputs of the engine that come from vehicle_types.xlsx, areas.xlsx and
+income_groups.xlsx are resolved once per version of the input data into
+contiguous float arrays, indexed by integer ids of the vehicles, areas,
+years and income groups. The parameters of any set of scenarios are then
+gathered from these arrays with a few broadcast index operations, instead of
+one DataFrame label lookup (with a column name built for the year) per
+parameter, vehicle and scenario. Example:
+
+	tables = get_tables(df_vehicles, df_areas, df_income_groups)
+	base_params = tables.get_base_params(["Sedan ICEV", "Sedan BEV"], ["U.S.", "WA"], [2022], ["$50-75k"], [None])
+"""
+
+import re
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+import cache as c
+
+from config.config import *
+
+
+max_entries = 8 #compiled tables kept in memory (one per version of the input data)
+emission_intensity_year = 2021 #year of the grid intensity data, which holds for all years
+
+compiled_tables = OrderedDict()
+compiled_tables_lock = threading.Lock()
+
+
+def get_years(df_areas):
+	""" Get the years for which all prices are available (the gas price of the year and the electricity prices of the year before) """
+	gas_price_years = [int(match.group(1)) for match in map(re.compile(r"gas_price (\d+) \[\$/gal\]").fullmatch, df_areas.columns) if match]
+	return [year for year in sorted(gas_price_years) if "electricity_price %d [ct/kWh]"%(year-1) in df_areas.columns]
+
+def get_column(df, col):
+	return df[col].to_numpy(dtype=float)
+
+def get_escalation_rates(escalation_rates, areas):
+	""" Get the escalation rate of each input (name -> array of shape (areas,)), given for all areas or per area (as a dict area -> rate, 0 for other areas) """
+	rates = dict()
+	for name,rate in escalation_rates.items():
+		if isinstance(rate, dict):
+			rates[name] = np.array([rate.get(area, 0) for area in areas], dtype=float)
+		else:
+			rates[name] = np.full(len(areas), rate, dtype=float)
+	return rates
+
+def get_series_values(df_series, areas, calendar_years):
+	""" Get the values of explicit series (index areas, columns calendar years) in the given calendar years (array of any shape), the last value before a year holds for it (NaN for other areas and earlier years) """
+	series_years = np.array(sorted(int(year) for year in df_series.columns))
+	series = df_series.rename(columns=int).reindex(index=areas, columns=series_years).to_numpy(dtype=float)
+	i_series_year = np.searchsorted(series_years, calendar_years, side="right")-1
+	values = series[:,np.maximum(i_series_year, 0)]
+	return np.where(i_series_year >= 0, values, np.nan)
+
+def get_vehicle_tables(df_vehicles):
+	""" Get the inputs that only depend on the vehicle, arrays of shape (vehicles,), from vehicle data with the columns of vehicle_types.xlsx (also of vehicles that are not in it, see catalog.py) """
+	powertrain_types = df_vehicles["powertrain_type"]
+	return {
+				"is EV": (powertrain_types == "EV").to_numpy(dtype=float),
+				"purchase price [$]": get_column(df_vehicles, "average transaction price [$]"),
+				"real-world mpg [mi/gal]": get_column(df_vehicles, "real-world mpg [mi/gal]"),
+				"energy use [kWh/mi]": get_column(df_vehicles, "energy use [kWh/mi]"),
+				"real-world CO2 emissions [g/mi]": get_column(df_vehicles, "real-world CO2 emissions [g/mi]"),
+				"monthly insurance cost [$]": powertrain_types.map(monthly_insurance_costs).to_numpy(dtype=float),
+				"maintenance cost per mile [$/mi]": powertrain_types.map(maintenance_costs_per_mile).to_numpy(dtype=float),
+				"production emissions [t]": get_column(df_vehicles, "production CO2 footprint [g]") * 1e-6,
+		}
+
+class ParameterTables:
+	"""
+	Inputs of the engine resolved into arrays.
+
+	Attributes
+	----------
+	veh_ids, area_ids, year_ids, income_group_ids : dict
+		Integer id (position in the arrays) of each vehicle name, area, year
+		and income group (the years are sorted).
+	vehicles : dict
+		Inputs that only depend on the vehicle, arrays of shape (vehicles,).
+	area_years : dict
+		Inputs that depend on the area and year, arrays of shape (areas,
+		years).
+	last_data_years : dict
+		Last year with actual data of each input in area_years (later years
+		repeat it).
+	income_groups : dict
+		Inputs that depend on the income group, arrays of shape (income
+		groups,).
+	"""
+
+	def __init__(self, df_vehicles, df_areas, df_income_groups):
+		years = get_years(df_areas)
+		self.veh_ids = {veh_name: i for i,veh_name in enumerate(df_vehicles.index)}
+		self.area_ids = {area: i for i,area in enumerate(df_areas.index)}
+		self.year_ids = {year: i for i,year in enumerate(years)}
+		self.income_group_ids = {income_group: i for i,income_group in enumerate(df_income_groups.index)}
+
+		self.vehicles = get_vehicle_tables(df_vehicles)
+
+		gas_prices = np.stack([get_column(df_areas, "gas_price %d [$/gal]"%year) for year in years], axis=1)
+		electricity_prices = np.stack([get_column(df_areas, "electricity_price %d [ct/kWh]"%(year-1)) for year in years], axis=1)
+		self.area_years = {
+					"gas price [$/gal]": gas_prices,
+					"electricity price [ct/kWh]": electricity_prices,
+					"DCFC electricity price [ct/kWh]": np.broadcast_to(electricity_prices[self.area_ids["DCFC"]], electricity_prices.shape).copy(),
+					"electricity emission intensity [g/kWh]": np.repeat(get_column(df_areas, "electricity_emission_intensity %d [g/kWh]"%emission_intensity_year)[:,None], len(years), axis=1),
+			}
+		#last year with actual data of each input, from which it is escalated (see get_trajectories); the electricity prices of a year are those of the year before
+		self.last_data_years = {
+					"gas price [$/gal]": years[-1],
+					"electricity price [ct/kWh]": years[-1],
+					"DCFC electricity price [ct/kWh]": years[-1],
+					"electricity emission intensity [g/kWh]": emission_intensity_year,
+			}
+
+		self.income_groups = {
+					"maximum incentive [$]": get_column(df_income_groups, "maximum benefit from federal $7,500 EV tax credit"), #federal EV tax credit, only for EVs
+					"annual mileage [mi]": get_column(df_income_groups, "average annual mileage per vehicle (U.S.) [mi]"),
+					"lifetime [yr]": np.round(get_column(df_income_groups, "average vehicle age [years]"), 2),
+					"discount rate": get_column(df_income_groups, "discount rate"),
+			}
+
+	def get_ids(self, ids, labels):
+		""" Get the integer ids of labels (KeyError for unknown ones) """
+		return np.array([ids[label] for label in labels], dtype=int)
+
+	def get_base_params(self, veh_names, areas, years, income_groups, custom_discount_rates=[None]):
+		"""
+		Get the underlying inputs (see engine.get_base_params) for all
+		combinations of the given scenario dimensions. Returns a dict of arrays
+		of shape (areas, years, income groups, discount rates, vehicles).
+		"""
+
+		i_veh = self.get_ids(self.veh_ids, veh_names)
+		return self.get_vehicles_base_params({name: table[i_veh] for name,table in self.vehicles.items()}, areas, years, income_groups, custom_discount_rates)
+
+	def get_vehicles_base_params(self, vehicles, areas, years, income_groups, custom_discount_rates=[None]):
+		"""
+		Get the underlying inputs for all combinations of the given scenario
+		dimensions and vehicles given by their inputs (see get_vehicle_tables),
+		e.g. vehicles that are not in the input data. Returns a dict of arrays
+		of shape (areas, years, income groups, discount rates, vehicles).
+		"""
+
+		n_vehicles = len(vehicles["is EV"])
+		shape = (len(areas), len(years), len(income_groups), len(custom_discount_rates), n_vehicles)
+		i_area = self.get_ids(self.area_ids, areas)[:,None,None,None,None]
+		i_year = self.get_ids(self.year_ids, years)[None,:,None,None,None]
+		i_income_group = self.get_ids(self.income_group_ids, income_groups)[None,None,:,None,None]
+
+		values = dict()
+		for name,table in vehicles.items():
+			values[name] = table[None,None,None,None,:]
+		for name,table in self.area_years.items():
+			values[name] = table[i_area,i_year]
+		for name in ["annual mileage [mi]", "lifetime [yr]"]:
+			values[name] = self.income_groups[name][i_income_group]
+		values["incentive [$]"] = np.where(values["is EV"] == 1, self.income_groups["maximum incentive [$]"][i_income_group], 0)
+		values["share of fast charging"] = p_DCFC
+		values["charging efficiency"] = eff_charging
+		is_default = np.array([custom_discount_rate is None for custom_discount_rate in custom_discount_rates])[None,None,None,:,None]
+		custom_discount_rates = np.array([np.nan if custom_discount_rate is None else custom_discount_rate for custom_discount_rate in custom_discount_rates], dtype=float)[None,None,None,:,None]
+		values["discount rate"] = np.where(is_default, self.income_groups["discount rate"][i_income_group], custom_discount_rates)
+		return {name: np.broadcast_to(value, shape).astype(float) for name,value in values.items()}
+
+	def get_trajectories(self, areas, years, n_years, trajectories):
+		"""
+		Get the values of the inputs that depend on the area and year (see
+		area_years) in each year of use of vehicles bought in the given years,
+		i.e. in the calendar years from the purchase year on.
+
+		Parameters
+		----------
+		areas, years : list
+			Areas and purchase years.
+		n_years : int
+			Number of years of use (e.g. the longest lifetime, rounded up).
+		trajectories : dict
+			How each input develops (inputs not in it keep the value of the
+			purchase year), either:
+			- an annual escalation rate for all areas or per area (as a dict
+			  area -> rate): the input data where available, escalated from
+			  the last year with data of the input on (see last_data_years,
+			  e.g. 2021 for the grid intensity),
+			- or explicit series as a pandas.DataFrame (index areas, columns
+			  calendar years): the last value before a year holds for it,
+			  areas and earlier years that are not in the series take the
+			  input data. The row "DCFC" holds for the DCFC electricity price
+			  of all areas.
+
+		Returns
+		-------
+		trajectories : dict
+			Arrays of shape (areas, years, 1, 1, 1, n_years), which broadcast
+			against the inputs of get_base_params with an additional last
+			axis for the years of use (see engine.derive_params).
+		"""
+
+		i_area = self.get_ids(self.area_ids, areas)
+		data_years = np.array(list(self.year_ids))
+		calendar_years = np.array(years)[:,None] + np.arange(n_years)[None,:] #(years, years of use)
+
+		values = dict()
+		for name,table in self.area_years.items():
+			last_data_year = self.last_data_years[name]
+			i_data_year = np.maximum(np.searchsorted(data_years, np.minimum(calendar_years, last_data_year), side="right")-1, 0) #last year with data
+			n_years_escalated = np.maximum(calendar_years - last_data_year, 0)
+			if name not in trajectories:
+				value = np.repeat(table[i_area[:,None], self.get_ids(self.year_ids, years)[None,:]][:,:,None], n_years, axis=2)
+			elif isinstance(trajectories[name], pd.DataFrame):
+				series_areas = ["DCFC"]*len(areas) if name == "DCFC electricity price [ct/kWh]" else areas
+				series = get_series_values(trajectories[name], series_areas, calendar_years)
+				value = np.where(np.isnan(series), table[i_area[:,None,None], i_data_year[None,:,:]], series)
+			else:
+				rates = get_escalation_rates({name: trajectories[name]}, areas)[name]
+				value = table[i_area[:,None,None], i_data_year[None,:,:]] * (1 + rates[:,None,None])**n_years_escalated[None,:,:]
+			values[name] = value[:,:,None,None,None,:]
+		return values
+
+def get_tables(df_vehicles, df_areas, df_income_groups, inputs_hash=None):
+	""" Get the compiled parameter tables of the input data, compiled once per version of the input data (inputs_hash, see cache.get_inputs_hash) """
+	if inputs_hash is None:
+		inputs_hash = c.get_inputs_hash(df_vehicles, df_areas, df_income_groups)
+	with compiled_tables_lock:
+		if inputs_hash in compiled_tables:
+			compiled_tables.move_to_end(inputs_hash)
+			return compiled_tables[inputs_hash]
+	tables = ParameterTables(df_vehicles, df_areas, df_income_groups)
+	with compiled_tables_lock:
+		compiled_tables[inputs_hash] = tables
+		while len(compiled_tables) > max_entries:
+			compiled_tables.popitem(last=False)
+	return tables
@@ -0,0 +1,38 @@
+import re
+
+import numpy as np
+import pytest
+
+import inputs
+import catalog
+import engine as e
+import tables as t
+
+from config.config import *
+
+
+scenario = (["U.S."], [2022], ["$50-75k"], [None])
+
+@pytest.fixture(scope="module")
+def dfs():
+	return inputs.get_inputs()
+
+veh_names = [veh_name for veh_names_pair in veh_names_pairs_dict.values() for veh_name in veh_names_pair] #vehicles with all inputs
+
+@pytest.fixture
+def df_catalog(dfs):
+	return dfs[0].loc[veh_names, list(catalog_columns.values())].reset_index(drop=True)
+
+def test_score_chunk_matches_input_vehicles(dfs, df_catalog):
+	tables = t.get_tables(*dfs)
+	df_results = catalog.score_chunk(tables, df_catalog, *scenario, quantities=["total costs [$]"])
+	base_params = tables.get_base_params(veh_names, *scenario)
+	expected = e.round_results(e.run_totals({name: values.ravel() for name,values in e.derive_params(base_params).items()}), e.total_columns)
+	assert np.array_equal(df_results["total costs [$]"].to_numpy(dtype=float), expected[:,e.total_columns.index("total costs [$]")], equal_nan=True)
+
+@pytest.mark.parametrize("powertrain_type,col", [("ICEV", "real-world mpg [mi/gal]"), ("ICEV", "real-world CO2 emissions [g/mi]"), ("EV", "energy use [kWh/mi]"), ("EV", "production CO2 footprint [g]")])
+def test_missing_inputs_are_rejected(df_catalog, powertrain_type, col):
+	i_rows = df_catalog.index[df_catalog["powertrain_type"] == powertrain_type][[0,2]]
+	df_catalog.loc[i_rows, col] = np.nan
+	with pytest.raises(ValueError, match=re.escape("{0:s} (rows {1:d}, {2:d})".format(col, *i_rows))):
+		catalog.get_catalog_vehicles(df_catalog)
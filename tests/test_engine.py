@@ -0,0 +1,41 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import inputs
+import engine as e
+import tables as t
+
+
+results_dir = os.path.join(os.path.dirname(__file__), "data", "results") #results of the original DataFrame-based LCA.run
+
+#scenarios of one batch each, the income groups have different lifetimes, so the shorter ones are padded
+batches = [
+			("Car SUV BEV", "CA", 2021, ["$100-200k", "less than $25k"]),
+			("Pickup ICEV", "WA", 2022, ["$50-75k", "$25-50k"]),
+	]
+
+@pytest.fixture(scope="module")
+def dfs():
+	return inputs.get_inputs()
+
+def read_results(veh_name, area, year, income_group):
+	return pd.read_csv(os.path.join(results_dir, "veh_name={0:s}_area={1:s}_year={2:d}_income_group={3:s}.csv".format(veh_name, area, year, income_group)), index_col="period [yr]")
+
+@pytest.mark.parametrize("veh_name,area,year,income_groups", batches)
+def test_run_matches_original_results(dfs, veh_name, area, year, income_groups):
+	base_params = t.get_tables(*dfs).get_base_params([veh_name], [area], [year], income_groups)
+	shape = base_params["lifetime [yr]"].shape
+	params = e.flatten_params(e.derive_params(base_params), shape)
+	lifetimes = params["lifetime [yr]"]
+	assert len(set(lifetimes)) == len(income_groups)
+
+	results = e.run(params)
+	for i,income_group in enumerate(income_groups):
+		df_results = e.to_dataframe(results[i], lifetimes[i], base_params["is EV"].ravel()[i] == 1)
+		df_expected = read_results(veh_name, area, year, income_group)
+		assert list(map(str, df_results.index)) == list(df_expected.index)
+		assert list(df_results.columns) == list(df_expected.columns)
+		assert np.allclose(df_results.to_numpy(dtype=float, na_value=np.nan), df_expected.to_numpy(dtype=float), rtol=0, atol=1e-9, equal_nan=True)
@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+
+import inputs
+import sweep
+import engine as e
+
+from config.config import *
+
+
+scenario = (["WA"], [2022], ["$50-75k"])
+
+@pytest.fixture(scope="module")
+def dfs():
+	return inputs.get_inputs()
+
+def get_difference(dfs, veh_type, base_param_name, value, y_quant="total present value costs [$]"):
+	""" Get the difference (EV minus ICEV) of y_quant with base_param_name set to value for both vehicles """
+	base_params = sweep.get_grid_base_params(*dfs, list(veh_names_pairs_dict[veh_type]), *scenario, [None])
+	base_params[base_param_name] = np.full(base_params[base_param_name].shape, value)
+	totals = e.run_totals({name: values.ravel() for name,values in e.derive_params(base_params).items()})[:,e.total_columns.index(y_quant)]
+	return totals[1] - totals[0]
+
+def test_break_even_gas_price_matches_bisection(dfs):
+	veh_type = list(veh_names_pairs_dict.keys())[0]
+	cube = sweep.run_break_even_values(*dfs, "gas price [$/gal]", *scenario)
+	break_even_value = cube.sel(area="WA", year=2022, income_group="$50-75k", discount_rate=None, vehicle_type=veh_type)
+
+	low, high = 0, 100
+	assert np.sign(get_difference(dfs, veh_type, "gas price [$/gal]", low)) != np.sign(get_difference(dfs, veh_type, "gas price [$/gal]", high))
+	for _ in range(60):
+		mid = (low+high)/2
+		if np.sign(get_difference(dfs, veh_type, "gas price [$/gal]", mid)) == np.sign(get_difference(dfs, veh_type, "gas price [$/gal]", low)):
+			low = mid
+		else:
+			high = mid
+	assert break_even_value == pytest.approx((low+high)/2, rel=1e-6)
+
+@pytest.mark.parametrize("base_param_name", ["lifetime [yr]", "discount rate", "real-world mpg [mi/gal]"])
+def test_break_even_values_reject_nonlinear_inputs(dfs, base_param_name):
+	with pytest.raises(ValueError):
+		sweep.run_break_even_values(*dfs, base_param_name, *scenario)
@@ -0,0 +1,53 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import inputs
+import tables as t
+
+
+areas = ["U.S.", "WA"]
+gas_price = "gas price [$/gal]"
+electricity_price = "electricity price [ct/kWh]"
+DCFC_electricity_price = "DCFC electricity price [ct/kWh]"
+intensity = "electricity emission intensity [g/kWh]"
+
+@pytest.fixture(scope="module")
+def tables():
+	return t.get_tables(*inputs.get_inputs())
+
+def get_data(tables, name, area, year):
+	""" Get the value of an input in the input data """
+	return tables.area_years[name][tables.area_ids[area], tables.year_ids[year]]
+
+def test_last_data_years(tables):
+	assert max(tables.year_ids) == 2022
+	assert tables.last_data_years == {gas_price: 2022, electricity_price: 2022, DCFC_electricity_price: 2022, intensity: 2021}
+
+def test_escalation_rates_after_last_data_year(tables):
+	rates = {gas_price: 0.1, electricity_price: 0.05, DCFC_electricity_price: 0, intensity: -0.1}
+	trajectories = tables.get_trajectories(areas, [2024], 3, rates)
+	for i,area in enumerate(areas):
+		values = {name: values[i,0,0,0,0] for name,values in trajectories.items()}
+		assert np.allclose(values[gas_price], get_data(tables, gas_price, area, 2022) * 1.1**np.array([2, 3, 4]))
+		assert np.allclose(values[electricity_price], get_data(tables, electricity_price, area, 2022) * 1.05**np.array([2, 3, 4]))
+		assert np.allclose(values[DCFC_electricity_price], get_data(tables, DCFC_electricity_price, area, 2022))
+		assert np.allclose(values[intensity], get_data(tables, intensity, area, 2022) * 0.9**np.array([3, 4, 5])) #escalated from 2021
+
+def test_escalation_rates_per_area(tables):
+	rates = {gas_price: {"WA": 0.1}, electricity_price: 0, DCFC_electricity_price: 0, intensity: {"U.S.": -0.1}}
+	trajectories = tables.get_trajectories(areas, [2024], 3, rates)
+	assert np.allclose(trajectories[gas_price][:,0,0,0,0], [get_data(tables, gas_price, "U.S.", 2022) * np.ones(3), get_data(tables, gas_price, "WA", 2022) * 1.1**np.array([2, 3, 4])])
+	assert np.allclose(trajectories[intensity][:,0,0,0,0], [get_data(tables, intensity, "U.S.", 2022) * 0.9**np.array([3, 4, 5]), get_data(tables, intensity, "WA", 2022) * np.ones(3)])
+
+def test_series(tables):
+	trajectories = tables.get_trajectories(areas, [2021], 5, {
+				DCFC_electricity_price: pd.DataFrame([[50, 60]], index=["DCFC"], columns=[2023, 2025]),
+				gas_price: pd.DataFrame([[5]], index=["WA"], columns=[2022]),
+		})
+	for i,area in enumerate(areas):
+		#the DCFC row holds for all areas, the input data before the first year of the series
+		assert np.allclose(trajectories[DCFC_electricity_price][i,0,0,0,0], [get_data(tables, DCFC_electricity_price, area, 2021), get_data(tables, DCFC_electricity_price, area, 2022), 50, 50, 60])
+	assert np.allclose(trajectories[gas_price][0,0,0,0,0], [get_data(tables, gas_price, "U.S.", 2021), *[get_data(tables, gas_price, "U.S.", 2022)]*4]) #area not in the series
+	assert np.allclose(trajectories[gas_price][1,0,0,0,0], [get_data(tables, gas_price, "WA", 2021), 5, 5, 5, 5])
+	assert np.allclose(trajectories[intensity][:,0,0,0,0], [[get_data(tables, intensity, area, 2021)]*5 for area in areas]) #input not in the trajectories
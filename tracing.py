@@ -0,0 +1,270 @@
+"""
+Tracing spans, counters and profiling of the hot paths (loading the inputs,
+LCA runs and reads of the result store, line and waterfall plots).
+
+Functions are traced with the traced decorator, which only checks a flag
+while tracing is disabled (tracing_enabled in config/config.py, or enable),
+and code blocks with span. Finished spans are records in the format of
+OpenTelemetry spans (trace and span ids, parent span, start and end time in
+nanoseconds since the epoch, attributes). They are kept in an in-process
+collector (collector), passed to the exporters (e.g. one that forwards them
+to an OpenTelemetry SDK, see add_exporter) and appended to the metrics file
+(tracing_metrics_fn, one JSON record per line). Counters (e.g. result cache
+hits and misses, bytes read and written) are added with count and written
+to the metrics file by flush (also when the interpreter exits).
+
+A single page run can be profiled regardless of these settings, with
+cProfile or pyinstrument (if installed), by adding the query parameter
+profiling_query_param to the URL of a page, e.g. ?profile=cprofile or
+?profile=pyinstrument (see Profile).
+"""
+
+import os
+import io
+import json
+import time
+import atexit
+import pstats
+import marshal
+import functools
+import threading
+from contextlib import contextmanager
+from collections import Counter, deque
+
+from config.config import *
+
+
+enabled = tracing_enabled
+metrics_fn = tracing_metrics_fn
+n_capturing = 0 #number of threads that capture their spans and counters (see Profile), traced while > 0 even if tracing is disabled
+profiles = dict() #thread id -> running Profile
+
+collector = deque(maxlen=tracing_max_spans) #finished spans of all threads (while tracing is enabled)
+exporters = [] #functions called with each finished span (while tracing is enabled)
+counters = Counter() #counters of all threads (while tracing is enabled)
+lock = threading.Lock()
+thread_data = threading.local() #open spans (stack) and capture of each thread
+
+
+def is_active():
+	""" Whether spans and counters are recorded (in this or any thread), to skip preparing expensive attributes or counter values otherwise """
+	return enabled or n_capturing > 0
+
+def enable(new_metrics_fn=tracing_metrics_fn):
+	""" Enable tracing in this process, spans and counters are written to new_metrics_fn (None for the in-process collector and exporters only) """
+	global enabled, metrics_fn
+	metrics_fn = new_metrics_fn
+	enabled = True
+
+def disable():
+	global enabled
+	flush()
+	enabled = False
+
+def add_exporter(exporter):
+	""" Add a function that is called with each finished span (a dict, see span) """
+	with lock:
+		exporters.append(exporter)
+
+def get_capture():
+	return getattr(thread_data, "capture", None)
+
+def write_metrics(record):
+	if metrics_fn is None:
+		return
+	os.makedirs(os.path.dirname(metrics_fn) or ".", exist_ok=True)
+	with lock, open(metrics_fn, "a") as f:
+		f.write(json.dumps(record, default=str)+"\n")
+
+def finish(record):
+	capture = get_capture()
+	if capture is not None:
+		capture["spans"].append(record)
+	if enabled:
+		with lock:
+			collector.append(record)
+			exporters_to_call = list(exporters)
+		for exporter in exporters_to_call:
+			exporter(record)
+		write_metrics(record)
+
+@contextmanager
+def span(name, **attributes):
+	"""
+	Trace a code block.
+
+	The finished span is a dict with the keys "name", "trace_id", "span_id",
+	"parent_span_id" (None for root spans), "start_time_unix_nano",
+	"end_time_unix_nano", "duration [s]", "thread", "status" ("OK", or
+	"ERROR" if the block raised an exception) and "attributes".
+	"""
+	if not (enabled or n_capturing > 0):
+		yield
+		return
+	stack = getattr(thread_data, "stack", None)
+	if stack is None:
+		stack = thread_data.stack = []
+	parent = stack[-1] if len(stack) > 0 else None
+	record = {
+				"name": name,
+				"trace_id": os.urandom(16).hex() if parent is None else parent["trace_id"],
+				"span_id": os.urandom(8).hex(),
+				"parent_span_id": None if parent is None else parent["span_id"],
+				"start_time_unix_nano": time.time_ns(),
+				"thread": threading.current_thread().name,
+				"status": "OK",
+				"attributes": attributes,
+		}
+	stack.append(record)
+	t = time.perf_counter()
+	try:
+		yield
+	except BaseException:
+		record["status"] = "ERROR"
+		raise
+	finally:
+		record["duration [s]"] = time.perf_counter()-t
+		record["end_time_unix_nano"] = record["start_time_unix_nano"] + int(record["duration [s]"]*1e9)
+		stack.pop()
+		finish(record)
+
+def traced(name=None):
+	""" Decorator that traces every call of a function in a span (named after the function by default) """
+	def decorator(function):
+		span_name = name or function.__qualname__
+		@functools.wraps(function)
+		def wrapper(*args, **kwargs):
+			if not (enabled or n_capturing > 0):
+				return function(*args, **kwargs)
+			with span(span_name):
+				return function(*args, **kwargs)
+		return wrapper
+	return decorator
+
+def count(name, value=1):
+	""" Add value to a counter """
+	if not (enabled or n_capturing > 0):
+		return
+	capture = get_capture()
+	if capture is not None:
+		capture["counters"][name] += value
+	if enabled:
+		with lock:
+			counters[name] += value
+
+def get_file_size(fn):
+	try:
+		return os.path.getsize(fn)
+	except OSError:
+		return 0
+
+def flush():
+	""" Write the counters to the metrics file """
+	if not enabled:
+		return
+	with lock:
+		counters_to_write = dict(counters)
+	write_metrics({"counters": counters_to_write, "time_unix_nano": time.time_ns(), "pid": os.getpid()})
+
+atexit.register(flush)
+
+
+class Profile:
+	"""
+	Profile of one request (e.g. a page run) in the current thread, with
+	cProfile or pyinstrument, including the spans and counters of the thread.
+
+	Parameters
+	----------
+	mode : str
+		"cprofile", or "pyinstrument" (cProfile is used if pyinstrument is not
+		installed).
+	"""
+
+	def __init__(self, mode="cprofile"):
+		global n_capturing
+		self.mode = mode
+		if self.mode == "pyinstrument":
+			try:
+				import pyinstrument
+				self.profiler = pyinstrument.Profiler()
+			except ImportError:
+				self.mode = "cprofile"
+		if self.mode != "pyinstrument":
+			import cProfile
+			self.profiler = cProfile.Profile()
+		self.capture = thread_data.capture = {"spans": [], "counters": Counter()}
+		with lock:
+			#a profile that was never stopped (e.g. the page run raised an exception) is dropped, so that it does not keep tracing active
+			thread_ids = set(thread.ident for thread in threading.enumerate())
+			for thread_id in [thread_id for thread_id in profiles if thread_id not in thread_ids or thread_id == threading.get_ident()]:
+				del profiles[thread_id]
+			profiles[threading.get_ident()] = self
+			n_capturing = len(profiles)
+		self.t = time.perf_counter()
+		if self.mode == "pyinstrument":
+			self.profiler.start()
+		else:
+			self.profiler.enable()
+
+	def stop(self):
+		""" Stop profiling, returns the duration (in seconds) """
+		global n_capturing
+		if self.mode == "pyinstrument":
+			self.profiler.stop()
+		else:
+			self.profiler.disable()
+		self.duration = time.perf_counter()-self.t
+		thread_data.capture = None
+		with lock:
+			if profiles.get(threading.get_ident()) is self:
+				del profiles[threading.get_ident()]
+			n_capturing = len(profiles)
+		return self.duration
+
+	def get_spans(self):
+		return list(self.capture["spans"])
+
+	def get_counters(self):
+		return dict(self.capture["counters"])
+
+	def get_report(self, n_functions=40):
+		""" Get the profile as text (the functions with the highest cumulative time for cProfile) """
+		if self.mode == "pyinstrument":
+			return self.profiler.output_text()
+		f = io.StringIO()
+		pstats.Stats(self.profiler, stream=f).sort_stats("cumulative").print_stats(n_functions)
+		return f.getvalue()
+
+	def get_data(self):
+		""" Get the profile as a file: (data, file name, MIME type) """
+		if self.mode == "pyinstrument":
+			return self.profiler.output_html(), "profile.html", "text/html"
+		self.profiler.create_stats()
+		return marshal.dumps(self.profiler.stats), "profile.prof", "application/octet-stream" #readable with pstats or e.g. snakeviz
+
+def start_profile(query_params):
+	""" Start profiling a page run if its URL has the query parameter profiling_query_param, returns the Profile or None """
+	mode = query_params.get(profiling_query_param)
+	if mode is None:
+		return None
+	return Profile("pyinstrument" if mode == "pyinstrument" else "cprofile")
+
+def show_profile(profile):
+	""" Stop profiling a page run (see start_profile) and show the profile at the end of the page """
+	if profile is None:
+		return
+	import pandas as pd
+	import streamlit as st
+
+	profile.stop()
+	with st.expander("Profile of this page run ({0:s}, {1:.3f} s)".format(profile.mode, profile.duration)):
+		spans = profile.get_spans()
+		if len(spans) > 0:
+			st.dataframe(pd.DataFrame([{"span": record["name"], "duration [s]": record["duration [s]"], "status": record["status"]} for record in spans]))
+		counters_of_run = profile.get_counters()
+		if len(counters_of_run) > 0:
+			st.dataframe(pd.Series(counters_of_run, name="count"))
+		st.code(profile.get_report())
+		data, fn, mime = profile.get_data()
+		st.download_button("Download profile", data, file_name=fn, mime=mime)
@@ -0,0 +1,128 @@
+"""
+Monte Carlo uncertainty analysis of the costs and emissions of one scenario.
+
+Uncertain inputs (prices, charging, insurance and maintenance costs, annual
+mileage and lifetime, see uncertainty_distributions in config.config) are
+scaled with random factors, and all samples of all vehicles are evaluated in
+batches of the vectorized engine, without creating an LCA instance per
+sample. Each sample is one possible "state of the world", so the vehicles of
+a pair are compared under the same prices and driving patterns. Example:
+
+	totals, diff_cum = uncertainty.run_monte_carlo(df_vehicles, df_areas, df_income_groups, "U.S.", 2022, "$50-75k", seed=0)
+	diff_cum.sel(vehicle_type="Sedan", quantity="total present value costs [$]").values #percentiles of EV minus ICEV
+"""
+
+import numpy as np
+
+import engine as e
+from sweep import ScenarioCube, get_pairs_indices
+
+from config.config import *
+
+
+def sample_factor(rng, distribution, size):
+	""" Draw factors from one of the distributions of uncertainty_distributions """
+	kind, *args = distribution
+	if kind == "normal":
+		return rng.normal(1, args[0], size)
+	elif kind == "lognormal":
+		return rng.lognormal(0, args[0], size)
+	elif kind == "uniform":
+		return rng.uniform(args[0], args[1], size)
+	elif kind == "triangular":
+		return rng.triangular(args[0], 1, args[1], size)
+	raise ValueError("unknown distribution: {0:s}".format(kind))
+
+def sample_factors(n_samples, is_EV, distributions=uncertainty_distributions, by_powertrain=uncertainty_by_powertrain, seed=None):
+	"""
+	Draw the factors that scale the uncertain inputs.
+
+	Parameters
+	----------
+	n_samples : int
+		Number of samples.
+	is_EV : numpy.ndarray of shape (V,)
+		Powertrain type of each vehicle.
+	distributions : dict
+		Distribution of the factor of each uncertain input (see
+		engine.base_param_names for the names).
+	by_powertrain : list
+		Inputs whose factors are drawn independently for ICEVs and EVs.
+	seed : int, optional
+		Seed of the random number generator, for reproducible results.
+
+	Returns
+	-------
+	factors : dict
+		One array of shape (n_samples, V) for each uncertain input.
+	"""
+
+	rng = np.random.default_rng(seed)
+	is_EV = np.asarray(is_EV, dtype=bool)
+	factors = dict()
+	for name,distribution in distributions.items():
+		if name in by_powertrain:
+			factor = sample_factor(rng, distribution, (n_samples, 2))
+			factors[name] = np.where(is_EV, factor[:,1:], factor[:,:1])
+		else:
+			factors[name] = np.broadcast_to(sample_factor(rng, distribution, (n_samples, 1)), (n_samples, len(is_EV)))
+	return factors
+
+def get_sample_params(base_params, factors):
+	""" Get the engine parameters of all samples (arrays of shape (n_samples*V,)) from the base inputs of the vehicles and the sampled factors """
+	n_samples = len(next(iter(factors.values())))
+	sample_base_params = dict()
+	for name,values in base_params.items():
+		values = np.broadcast_to(values, (n_samples, len(values)))
+		if name in factors:
+			values = np.maximum(values * factors[name], 0)
+		sample_base_params[name] = values
+	sample_base_params["share of fast charging"] = np.minimum(sample_base_params["share of fast charging"], 1)
+	sample_base_params["charging efficiency"] = np.minimum(sample_base_params["charging efficiency"], 1)
+	return {name: values.ravel() for name,values in e.derive_params(sample_base_params).items()}
+
+def run_monte_carlo(df_vehicles, df_areas, df_income_groups, area, year, income_group, custom_discount_rate=None, veh_names_pairs_dict=veh_names_pairs_dict, n_samples=uncertainty_n_samples, percentiles=uncertainty_percentiles, distributions=uncertainty_distributions, seed=None, chunk_size=1024):
+	"""
+	Run a Monte Carlo analysis of the lifetime costs and emissions of the
+	vehicle pairs in one scenario.
+
+	Parameters
+	----------
+	df_vehicles, df_areas, df_income_groups : pandas.DataFrame
+		Input data (see Start.get_data).
+	area, year, income_group, custom_discount_rate
+		Scenario, as for LCA.
+	veh_names_pairs_dict : dict
+		Vehicle pairs (ICEV, EV) to compare, one for each vehicle type.
+	n_samples : int
+		Number of samples.
+	percentiles : list
+		Percentiles (0-100) to report.
+	distributions : dict
+		Distributions of the uncertain inputs, see uncertainty_distributions
+		in config.config.
+	seed : int, optional
+		Seed of the random number generator, for reproducible results.
+	chunk_size : int
+		Maximum number of vehicle/sample combinations evaluated at once.
+
+	Returns
+	-------
+	totals : ScenarioCube
+		Percentiles of the total (lifetime) results of each vehicle, with
+		dims "percentile", "vehicle", "quantity".
+	diff_cum : ScenarioCube
+		Percentiles of the differences (EV minus ICEV) of each vehicle pair,
+		with dims "percentile", "vehicle type", "quantity".
+	"""
+
+	veh_names, i_ICEV, i_EV = get_pairs_indices(veh_names_pairs_dict)
+	base_params = e.get_base_params(df_vehicles, df_areas, df_income_groups, veh_names, area, year, income_group, custom_discount_rate)
+	factors = sample_factors(n_samples, base_params["is EV"], distributions, seed=seed)
+	params = get_sample_params(base_params, factors)
+	totals = e.run_totals(params, chunk_size).reshape(n_samples, len(veh_names), len(e.total_columns))
+	diff_cum = totals[:,i_EV,:] - totals[:,i_ICEV,:]
+
+	coords = {"percentile": list(percentiles), "vehicle": veh_names, "vehicle type": list(veh_names_pairs_dict.keys()), "quantity": e.total_columns}
+	return (ScenarioCube(np.nanpercentile(totals, percentiles, axis=0), ["percentile", "vehicle", "quantity"], coords),
+			ScenarioCube(np.nanpercentile(diff_cum, percentiles, axis=0), ["percentile", "vehicle type", "quantity"], coords))